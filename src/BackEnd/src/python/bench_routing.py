@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos modos de roteamento do ors_client contra o ORS local:
+- matrix   (legado): Matrix N×N por batch, aproveitando só a diagonal
+- grouped  : Matrix 1→N / N→1 para pontos repetidos, 1×1 para o resto
+- pairwise : Matrix 1×1 por corrida, concorrentes
+
+Mede corridas/s e o total de rotas que o ORS precisou calcular em cada modo.
+As corridas são sorteadas de um conjunto de pontos (simula prédios/aeroportos
+repetidos) ou lidas de um CSV com colunas lat_o;lng_o;lat_d;lng_d.
+
+Uso: python bench_routing.py --rides 1000 --in-flight 8 [--csv corridas.csv]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from ors_client import AsyncORSRouter, ROUTING_MODES, wait_until_ready
+
+PORTA_ORS    = 8082
+ORS_BASE_URL = os.getenv('ORS_BASE_URL', f'http://localhost:{PORTA_ORS}/ors')
+
+# Área de sorteio dos pontos sintéticos (cidade de São Paulo)
+SP_LNG, SP_LAT = (-46.80, -46.40), (-23.75, -23.45)
+
+
+def synthetic_rides(n_rides, n_points, seed):
+    rng = np.random.default_rng(seed)
+    points = np.column_stack([rng.uniform(*SP_LNG, n_points), rng.uniform(*SP_LAT, n_points)])
+    o = points[rng.integers(0, n_points, n_rides)]
+    d = points[rng.integers(0, n_points, n_rides)]
+    return pd.DataFrame({'lng_o': o[:, 0], 'lat_o': o[:, 1], 'lng_d': d[:, 0], 'lat_d': d[:, 1]})
+
+
+def make_batches(rides, batch_size):
+    rides = rides.sort_values(['lat_o', 'lng_o', 'lat_d', 'lng_d']).reset_index(drop=True)
+    coords = list(zip(rides.lng_o, rides.lat_o, rides.lng_d, rides.lat_d))
+    for start in range(0, len(coords), batch_size):
+        batch = coords[start:start + batch_size]
+        yield (list(range(start, start + len(batch))),
+               [(lng_o, lat_o) for lng_o, lat_o, _, _ in batch],
+               [(lng_d, lat_d) for _, _, lng_d, lat_d in batch])
+
+
+def run_mode(mode, rides, batch_size, in_flight):
+    results = []
+    router = AsyncORSRouter(ORS_BASE_URL, max_in_flight=in_flight, routing_mode=mode)
+    started = time.perf_counter()
+    with router:
+        asyncio.run(router.run_batches(make_batches(rides, batch_size), results.extend))
+    elapsed = time.perf_counter() - started
+    ok = sum(error is None for *_, error in results)
+    return {
+        'modo': mode,
+        'segundos': round(elapsed, 2),
+        'corridas/s': round(len(results) / elapsed, 1),
+        'rotas_calculadas': router.stats['routes_computed'],
+        'requisicoes': router.stats['requests'],
+        'ok': ok,
+        'erros': len(results) - ok,
+        'distancias': {ride_id: dist for ride_id, dist, _, _ in results},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rides', type=int, default=1000, help='corridas sintéticas (ignorado com --csv)')
+    parser.add_argument('--points', type=int, default=300, help='pontos distintos das corridas sintéticas')
+    parser.add_argument('--csv', help='CSV (;) com lat_o, lng_o, lat_d, lng_d')
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--in-flight', type=int, default=8)
+    parser.add_argument('--modes', default=','.join(ROUTING_MODES))
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='[%(asctime)s] %(levelname)s: %(message)s', level=logging.WARNING, datefmt='%H:%M:%S')
+    wait_until_ready(ORS_BASE_URL)
+    if args.csv:
+        rides = pd.read_csv(args.csv, sep=';', usecols=['lat_o', 'lng_o', 'lat_d', 'lng_d'])
+    else:
+        rides = synthetic_rides(args.rides, args.points, args.seed)
+
+    reports = [run_mode(mode, rides, args.batch, args.in_flight) for mode in args.modes.split(',')]
+    baseline = reports[0]['distancias']
+    for report in reports:
+        distances = report.pop('distancias')
+        # Todos os modos devem devolver as mesmas distâncias (mesmas rotas no ORS)
+        same = all(np.isclose(distances.get(k, np.nan), v, equal_nan=True) for k, v in baseline.items())
+        report['mesmas_distancias'] = same
+    print(pd.DataFrame(reports).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
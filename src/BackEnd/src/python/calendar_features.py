@@ -0,0 +1,110 @@
+# src/python/calendar_features.py
+# Features de calendário (data/hora) da API, calculadas uma vez por "balde" de tempo.
+#
+# Ano, mês, codificações seno/cosseno de hora e dia da semana, horário de pico e feriado
+# não mudam dentro de um minuto (e o feriado não muda dentro de um dia). Em vez de
+# recalcular tudo para cada modelo de cada requisição, o CalendarFeatureProvider guarda o
+# resultado do balde atual e o compartilha entre modelos e requisições concorrentes.
+import datetime
+import threading
+from types import MappingProxyType
+
+from featurizer import time_features_row
+
+# Tamanho padrão do balde: 60s, pois hour_sin/hour_cos usam a resolução de minutos
+DEFAULT_BUCKET_SECONDS = 60
+
+
+def compute_calendar_features(now, holiday_lookup):
+    """Calcula as features de calendário para o instante `now` (sem cache).
+
+    holiday_lookup(date) -> 0/1 indica se a data é feriado.
+    """
+    # Mesma implementação das features de treino (featurizer.py), na versão de uma linha
+    row = time_features_row(now)
+    return {
+        'year': row['year'],
+        'month': row['month'],
+        'is_holiday': holiday_lookup(now.date()),
+        'hour_sin': row['hour_sin'],
+        'hour_cos': row['hour_cos'],
+        'weekday_sin': row['weekday_sin'],
+        'weekday_cos': row['weekday_cos'],
+        'is_peak_hour': row['is_peak_hour']
+    }
+
+
+class CalendarFeatureProvider:
+    """Cache das features de calendário com expiração explícita por balde de tempo.
+
+    - clock: função sem argumentos que devolve o datetime atual (injetável nos testes).
+    - bucket_seconds: duração do balde; as features são recalculadas no início de cada balde.
+    - O feriado é consultado no máximo uma vez por dia.
+    """
+
+    def __init__(self, holiday_lookup, clock=datetime.datetime.now, bucket_seconds=DEFAULT_BUCKET_SECONDS):
+        if bucket_seconds <= 0:
+            raise ValueError("bucket_seconds deve ser positivo.")
+        self._holiday_lookup = holiday_lookup
+        self._clock = clock
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        # (features, início do balde, fim do balde): trocado como uma única tupla para
+        # que leitores sem lock nunca vejam features de um balde com limites de outro
+        self._state = None
+        self._holiday_date = None
+        self._holiday_value = 0
+
+    @property
+    def expires_at(self):
+        state = self._state
+        return state[2] if state is not None else None
+
+    def _bucket_bounds(self, now):
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        elapsed = (now - midnight).total_seconds()
+        start = midnight + datetime.timedelta(seconds=(elapsed // self.bucket_seconds) * self.bucket_seconds)
+        end = min(start + datetime.timedelta(seconds=self.bucket_seconds), midnight + datetime.timedelta(days=1))
+        return start, end
+
+    def _cached_holiday(self, date):
+        if date != self._holiday_date:
+            self._holiday_value = self._holiday_lookup(date)
+            self._holiday_date = date
+        return self._holiday_value
+
+    def _current_state(self):
+        now = self._clock()
+        state = self._state
+        if state is not None and state[1] <= now < state[2]:
+            return state
+
+        with self._lock:
+            # Outra thread pode ter renovado o balde enquanto esperávamos o lock
+            state = self._state
+            if state is not None and state[1] <= now < state[2]:
+                return state
+            start, end = self._bucket_bounds(now)
+            computed = compute_calendar_features(start, self._cached_holiday)
+            state = (MappingProxyType(computed), start, end)
+            self._state = state
+            return state
+
+    def get(self):
+        """Devolve as features do balde atual (mapeamento somente leitura)."""
+        return self._current_state()[0]
+
+    def bucket_key(self):
+        """Identificador do balde atual (útil como parte de chaves de cache)."""
+        return self._current_state()[1]
+
+    def get_with_bucket(self):
+        """(features, início do balde) lidos do mesmo balde, sem risco de virada entre eles."""
+        state = self._current_state()
+        return state[0], state[1]
+
+    def invalidate(self):
+        """Força o recálculo na próxima chamada (ex: calendário de feriados atualizado)."""
+        with self._lock:
+            self._state = None
+            self._holiday_date = None
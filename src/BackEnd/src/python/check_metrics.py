@@ -1,27 +1,310 @@
-import pickle
-import pandas as pd
+# -*- coding: utf-8 -*-
+# src/python/check_metrics.py
+"""
+Avaliação offline dos artefatos de modelo antes de irem para modelos_final/:
+- Conjunto de teste: as corridas que o train_models.py deixa fora do treino (is_holdout, por
+  hash do RideID), lidas do feature store em lotes de tamanho fixo (memória limitada)
+- Cada modelo da API pontua só as linhas da sua categoria (CATEGORY_PRODUCTS); artefatos
+  extras (--model nome=caminho, ex: o model.pkl do save_model.py) pontuam todas. O
+  save_model.py separa o teste pelo mesmo is_holdout, então nenhum deles viu essas corridas
+- RMSE, MAE e R² no total e por segmento (categoria, faixa de horário, faixa de distância,
+  feriado), acumulados como somas por lote: as previsões não ficam em memória
+- Latência no formato que a API carrega (.trees.npz se existir, senão o .pkl): por lote
+  (um predict por lote) e por linha (um predict de 1 linha, como no /predict)
+- --candidate-dir: avalia também os artefatos novos nas mesmas linhas e termina com código 1
+  se o RMSE ou a latência piorarem além da tolerância, ou se faltar o candidato de um modelo
+  atual (arquivo ausente ou sem linhas de teste)
+
+Linhas sem distância, duração ou preço ficam fora da avaliação.
+
+Uso: python check_metrics.py
+     python check_metrics.py --candidate-dir modelos_novos --json data/relatorio_modelos.json
+     python check_metrics.py --model geral=model.pkl
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+from collections import defaultdict
+
+import joblib
 import numpy as np
-from sklearn.metrics import mean_squared_error, r2_score
-
-# 1. Carregar modelo e lista de features
-with open("model.pkl", "rb") as f:
-    data = pickle.load(f)
-model = data["model"]
-features = data["features"]
-
-# 2. Carregar e preparar os dados (ajuste os caminhos conforme necessário)
-df = pd.read_csv("./data/ride_v2.csv", sep=';', low_memory=False)
-# ...repita aqui o processamento de merges e features igual ao save_model.py...
-
-# Exemplo: supondo que df_final seja o DataFrame final já preparado
-# X = df_final[features]
-# y = df_final["Price"]
-
-# 3. Fazer previsões e calcular métricas
-# predictions = model.predict(X)
-# rmse = np.sqrt(mean_squared_error(y, predictions))
-# r2 = r2_score(y, predictions)
-# print(f"RMSE: {rmse:.4f}")
-# print(f"R²: {r2:.4f}")
-
-# Observação: copie o processamento de features do save_model.py para garantir compatibilidade!
+import pandas as pd
+
+from compiled_trees import compiled_path_for, is_current, load_compiled
+from ride_stream import is_holdout
+from train_models import (CATEGORY_PRODUCTS, DISTANCE_COL, DURATION_COL, MERGE_KEY, MODEL_DIR, MODEL_FILES,
+                          PRICE_COL, PRODUCT_COL, open_feature_store)
+
+# Os artefatos foram treinados com DataFrame; aqui recebem a matriz NumPy, como no caminho
+# rápido da API (FeatureLayout), e o aviso do sklearn a cada predict é só ruído
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+
+BATCH_ROWS = 50_000          # linhas de teste por lote (pico de memória da avaliação)
+LATENCY_ROWS = 200           # linhas medidas uma a uma por modelo
+MAX_RMSE_INCREASE = 0.02     # candidato reprovado se o RMSE subir mais de 2%...
+MAX_LATENCY_INCREASE = 0.25  # ...ou a latência (por linha ou por lote) subir mais de 25%
+
+HOUR_BUCKETS = ["00-05h", "06-11h", "12-17h", "18-23h"]
+DISTANCE_BANDS_M = [2_000, 5_000, 10_000, 20_000]
+DISTANCE_LABELS = ["<2km", "2-5km", "5-10km", "10-20km", ">=20km"]
+HOLIDAY_LABELS = ["dia_normal", "feriado"]
+# Somas acumuladas por (modelo, segmento, rótulo): n, Σerro², Σ|erro|, Σy, Σy²
+_N, _SSE, _SAE, _SUM_Y, _SUM_Y2 = range(5)
+
+
+def load_artifact(path, prefer_compiled=True):
+    """(modelo com predict, colunas, formato) do artefato, como a API o carregaria.
+
+    O .trees.npz só é usado se foi exportado deste .pkl (ModelRegistry.artifact_path): um .npz
+    antigo ao lado de um .pkl candidato novo avaliaria o modelo errado.
+    """
+    compiled = compiled_path_for(path)
+    if prefer_compiled and os.path.exists(compiled) and (not os.path.exists(path) or is_current(compiled, path)):
+        data, fmt = load_compiled(compiled), os.path.basename(compiled)
+    else:
+        data, fmt = joblib.load(path), os.path.basename(path)
+    model = data.get("pipeline", data.get("model"))
+    columns = data.get("feature_columns", data.get("features"))
+    if model is None or columns is None:
+        raise ValueError(f"'{path}' não tem as chaves pipeline/feature_columns (ou model/features).")
+    return model, list(columns), fmt
+
+
+def holdout_batches(store, batch_rows=BATCH_ROWS):
+    """Lotes de exatamente batch_rows linhas de teste (o último pode ser menor)."""
+    buffer, buffered = [], 0
+    for frame in store.iter_frames(batch_rows):
+        frame = frame[is_holdout(frame[MERGE_KEY].to_numpy())]
+        frame = frame.assign(**{PRICE_COL: pd.to_numeric(frame[PRICE_COL], errors="coerce")})
+        frame = frame.dropna(subset=[DISTANCE_COL, DURATION_COL, PRICE_COL])
+        if not len(frame):
+            continue
+        # Nomes da API (distance_m/duration_s) e do save_model.py (distancia_m/...) lado a lado
+        frame = frame.assign(distance_m=frame[DISTANCE_COL].astype(np.float64),
+                             duration_s=frame[DURATION_COL].astype(np.float64),
+                             **{PRODUCT_COL: frame[PRODUCT_COL].astype(str).str.strip()})
+        buffer.append(frame)
+        buffered += len(frame)
+        if buffered >= batch_rows:
+            pending = pd.concat(buffer, ignore_index=True)
+            end = (len(pending) // batch_rows) * batch_rows
+            for start in range(0, end, batch_rows):
+                yield pending.iloc[start:start + batch_rows]
+            buffer, buffered = [pending.iloc[end:]], len(pending) - end
+    if buffered:
+        yield pd.concat(buffer, ignore_index=True)
+
+
+def segment_labels(batch):
+    """Rótulo de cada linha em cada segmento."""
+    hour = np.floor(batch["hour_min"].to_numpy()).astype(np.int64)
+    distance = batch["distance_m"].to_numpy()
+    return {
+        "categoria": batch[PRODUCT_COL].to_numpy(),
+        "horario": np.array(HOUR_BUCKETS)[np.clip(hour // 6, 0, 3)],
+        "distancia": np.array(DISTANCE_LABELS)[np.searchsorted(DISTANCE_BANDS_M, distance, side="right")],
+        "feriado": np.array(HOLIDAY_LABELS)[batch["is_holiday"].to_numpy().astype(np.int64).clip(0, 1)],
+    }
+
+
+def accumulate(sums, model_key, y, predictions, segments):
+    err = predictions - y
+    stats = np.column_stack([np.ones(len(y)), err * err, np.abs(err), y, y * y])
+    sums[(model_key, "total", "todas")] += stats.sum(axis=0)
+    for segment, labels in segments.items():
+        grouped = pd.DataFrame(stats).groupby(labels, sort=False).sum()
+        for label, row in zip(grouped.index, grouped.to_numpy()):
+            sums[(model_key, segment, label)] += row
+
+
+def summarize(totals):
+    n = totals[_N]
+    sst = totals[_SUM_Y2] - totals[_SUM_Y] ** 2 / n
+    return {
+        "n": int(n),
+        "rmse": float(np.sqrt(totals[_SSE] / n)),
+        "mae": float(totals[_SAE] / n),
+        "r2": float(1 - totals[_SSE] / sst) if sst > 0 else float("nan"),
+    }
+
+
+def row_latencies(samples, rounds=5, warmup=20):
+    """Percentis (µs) do predict de 1 linha, como no /predict da API, para cada modelo.
+
+    samples: {chave: (modelo, linhas)}. Os modelos são medidos intercalados, em rodadas, para
+    que variações da máquina (frequência da CPU, cache) afetem atual e candidato por igual.
+    """
+    timings = {key: [] for key in samples}
+    for model, rows in samples.values():
+        for i in range(min(warmup, len(rows))):
+            model.predict(rows[i:i + 1])
+    for r in range(rounds):
+        for key, (model, rows) in samples.items():
+            for i in range(r, len(rows), rounds):
+                start = time.perf_counter()
+                model.predict(rows[i:i + 1])
+                timings[key].append(time.perf_counter() - start)
+    return {key: {f"linha_p{p}_us": float(np.percentile(values, p) * 1e6) for p in (50, 95, 99)}
+            for key, values in timings.items() if values}
+
+
+def evaluate(models, batch_rows=BATCH_ROWS, latency_rows=LATENCY_ROWS):
+    """models: {chave: (caminho, ProductIDs ou None)}. Devolve o relatório (dict)."""
+    loaded, report = {}, {"modelos": {}, "segmentos": []}
+    for key, (path, products) in models.items():
+        model, columns, fmt = load_artifact(path)
+        loaded[key] = (model, columns, products)
+        report["modelos"][key] = {"arquivo": path, "formato": fmt, "produtos": products}
+
+    sums = defaultdict(lambda: np.zeros(5))
+    batch_times = defaultdict(list)
+    latency_samples = defaultdict(list)
+    started = time.perf_counter()
+    n_rows = 0
+    with open_feature_store() as store:
+        for batch in holdout_batches(store, batch_rows):
+            n_rows += len(batch)
+            segments = segment_labels(batch)
+            y_all = batch[PRICE_COL].to_numpy(dtype=np.float64)
+            for key, (model, columns, products) in loaded.items():
+                mask = batch[PRODUCT_COL].isin(products).to_numpy() if products else np.ones(len(batch), bool)
+                if not mask.any():
+                    continue
+                X = batch.loc[mask, columns].to_numpy(dtype=np.float64)
+                t0 = time.perf_counter()
+                predictions = np.asarray(model.predict(X), dtype=np.float64).ravel()
+                batch_times[key].append((len(X), time.perf_counter() - t0))
+                accumulate(sums, key, y_all[mask], predictions,
+                           {name: labels[mask] for name, labels in segments.items()})
+                if len(latency_samples[key]) < latency_rows:
+                    latency_samples[key].extend(X[:latency_rows - len(latency_samples[key])])
+    report["linhas_teste"] = n_rows
+    report["segundos"] = time.perf_counter() - started
+
+    for key, (model, _, _) in loaded.items():
+        info = report["modelos"][key]
+        if (key, "total", "todas") not in sums:
+            info["erro"] = "nenhuma linha de teste"
+            continue
+        info.update(summarize(sums[(key, "total", "todas")]))
+        rows = np.array([t[0] for t in batch_times[key]])
+        seconds = np.array([t[1] for t in batch_times[key]])
+        info.update({
+            "lotes": len(rows),
+            "lote_p50_ms": float(np.percentile(seconds, 50) * 1e3),
+            "lote_p95_ms": float(np.percentile(seconds, 95) * 1e3),
+            "lote_por_linha_us": float(seconds.sum() / rows.sum() * 1e6),
+        })
+    latencies = row_latencies({key: (loaded[key][0], np.array(rows)) for key, rows in latency_samples.items()})
+    for key, values in latencies.items():
+        report["modelos"][key].update(values)
+    for (key, segment, label), totals in sums.items():
+        if segment != "total":
+            report["segmentos"].append({"modelo": key, "segmento": segment, "rotulo": str(label),
+                                        **summarize(totals)})
+    return report
+
+
+def compare(report, baseline_keys, candidate_keys, max_rmse_increase, max_latency_increase):
+    """Candidato vs atual, modelo a modelo. Devolve (linhas da comparação, reprovados).
+
+    Um modelo atual sem candidato avaliável (arquivo ausente, sem linhas de teste) reprova: a
+    troca do diretório o deixaria de fora sem que nada fosse comparado.
+    """
+    rows, failed = [], []
+    for name in baseline_keys:
+        base, cand = report["modelos"].get(baseline_keys[name]), report["modelos"].get(candidate_keys.get(name))
+        if base is None or "rmse" not in base:
+            continue
+        if cand is None or "rmse" not in cand:
+            problem = "sem artefato candidato" if cand is None else f"candidato sem avaliação ({cand.get('erro')})"
+            rows.append({"modelo": name, "erro": problem})
+            failed.append(f"{name}: {problem}")
+            continue
+        row = {"modelo": name}
+        for metric, tolerance in (("rmse", max_rmse_increase), ("linha_p50_us", max_latency_increase),
+                                  ("lote_por_linha_us", max_latency_increase)):
+            change = cand[metric] / base[metric] - 1 if base[metric] else 0.0
+            row[f"{metric}_atual"], row[f"{metric}_novo"], row[f"{metric}_var"] = base[metric], cand[metric], change
+            if change > tolerance:
+                failed.append(f"{name}: {metric} {base[metric]:.4g} → {cand[metric]:.4g} ({change:+.1%})")
+        rows.append(row)
+    return rows, failed
+
+
+def _artifacts(model_dir):
+    found = {}
+    for name, filename in MODEL_FILES.items():
+        path = os.path.join(model_dir, filename)
+        if os.path.exists(path):
+            found[name] = (path, CATEGORY_PRODUCTS[name])
+        else:
+            print(f"AVISO: {path} não existe; '{name}' não será avaliado.")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avaliação offline (precisão e latência) dos artefatos de modelo")
+    parser.add_argument("--models-dir", default=MODEL_DIR, help="artefatos atuais (padrão: MODEL_DIR)")
+    parser.add_argument("--candidate-dir", help="artefatos novos, comparados aos atuais nas mesmas linhas")
+    parser.add_argument("--model", action="append", default=[], metavar="NOME=CAMINHO",
+                        help="artefato extra avaliado em todas as linhas (ex: geral=model.pkl)")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--latency-rows", type=int, default=LATENCY_ROWS)
+    parser.add_argument("--max-rmse-increase", type=float, default=MAX_RMSE_INCREASE)
+    parser.add_argument("--max-latency-increase", type=float, default=MAX_LATENCY_INCREASE)
+    parser.add_argument("--json", help="grava o relatório completo neste arquivo")
+    args = parser.parse_args()
+
+    baseline = _artifacts(args.models_dir)
+    models = dict(baseline)
+    candidate_keys = {}
+    if args.candidate_dir:
+        for name, artifact in _artifacts(args.candidate_dir).items():
+            candidate_keys[name] = f"{name} (novo)"
+            models[candidate_keys[name]] = artifact
+    for spec in args.model:
+        name, _, path = spec.partition("=")
+        models[name] = (path, None)
+    if not models:
+        sys.exit("Nenhum artefato para avaliar.")
+
+    report = evaluate(models, args.batch_rows, args.latency_rows)
+    if not report["linhas_teste"]:
+        sys.exit("Nenhuma linha de teste no feature store: rode o train_models.py antes.")
+    print(f"\n{report['linhas_teste']:,} linhas de teste avaliadas em {report['segundos']:.1f}s "
+          f"(lotes de {args.batch_rows:,})\n")
+    columns = ["formato", "n", "rmse", "mae", "r2", "lote_p50_ms", "lote_p95_ms", "lote_por_linha_us",
+               "linha_p50_us", "linha_p95_us", "linha_p99_us"]
+    print(pd.DataFrame(report["modelos"]).T.reindex(columns=columns).to_string(float_format=lambda v: f"{v:.4g}"))
+    segments = pd.DataFrame(report["segmentos"])
+    if len(segments):
+        print("\nRMSE por segmento (contagens no --json):")
+        pivot = segments.pivot_table(index=["segmento", "rotulo"], columns="modelo", values="rmse", sort=False)
+        print(pivot.to_string(float_format=lambda v: f"{v:.4g}"))
+
+    failed = []
+    if args.candidate_dir:
+        report["comparacao"], failed = compare(report, {name: name for name in baseline}, candidate_keys,
+                                               args.max_rmse_increase, args.max_latency_increase)
+        if report["comparacao"]:
+            print("\nNovo vs atual:")
+            print(pd.DataFrame(report["comparacao"]).set_index("modelo").to_string(float_format=lambda v: f"{v:.4g}"))
+        report["reprovados"] = failed
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nRelatório gravado em {args.json}")
+    if failed:
+        print("\n✗ Regressões acima da tolerância:\n  " + "\n  ".join(failed))
+        sys.exit(1)
+    if args.candidate_dir:
+        print("\n✓ Nenhuma regressão acima da tolerância.")
+
+
+if __name__ == "__main__":
+    main()
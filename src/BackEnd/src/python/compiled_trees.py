@@ -0,0 +1,420 @@
+# src/python/compiled_trees.py
+# Exportação dos modelos de árvores para um formato compacto de arrays (.trees.npz).
+#
+# Os .pkl guardam o pipeline sklearn inteiro (StandardScaler + XGBRegressor/RandomForest) e
+# cada predict() de uma linha passa pelas camadas de validação dos wrappers em Python. Aqui
+# o ensemble é achatado em matrizes NumPy (feature, limiar, filhos, valor por nó) e a
+# previsão percorre todas as árvores de uma vez, nível a nível, sem xgboost/sklearn.
+# O arquivo exportado é menor, carrega mais rápido e só é gravado se reproduzir as
+# previsões do .pkl dentro da tolerância (COMPILED_RTOL / COMPILED_ATOL).
+# O meta do .npz guarda o sha1 do .pkl de origem: um .npz que não corresponde ao .pkl atual
+# (o .pkl foi trocado e o .npz não foi exportado de novo) é recusado e o .pkl é usado.
+#
+# Uso: python compiled_trees.py [diretorio_dos_modelos]
+import hashlib
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+COMPILED_SUFFIX = ".trees.npz"
+FORMAT_VERSION = 1
+
+# Tolerância da comparação com o modelo original (preços em R$, arredondados a 2 casas)
+COMPILED_RTOL = 1e-5
+COMPILED_ATOL = 1e-3
+
+# Linhas por bloco no predict em lote: mantém as matrizes (linhas x árvores) no cache da CPU
+PREDICT_CHUNK_ROWS = 256
+
+
+def compiled_path_for(pkl_path):
+    return os.path.splitext(pkl_path)[0] + COMPILED_SUFFIX
+
+
+def source_digest(path):
+    """sha1 do conteúdo do .pkl de origem (gravado no meta do .npz como source_sha1)."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_meta(data, path):
+    meta = json.loads(str(data["meta"]))
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Versão de formato não suportada em '{path}': {meta.get('format_version')}")
+    return meta
+
+
+def _check_source(meta, path, source_path):
+    if meta.get("source_sha1") != source_digest(source_path):
+        raise ValueError(f"'{path}' foi exportado de outra versão de '{os.path.basename(source_path)}' "
+                         "(exporte de novo com compiled_trees.py).")
+
+
+def is_current(compiled_path, source_path):
+    """True se o .trees.npz existe e foi exportado do conteúdo atual de source_path (.pkl)."""
+    try:
+        with np.load(compiled_path, allow_pickle=False) as data:
+            _check_source(_read_meta(data, compiled_path), compiled_path, source_path)
+    except (OSError, ValueError, KeyError):
+        return False
+    return True
+
+
+class CompiledTreeModel:
+    """Ensemble de árvores em arrays planos, com a mesma interface predict() do pipeline.
+
+    Cada árvore ocupa uma linha das matrizes (nós preenchidos até o tamanho da maior).
+    Folhas apontam para si mesmas, então o percurso é um número fixo de passos (max_depth).
+    - strict_less: True para XGBoost (x < limiar vai para a esquerda), False para sklearn (x <= limiar).
+    - reduce: 'sum' (boosting, somado a base_score) ou 'mean' (floresta).
+    """
+
+    def __init__(self, feature_columns, feature, threshold, left, right, default_left, value,
+                 max_depth, strict_less, reduce, base_score=0.0, scaler_mean=None, scaler_scale=None):
+        self.feature_columns = list(feature_columns)
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.max_depth = int(max_depth)
+        self.strict_less = bool(strict_less)
+        self.reduce = reduce
+        self.base_score = float(base_score)
+        self.scaler_mean = None if scaler_mean is None else np.asarray(scaler_mean, dtype=np.float64)
+        self.scaler_scale = None if scaler_scale is None else np.asarray(scaler_scale, dtype=np.float64)
+        self.n_trees, n_nodes = self.feature.shape
+        # Cópias achatadas com índices absolutos (árvore * n_nodes + nó) para o percurso com np.take
+        offsets = (np.arange(self.n_trees, dtype=np.int64) * n_nodes)[:, None]
+        self._roots = offsets.ravel()
+        self._flat_feature = self.feature.ravel()
+        self._flat_threshold = self.threshold.ravel()
+        self._flat_left = (self.left + offsets).ravel()
+        self._flat_right = (self.right + offsets).ravel()
+        self._flat_default_left = self.default_left.ravel()
+        self._flat_value = self.value.ravel()
+        self._has_missing_rules = bool(self.default_left.any())
+
+    def _as_matrix(self, X):
+        if hasattr(X, "columns"):
+            X = X[self.feature_columns].to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != len(self.feature_columns):
+            raise ValueError(f"Esperadas {len(self.feature_columns)} colunas, recebidas {X.shape[1]}.")
+        return X
+
+    def predict(self, X):
+        X = self._as_matrix(X)
+        if self.scaler_mean is not None:
+            X = (X - self.scaler_mean) / self.scaler_scale
+        # Os dois backends comparam as features em float32
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        predictions = np.empty(n_rows, dtype=np.float64)
+        for start in range(0, n_rows, PREDICT_CHUNK_ROWS):
+            chunk = X[start:start + PREDICT_CHUNK_ROWS]
+            predictions[start:start + len(chunk)] = self._predict_chunk(chunk.ravel(), len(chunk), n_features)
+        return predictions
+
+    def _predict_chunk(self, flat_x, n_rows, n_features):
+        # node[i, t]: índice absoluto do nó atual da árvore t para a linha i
+        row_base = (np.arange(n_rows, dtype=np.int64) * n_features)[:, None]
+        node = np.broadcast_to(self._roots, (n_rows, self.n_trees))
+        for _ in range(self.max_depth):
+            x = flat_x.take(row_base + self._flat_feature.take(node))
+            threshold = self._flat_threshold.take(node)
+            go_left = x < threshold if self.strict_less else x <= threshold
+            if self._has_missing_rules:
+                missing = np.isnan(x)
+                if missing.any():
+                    go_left = np.where(missing, self._flat_default_left.take(node), go_left)
+            node = np.where(go_left, self._flat_left.take(node), self._flat_right.take(node))
+        leaves = self._flat_value.take(node)
+        if self.reduce == "mean":
+            return leaves.mean(axis=1)
+        return leaves.sum(axis=1) + self.base_score
+
+    def save(self, path, metadata=None):
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "feature_columns": self.feature_columns,
+            "max_depth": self.max_depth,
+            "strict_less": self.strict_less,
+            "reduce": self.reduce,
+            "base_score": self.base_score,
+            **(metadata or {})
+        }
+        arrays = {
+            "feature": self.feature, "threshold": self.threshold, "left": self.left,
+            "right": self.right, "default_left": self.default_left, "value": self.value
+        }
+        if self.scaler_mean is not None:
+            arrays["scaler_mean"] = self.scaler_mean
+            arrays["scaler_scale"] = self.scaler_scale
+        np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_compiled(path, source_path=None):
+    """Carrega um .trees.npz no mesmo formato de dicionário dos .pkl ({pipeline, feature_columns}).
+
+    source_path: .pkl de origem; se existir, o .npz precisa ter sido exportado dele (ValueError se não).
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = _read_meta(data, path)
+        if source_path is not None and os.path.exists(source_path):
+            _check_source(meta, path, source_path)
+        model = CompiledTreeModel(
+            meta["feature_columns"], data["feature"], data["threshold"], data["left"], data["right"],
+            data["default_left"], data["value"], meta["max_depth"], meta["strict_less"], meta["reduce"],
+            base_score=meta["base_score"],
+            scaler_mean=data["scaler_mean"] if "scaler_mean" in data else None,
+            scaler_scale=data["scaler_scale"] if "scaler_scale" in data else None
+        )
+    return {"pipeline": model, "feature_columns": model.feature_columns, "compiled_metadata": meta}
+
+
+# --- Conversão a partir dos modelos treinados ---
+
+def _pack(trees, threshold_dtype):
+    # trees: lista de dicts com arrays por nó; devolve matrizes (n_trees, max_nodes)
+    n_nodes = max(len(tree["feature"]) for tree in trees)
+    shape = (len(trees), n_nodes)
+    packed = {
+        "feature": np.zeros(shape, dtype=np.int32),
+        "threshold": np.zeros(shape, dtype=threshold_dtype),
+        "left": np.tile(np.arange(n_nodes, dtype=np.int32), (len(trees), 1)),
+        "right": np.tile(np.arange(n_nodes, dtype=np.int32), (len(trees), 1)),
+        "default_left": np.zeros(shape, dtype=bool),
+        "value": np.zeros(shape, dtype=np.float64),
+    }
+    for i, tree in enumerate(trees):
+        size = len(tree["feature"])
+        for key in packed:
+            packed[key][i, :size] = tree[key]
+    return packed
+
+
+def _tree_depth(left, right):
+    depth = 0
+    frontier = [0]
+    while True:
+        children = [child for node in frontier for child in (left[node], right[node]) if child != node]
+        if not children:
+            return depth
+        frontier = children
+        depth += 1
+
+
+def _sklearn_trees(estimators, n_features):
+    trees = []
+    for estimator in estimators:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        own = np.arange(tree.node_count)
+        trees.append({
+            "feature": np.where(is_leaf, 0, tree.feature),
+            "threshold": np.where(is_leaf, 0.0, tree.threshold),
+            "left": np.where(is_leaf, own, tree.children_left),
+            "right": np.where(is_leaf, own, tree.children_right),
+            # sklearn >= 1.3 guarda para onde vão os NaN; antes NaN não era aceito
+            "default_left": (tree.missing_go_to_left.astype(bool) if hasattr(tree, "missing_go_to_left")
+                             else np.ones(tree.node_count, dtype=bool)),
+            "value": tree.value[:, 0, 0],
+        })
+    if any(tree["feature"].max() >= n_features for tree in trees):
+        raise ValueError("Árvore usa uma feature fora do intervalo esperado.")
+    return trees
+
+
+def _xgboost_base_score(booster):
+    raw = json.loads(booster.save_config())["learner"]["learner_model_param"]["base_score"]
+    # Versões recentes gravam o base_score como lista (ex: '[1.2E1]')
+    return float(raw.strip("[]").split(",")[0])
+
+
+def _xgboost_trees(booster, feature_columns):
+    config = json.loads(booster.save_config())
+    objective = config["learner"]["objective"]["name"]
+    if objective not in ("reg:squarederror", "reg:linear", "reg:absoluteerror", "reg:pseudohubererror"):
+        raise ValueError(f"Objetivo XGBoost não suportado para exportação: {objective}")
+    booster_type = config["learner"]["gradient_booster"]["name"]
+    if booster_type != "gbtree":
+        raise ValueError(f"Booster XGBoost não suportado para exportação: {booster_type}")
+
+    frame = booster.trees_to_dataframe()
+    best_iteration = booster.attr("best_iteration")
+    if best_iteration is not None:
+        # O predict() do wrapper usa só as árvores até a melhor iteração do early stopping
+        parallel = int(config["learner"]["gradient_booster"]["gbtree_model_param"].get("num_parallel_tree", 1))
+        frame = frame[frame["Tree"] < (int(best_iteration) + 1) * parallel]
+
+    def feature_index(name):
+        if name in feature_columns:
+            return feature_columns.index(name)
+        match = re.fullmatch(r"f(\d+)", name)
+        if match and int(match.group(1)) < len(feature_columns):
+            return int(match.group(1))
+        raise ValueError(f"Feature '{name}' da árvore não está em feature_columns.")
+
+    trees = []
+    for _, nodes in frame.groupby("Tree", sort=True):
+        nodes = nodes.sort_values("Node")
+        node_ids = nodes["Node"].to_numpy()
+        if not np.array_equal(node_ids, np.arange(len(node_ids))):
+            raise ValueError("Numeração de nós inesperada no dump do XGBoost.")
+        id_to_node = {node_id: node for node_id, node in zip(nodes["ID"], node_ids)}
+        is_leaf = (nodes["Feature"] == "Leaf").to_numpy()
+        own = node_ids.astype(np.int32)
+        left = np.array([own[i] if leaf else id_to_node[yes] for i, (leaf, yes) in enumerate(zip(is_leaf, nodes["Yes"]))])
+        right = np.array([own[i] if leaf else id_to_node[no] for i, (leaf, no) in enumerate(zip(is_leaf, nodes["No"]))])
+        trees.append({
+            "feature": np.array([0 if leaf else feature_index(name) for leaf, name in zip(is_leaf, nodes["Feature"])]),
+            "threshold": np.where(is_leaf, 0.0, nodes["Split"].fillna(0.0).to_numpy()).astype(np.float32),
+            "left": left,
+            "right": right,
+            "default_left": np.array([not leaf and missing == yes
+                                      for leaf, missing, yes in zip(is_leaf, nodes["Missing"], nodes["Yes"])]),
+            # Nas folhas o valor vem na coluna 'Gain' do dump
+            "value": np.where(is_leaf, nodes["Gain"].to_numpy(), 0.0),
+        })
+    return trees, _xgboost_base_score(booster)
+
+
+def _split_pipeline(model):
+    # Separa um StandardScaler opcional do estimador final (pipeline sklearn ou estimador solto)
+    steps = [step for _, step in model.steps] if hasattr(model, "steps") else [model]
+    steps = [step for step in steps if step is not None and step != "passthrough"]
+    scaler, estimator = None, steps[-1]
+    for step in steps[:-1]:
+        if type(step).__name__ != "StandardScaler" or scaler is not None:
+            raise ValueError(f"Etapa de pipeline não suportada para exportação: {type(step).__name__}")
+        scaler = step
+    return scaler, estimator
+
+
+def compile_model(model, feature_columns):
+    """Converte um pipeline (StandardScaler opcional + XGBRegressor/RandomForest/DecisionTree) em CompiledTreeModel.
+
+    Levanta ValueError para modelos que não sabemos achatar; o .pkl continua sendo usado.
+    """
+    feature_columns = list(feature_columns)
+    scaler, estimator = _split_pipeline(model)
+    kind = type(estimator).__name__
+
+    if hasattr(estimator, "get_booster"):
+        trees, base_score = _xgboost_trees(estimator.get_booster(), feature_columns)
+        packed = _pack(trees, np.float32)
+        strict_less, reduce = True, "sum"
+    elif hasattr(estimator, "estimators_") and kind in ("RandomForestRegressor", "ExtraTreesRegressor"):
+        packed = _pack(_sklearn_trees(estimator.estimators_, len(feature_columns)), np.float64)
+        strict_less, reduce, base_score = False, "mean", 0.0
+    elif hasattr(estimator, "tree_") and kind == "DecisionTreeRegressor":
+        packed = _pack(_sklearn_trees([estimator], len(feature_columns)), np.float64)
+        strict_less, reduce, base_score = False, "mean", 0.0
+    else:
+        raise ValueError(f"Estimador não suportado para exportação: {kind}")
+
+    max_depth = max(_tree_depth(left, right) for left, right in zip(packed["left"], packed["right"]))
+    scaler_mean = scaler_scale = None
+    if scaler is not None:
+        scaler_mean = scaler.mean_ if scaler.with_mean else np.zeros(len(feature_columns))
+        scaler_scale = scaler.scale_ if scaler.with_std else np.ones(len(feature_columns))
+    return CompiledTreeModel(
+        feature_columns, packed["feature"], packed["threshold"], packed["left"], packed["right"],
+        packed["default_left"], packed["value"], max_depth, strict_less, reduce,
+        base_score=base_score, scaler_mean=scaler_mean, scaler_scale=scaler_scale
+    )
+
+
+def max_abs_difference(original, compiled, X):
+    """Maior diferença absoluta entre as previsões do modelo original e do compilado em X."""
+    import pandas as pd
+    frame = pd.DataFrame(np.asarray(X, dtype=np.float64), columns=compiled.feature_columns)
+    expected = np.asarray(original.predict(frame), dtype=np.float64).ravel()
+    actual = compiled.predict(frame)
+    if not np.allclose(actual, expected, rtol=COMPILED_RTOL, atol=COMPILED_ATOL, equal_nan=False):
+        worst = int(np.argmax(np.abs(actual - expected)))
+        raise ValueError(f"Modelo compilado diverge do original: linha {worst}, "
+                         f"esperado {expected[worst]:.6f}, obtido {actual[worst]:.6f}.")
+    return float(np.max(np.abs(actual - expected)))
+
+
+def sample_inputs(compiled, n_rows=2000, seed=0, include_missing=False):
+    """Entradas de verificação que passam pelos dois lados de cada limiar das árvores."""
+    rng = np.random.default_rng(seed)
+    n_features = len(compiled.feature_columns)
+    is_split = compiled.left != np.arange(compiled.left.shape[1])[None, :]
+    thresholds = compiled.threshold.astype(np.float64)
+    if compiled.scaler_mean is not None:
+        # Limiares estão no espaço padronizado; volta para o espaço original das features
+        thresholds = thresholds * compiled.scaler_scale[compiled.feature] + compiled.scaler_mean[compiled.feature]
+    X = np.empty((n_rows, n_features))
+    for j in range(n_features):
+        points = thresholds[is_split & (compiled.feature == j)]
+        if len(points) == 0:
+            points = np.zeros(1) if compiled.scaler_mean is None else compiled.scaler_mean[j:j + 1]
+        spread = np.ptp(points) * 0.1 + 1.0
+        X[:, j] = rng.choice(points, n_rows) + rng.uniform(-spread, spread, n_rows)
+    if include_missing:
+        # Alguns valores ausentes para conferir a direção padrão (default_left) de cada nó
+        X[rng.random(X.shape) < 0.02] = np.nan
+    return X
+
+
+def export_artifact(pkl_path, output_path=None):
+    """Exporta um .pkl ({pipeline, feature_columns} ou {model, features}) para .trees.npz.
+
+    Só grava se o modelo compilado reproduzir o original dentro da tolerância.
+    Devolve (caminho_gerado, maior_diferenca_absoluta).
+    """
+    import joblib
+    source_sha1 = source_digest(pkl_path)   # antes do load: o .npz nunca fica marcado com um .pkl mais novo
+    data = joblib.load(pkl_path)
+    model = data.get("pipeline", data.get("model"))
+    feature_columns = data.get("feature_columns", data.get("features"))
+    if model is None or feature_columns is None:
+        raise ValueError(f"'{pkl_path}' não tem as chaves pipeline/feature_columns (ou model/features).")
+    compiled = compile_model(model, feature_columns)
+    include_missing = compiled.strict_less  # XGBoost sempre aceita NaN; sklearn depende da versão
+    max_diff = max_abs_difference(model, compiled, sample_inputs(compiled, include_missing=include_missing))
+    output_path = output_path or compiled_path_for(pkl_path)
+    compiled.save(output_path, metadata={"source": os.path.basename(pkl_path), "source_sha1": source_sha1,
+                                         "max_abs_diff": max_diff, "estimator": type(_split_pipeline(model)[1]).__name__})
+    return output_path, max_diff
+
+
+def export_directory(model_dir):
+    results = {}
+    for filename in sorted(os.listdir(model_dir)):
+        if not filename.endswith(".pkl"):
+            continue
+        pkl_path = os.path.join(model_dir, filename)
+        try:
+            output_path, max_diff = export_artifact(pkl_path)
+        except Exception as e:
+            print(f"   ✗ {filename}: {type(e).__name__}: {e}")
+            results[filename] = None
+            continue
+        pkl_kb = os.path.getsize(pkl_path) / 1024
+        out_kb = os.path.getsize(output_path) / 1024
+        print(f"   ✓ {filename} → {os.path.basename(output_path)} "
+              f"({pkl_kb:.0f} KB → {out_kb:.0f} KB, diferença máx. {max_diff:.2e})")
+        results[filename] = output_path
+    return results
+
+
+if __name__ == "__main__":
+    target_dir = sys.argv[1] if len(sys.argv) > 1 else os.getenv("MODEL_DIR", "modelos_final")
+    print(f"Exportando modelos de '{target_dir}' para {COMPILED_SUFFIX}...")
+    exported = export_directory(target_dir)
+    if not any(exported.values()):
+        sys.exit(1)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Limpeza das coordenadas brutas (Lat/Lng) do rideaddress_v1.csv:
+- clean_coord: versão original, valor a valor (regex)
+- clean_coords: mesma regra sobre a coluna inteira, uma vez por valor distinto
+
+Muitas corridas repetem os mesmos pontos (prédios, aeroportos): pd.factorize agrupa os
+valores iguais em C e a regex roda só nos distintos. O resultado é o de clean_coord valor a
+valor. pd.to_numeric(s.str.replace(',', '.')) não serve: diverge da regex nos valores sujos
+("-7" -> 7, "1e-5" -> 1, "lat:-23,5" -> -23.5) e não arredonda corretamente textos longos
+("-23.527377473811313280"), comuns em coordenadas serializadas de double.
+
+Paridade + benchmark: python coord_parsing.py --rows 3000000
+"""
+
+import re
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+COORD_PATTERN = re.compile(r'[-+]?\d*\.\d+|\d+')
+
+
+def clean_coord(x):
+    if pd.isna(x): return np.nan
+    s = str(x).replace(',', '.')
+    m = COORD_PATTERN.search(s)
+    return float(m.group()) if m else np.nan
+
+
+def clean_coords(values):
+    """Aplica a regra de clean_coord a uma Series/array inteira.
+
+    Devolve uma Series float64 (mesmo índice, se a entrada for Series) com NaN onde
+    clean_coord devolveria NaN.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    # Agrupa pelo texto (o que a regex vê): -23 e -23.0 são iguais como objetos, mas não para ela
+    codes, uniques = pd.factorize(series.astype(str))
+    # Código -1 (NaN/None) aponta para o NaN acrescentado no fim
+    cleaned = np.array([clean_coord(x) for x in uniques] + [np.nan], dtype=np.float64)
+    return pd.Series(cleaned[codes], index=series.index, name=series.name)
+
+
+# — Paridade + benchmark —
+def synthetic_raw_coords(n_rows, seed=0):
+    """Coluna bruta com os formatos vistos no dump: vírgula/ponto decimal, sujeira e NaN."""
+    rng = np.random.default_rng(seed)
+    scale = 10.0 ** rng.integers(0, 9, n_rows)
+    values = np.round(rng.uniform(-50, 10, n_rows) * scale) / scale
+    text = values.astype(str)
+    # Parte com todos os dígitos de um double ("%.17g"), como em coordenadas vindas de JSON/JS
+    full = rng.random(n_rows) < 0.2
+    text[full] = np.char.mod('%.17g', rng.uniform(-50, 10, np.count_nonzero(full)))
+    kind = rng.random(n_rows)
+    comma = kind < 0.55
+    text[comma] = np.char.replace(text[comma], '.', ',')
+    raw = text.astype(object)
+    dirty_templates = [' {} ', 'lat:{}', '({})', '{}°', '{}x', '--{}', '{},,', '1e-5', 'abc', '', '-7', '+.5', '12.']
+    dirty = np.flatnonzero((kind >= 0.90) & (kind < 0.97))
+    picks = rng.integers(0, len(dirty_templates), len(dirty))
+    for i, p in zip(dirty, picks):
+        raw[i] = dirty_templates[p].format(text[i])
+    raw[kind >= 0.97] = np.nan
+    return pd.Series(raw, name='raw_lat')
+
+
+def _benchmark(n_rows, distinct=0):
+    # distinct > 0: as linhas repetem distinct pontos, como no dump (0 = todas diferentes)
+    series = synthetic_raw_coords(distinct or n_rows)
+    if distinct:
+        series = series.sample(n_rows, replace=True, random_state=0).reset_index(drop=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'coords.csv')
+        series.to_frame().to_csv(path, sep=';', index=False)
+        raw = pd.read_csv(path, sep=';', low_memory=False)['raw_lat']
+    print(f"{len(raw):,} linhas (dtype lido: {raw.dtype})")
+
+    start = time.perf_counter()
+    expected = raw.map(clean_coord).to_numpy(dtype=np.float64)
+    t_map = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = clean_coords(raw).to_numpy()
+    t_vec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    naive = pd.to_numeric(raw.astype(str).str.replace(',', '.', regex=False), errors='coerce').to_numpy()
+    t_naive = time.perf_counter() - start
+    naive_diff = np.count_nonzero(~((expected == naive) | (np.isnan(expected) & np.isnan(naive))))
+
+    same = np.array_equal(expected, actual, equal_nan=True)
+    print(f"map(clean_coord): {t_map:.2f}s | clean_coords: {t_vec:.2f}s | {t_map / t_vec:.1f}x | paridade: {same}")
+    print(f"pd.to_numeric(str.replace): {t_naive:.2f}s | {naive_diff:,} valores diferentes de clean_coord")
+    if not same:
+        diff = np.flatnonzero(~((expected == actual) | (np.isnan(expected) & np.isnan(actual))))
+        print(pd.DataFrame({'raw': raw.iloc[diff[:10]].values, 'esperado': expected[diff[:10]],
+                            'obtido': actual[diff[:10]]}))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Paridade e benchmark de clean_coords")
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--distinct', type=int, default=0, help="nº de valores distintos (0 = todos)")
+    args = parser.parse_args()
+    _benchmark(args.rows, args.distinct)
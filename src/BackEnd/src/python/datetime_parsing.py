@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Conversão vetorizada da coluna de data/hora bruta (Create) do ride_v2.csv:
+- fix_date_str + to_datetime: versão original, valor a valor, mantida como referência
+- parse_datetimes: mesmo resultado sobre a coluna inteira com NumPy
+
+Os valores no layout do dump, "AAAA-MM-DD HH:MM:SS[.fração]" (ou com 'T'), são lidos
+direto de um buffer de bytes: dígitos por posição fixa, validação de mês/dia/hora como
+no to_datetime e fração truncada em 6 dígitos exatamente como em fix_date_str. Só o que
+foge desse layout passa pelo caminho original (fix_date_str + to_datetime ISO 8601).
+
+Paridade + benchmark: python datetime_parsing.py --rows 3000000
+"""
+
+import re
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+# Linhas por bloco na conversão (limita os buffers temporários em memória)
+CHUNK_ROWS = 500_000
+
+_BASE_LEN = 19                  # "AAAA-MM-DD HH:MM:SS"
+_MAX_FRACTION = 6               # fix_date_str trunca a fração em microssegundos
+_MAX_LEN = 64                   # textos maiores vão para o caminho original
+# Anos sempre representáveis em datetime64[ns] (1677-09-21 … 2262-04-11); os extremos
+# ficam com o caminho original
+_MIN_YEAR, _MAX_YEAR = 1678, 2261
+_DIGIT_POSITIONS = np.array([0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18])
+_DIGIT_0 = ord('0')
+_NS_PER_SECOND = 1_000_000_000
+_POW10 = 10 ** np.arange(_MAX_FRACTION + 1, dtype=np.int64)
+_DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+# Fuso depois da hora ("HH:MM[:SS[.fração]]" + "Z", "UTC", "±HH", "±HHMM" ou "±HH:MM")
+_UTC_OFFSET = re.compile(r"^(.*\d{2}:\d{2}(?::\d{2}(?:\.\d*)?)?)\s*(?:Z|UTC|[+-]\d{2}(?::?\d{2})?)\s*$")
+
+# --- Função para corrigir formato da string de data/hora ---
+def fix_date_str(date_str):
+    if pd.isna(date_str): return None
+    date_str = str(date_str).strip()
+    if '.' in date_str:
+        parts = date_str.split('.')
+        # Garante que a parte da fração de segundo tenha no máximo 6 dígitos
+        if len(parts) > 1 and len(parts[1]) > 6:
+             base_time = parts[0]
+             fraction = parts[1][:6]
+             time_parts = base_time.split(':')
+             if len(time_parts) >= 2: # Precisa ter pelo menos HH:MM
+                 return base_time + '.' + fraction
+    return date_str
+
+
+def _strip_utc_offset(value):
+    # Testes de substring antes da regex: quase nenhum valor tem fuso
+    if not isinstance(value, str) or ('+' not in value and value.count('-') < 3
+                                      and not value.rstrip().endswith(('Z', 'UTC'))):
+        return value
+    match = _UTC_OFFSET.match(value)
+    return match.group(1) if match else value
+
+
+def parse_datetimes_rowwise(values):
+    """Caminho original: fix_date_str valor a valor + to_datetime (ISO 8601, NaT se inválido).
+
+    Um fuso no fim do texto ("...-03:00", "...Z") é descartado antes, mantendo a hora do
+    relógio: as datas do dump são hora local, como o datetime.now() da API. Assim um bloco que
+    mistura textos com e sem fuso também não levanta "Mixed timezones" no to_datetime.
+    """
+    fixed = pd.Series(values, dtype=object).apply(lambda value: fix_date_str(_strip_utc_offset(value)))
+    return pd.to_datetime(fixed, errors="coerce", format="ISO8601", cache=True).to_numpy(dtype="datetime64[ns]")
+
+
+def _parse_fixed_layout(texts):
+    """Converte os textos no layout do dump; devolve (int64 ns, máscara_dos_convertidos)."""
+    n = len(texts)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    nanos = np.zeros(n, dtype=np.int64)
+    candidate = (lengths == _BASE_LEN) | ((lengths > _BASE_LEN + 1) & (lengths <= _MAX_LEN))
+    if not candidate.any():
+        return nanos, np.zeros(n, dtype=bool)
+
+    # Buffer único com todos os textos; cada candidato vira uma linha da matriz (n × largura)
+    # de bytes por indexação. Caracteres não ASCII viram '?' (1 byte cada) e reprovam o texto
+    # sem desalinhar o buffer; bytes além do fim de cada texto são ignorados via in_text.
+    rows = np.flatnonzero(candidate)
+    width = int(lengths[rows].max())
+    raw = np.frombuffer('\n'.join(texts).encode('ascii', 'replace'), dtype=np.uint8)
+    raw = np.concatenate((raw, np.zeros(width, dtype=np.uint8)))
+    starts = np.concatenate(([0], np.cumsum(lengths[:-1] + 1)))
+    grid = np.lib.stride_tricks.sliding_window_view(raw, width)[starts[rows]]
+    row_lengths = lengths[rows]
+
+    # Em uint8, byte - '0' > 9 para qualquer byte que não seja dígito (inclusive por estouro)
+    digits = grid[:, _DIGIT_POSITIONS] - np.uint8(_DIGIT_0)
+    ok = (digits <= 9).all(axis=1)
+    ok &= (grid[:, 4] == ord('-')) & (grid[:, 7] == ord('-')) & (grid[:, 13] == ord(':')) & (grid[:, 16] == ord(':'))
+    ok &= (grid[:, 10] == ord(' ')) | (grid[:, 10] == ord('T'))
+
+    pairs = digits[:, 0::2].astype(np.int64) * 10 + digits[:, 1::2]   # AA AA MM DD HH MM SS
+    year = pairs[:, 0] * 100 + pairs[:, 1]
+    month, day, hour, minute, second = pairs[:, 2], pairs[:, 3], pairs[:, 4], pairs[:, 5], pairs[:, 6]
+    ok &= (year >= _MIN_YEAR) & (year <= _MAX_YEAR) & (month >= 1) & (month <= 12)
+    ok &= (hour <= 23) & (minute <= 59) & (second <= 59) & (day >= 1)
+
+    # Fração: '.' na posição 19 seguido só de dígitos; vale o que fix_date_str deixa (6 primeiros)
+    micros = np.zeros(len(rows), dtype=np.int64)
+    if width > _BASE_LEN:
+        has_fraction = row_lengths > _BASE_LEN
+        tail = grid[:, _BASE_LEN + 1:] - np.uint8(_DIGIT_0)
+        in_text = np.arange(_BASE_LEN + 1, width) < row_lengths[:, None]
+        ok &= ~has_fraction | ((grid[:, _BASE_LEN] == ord('.')) & ((tail <= 9) | ~in_text).all(axis=1))
+        for k in range(min(_MAX_FRACTION, width - _BASE_LEN - 1)):
+            micros += np.where(in_text[:, k], tail[:, k], 0) * _POW10[_MAX_FRACTION - 1 - k]
+
+    # Dia válido para o mês/ano (30/02 etc. viram NaT no to_datetime)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_index = np.clip(month, 1, 12) - 1
+    ok &= day <= _DAYS_IN_MONTH[month_index] + ((month == 2) & leap)
+
+    # Dias desde 1970-01-01 no calendário gregoriano (algoritmo days_from_civil, só inteiros)
+    shifted_year = year - (month <= 2)
+    era = shifted_year // 400
+    year_of_era = shifted_year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    epoch_days = era * 146097 + day_of_era - 719468
+    seconds = epoch_days * 86400 + hour * 3600 + minute * 60 + second
+    nanos[rows] = np.where(ok, seconds * _NS_PER_SECOND + micros * 1000, 0)
+    converted = np.zeros(n, dtype=bool)
+    converted[rows] = ok
+    return nanos, converted
+
+
+def parse_datetimes(values, chunk_rows=CHUNK_ROWS):
+    """Vetorizado: equivalente a to_datetime(values.apply(fix_date_str), errors='coerce', format='ISO8601').
+
+    Devolve uma Series datetime64[ns] (mesmo índice, se a entrada for Series) com NaT nos
+    valores inválidos. Uma coluna datetime64 sem fuso é devolvida como está (em ns).
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(series) and series.dt.tz is None:
+        # Já convertida (ex: cache do raw_cache.py)
+        return series.astype("datetime64[ns]")
+    objects = series.to_numpy(dtype=object)
+    result = np.empty(len(objects), dtype="datetime64[ns]")
+    for start in range(0, len(objects), chunk_rows):
+        chunk = objects[start:start + chunk_rows]
+        # str() de NaN/None ("nan", "None") não está no layout: vai para o caminho original
+        texts = list(map(str, chunk))
+        nanos, converted = _parse_fixed_layout(texts)
+        out = nanos.view("datetime64[ns]")
+        rest = np.flatnonzero(~converted)
+        if len(rest):
+            out[rest] = parse_datetimes_rowwise(chunk[rest])
+        result[start:start + len(chunk)] = out
+    return pd.Series(result, index=series.index, name=series.name)
+
+
+# — Paridade + benchmark —
+def synthetic_raw_datetimes(n_rows, seed=0):
+    """Coluna bruta com os formatos vistos no dump: frações de 0 a 9 dígitos, 'T', sujeira e NaN."""
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 4 * 365 * 86400, n_rows)
+    stamps = np.datetime64('2021-01-01T00:00:00') + seconds.astype('timedelta64[s]')
+    text = np.datetime_as_string(stamps).astype(object)
+    text = np.char.replace(text.astype(str), 'T', ' ').astype(object)
+    kind = rng.random(n_rows)
+    fraction = kind < 0.6
+    digits = rng.integers(1, 10, n_rows)
+    for i in np.flatnonzero(fraction):
+        text[i] = f"{text[i]}.{rng.integers(0, 10 ** 9):09d}"[:20 + digits[i]]
+    iso_t = (kind >= 0.6) & (kind < 0.65)
+    text[iso_t] = [t.replace(' ', 'T') for t in text[iso_t]]
+    dirty_templates = [' {} ', '{}.12345678abc', '2023-02-30 10:00:00', '2023-13-01 10:00:00',
+                       '2023-01-01 24:00:00', '2023-01-01', '01/02/2023 10:00', 'abc', '', '1500-01-01 00:00:00',
+                       '2023-01-01 10:00:00.', '2023-01-01 10:00:00.1234567.89', '2024-02-29 23:59:59.9999999',
+                       '2023-1-01 10:00:00', '2023-01-01 10:00:00-03:00', '2023-01-01T10:00:00Z']
+    dirty = np.flatnonzero((kind >= 0.95) & (kind < 0.99))
+    picks = rng.integers(0, len(dirty_templates), len(dirty))
+    for i, p in zip(dirty, picks):
+        text[i] = dirty_templates[p].format(text[i])
+    text[kind >= 0.99] = np.nan
+    return pd.Series(text, name='Create')
+
+
+def _benchmark(n_rows):
+    raw = synthetic_raw_datetimes(n_rows)
+    print(f"{len(raw):,} linhas")
+
+    start = time.perf_counter()
+    expected = parse_datetimes_rowwise(raw)
+    t_rowwise = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = parse_datetimes(raw).to_numpy()
+    t_vec = time.perf_counter() - start
+
+    same = np.array_equal(expected.view(np.int64), actual.view(np.int64))
+    print(f"apply(fix_date_str) + to_datetime: {t_rowwise:.2f}s | parse_datetimes: {t_vec:.2f}s | "
+          f"{t_rowwise / t_vec:.1f}x | paridade: {same}")
+    if not same:
+        diff = np.flatnonzero(expected.view(np.int64) != actual.view(np.int64))
+        print(pd.DataFrame({'raw': raw.iloc[diff[:10]].values, 'esperado': expected[diff[:10]],
+                            'obtido': actual[diff[:10]]}))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Paridade e benchmark de parse_datetimes")
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    _benchmark(parser.parse_args().rows)
@@ -0,0 +1,110 @@
+# src/python/feature_layout.py
+# Layout "compilado" das features de um modelo: caminho rápido de inferência sem pandas.
+#
+# Para uma previsão de UMA linha, montar um pd.DataFrame custa mais do que o próprio
+# predict(). O FeatureLayout é construído uma vez por modelo (no carregamento, a partir de
+# data["feature_columns"]) e preenche diretamente uma linha NumPy pré-alocada na ordem
+# exata de colunas que o pipeline espera.
+import contextlib
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Tolerância da verificação de paridade entre o caminho rápido e o caminho DataFrame
+PARITY_RTOL = 1e-6
+PARITY_ATOL = 1e-6
+
+
+@contextlib.contextmanager
+def ignore_feature_names_warning():
+    """Silencia o aviso de X sem nomes de colunas durante um predict() com a linha/matriz do layout."""
+    # O pipeline foi treinado com DataFrame; ao receber ndarray o sklearn avisa (a cada chamada)
+    # que X não tem nomes de colunas. A ordem das colunas é garantida pelo layout, então o aviso
+    # é apenas ruído no caminho quente; o filtro vale só durante o predict, não no processo todo.
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+        yield
+
+
+class FeatureLayout:
+    """Mapeia o dicionário de features geradas para um vetor na ordem do modelo.
+
+    As colunas que o modelo espera mas que não são geradas ficam como NaN
+    (mesmo comportamento de prepare_input_for_fastapi_model) e são definidas
+    uma única vez na alocação do buffer.
+    """
+
+    def __init__(self, feature_columns, known_features):
+        self.columns = list(feature_columns)
+        self.n_features = len(self.columns)
+        known = set(known_features)
+        # Pares (posição, nome) das colunas que precisam ser preenchidas a cada chamada
+        self._slots = [(i, col) for i, col in enumerate(self.columns) if col in known]
+        self.missing_columns = [col for col in self.columns if col not in known]
+        # Um buffer por thread: os modelos rodam em paralelo no pool de predição
+        self._local = threading.local()
+        # Só é ativado depois que verify_parity() confirma resultados idênticos
+        self.fast_path_ok = False
+
+    def _row_buffer(self):
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = np.full((1, self.n_features), np.nan, dtype=np.float64)
+            self._local.row = row
+        return row
+
+    def fill_row(self, features):
+        """Preenche (e devolve) a linha pré-alocada desta thread com as features escalares."""
+        row = self._row_buffer()
+        values = row[0]
+        for i, col in self._slots:
+            values[i] = features[col]
+        return row
+
+    def build_matrix(self, features, n_rows):
+        """Monta uma matriz (n_rows x n_features); aceita escalares ou arrays de tamanho n_rows."""
+        matrix = np.full((n_rows, self.n_features), np.nan, dtype=np.float64)
+        for i, col in self._slots:
+            matrix[:, i] = features[col]
+        return matrix
+
+    def predict_one(self, pipeline, features):
+        with ignore_feature_names_warning():
+            return pipeline.predict(self.fill_row(features))
+
+    def predict_many(self, pipeline, features, n_rows):
+        with ignore_feature_names_warning():
+            return pipeline.predict(self.build_matrix(features, n_rows))
+
+    def verify_parity(self, pipeline, sample_features, n_rows):
+        """Compara o caminho rápido com o caminho DataFrame e ativa o primeiro se forem iguais.
+
+        sample_features segue o formato de build_matrix (escalares ou arrays de n_rows).
+        Retorna True se o caminho rápido foi ativado.
+        """
+        self.fast_path_ok = False
+        try:
+            reference_df = pd.DataFrame(
+                {col: sample_features.get(col, np.nan) for col in self.columns},
+                index=pd.RangeIndex(n_rows),
+                columns=self.columns
+            )
+            expected = np.asarray(pipeline.predict(reference_df), dtype=float).ravel()
+            got_many = np.asarray(self.predict_many(pipeline, sample_features, n_rows), dtype=float).ravel()
+
+            got_one = []
+            for r in range(n_rows):
+                row_features = {
+                    col: (value[r] if np.ndim(value) else value)
+                    for col, value in sample_features.items()
+                }
+                got_one.append(float(np.asarray(self.predict_one(pipeline, row_features)).ravel()[0]))
+        except Exception:
+            return False
+
+        same_many = np.allclose(expected, got_many, rtol=PARITY_RTOL, atol=PARITY_ATOL, equal_nan=True)
+        same_one = np.allclose(expected, np.asarray(got_one), rtol=PARITY_RTOL, atol=PARITY_ATOL, equal_nan=True)
+        self.fast_path_ok = bool(same_many and same_one)
+        return self.fast_path_ok
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# src/python/feature_store.py
+"""
+Feature store incremental do treino (save_model.py), em SQLite:
+- Tabela 'features': uma linha por corrida já com merge e features calculadas
+- High-water mark: maior RideID do ride_v2.csv já considerado; a cada execução só as
+  linhas com RideID acima dele são parseadas, cruzadas e featurizadas
+- Corridas novas ainda sem estimativa ou sem distância ficam em 'pending' e são tentadas
+  de novo na próxima execução (ex: rotas.py ainda não calculou a rota)
+- Versão do esquema/features: se mudar, a tabela é reconstruída do zero
+- refresh(): passo completo de atualização, o mesmo para save_model.py e train_models.py
+- Com column_types, os CSVs são lidos do cache colunar tipado (raw_cache.py): o CSV só é
+  convertido de novo quando muda
+- Com batch_rides, as corridas novas são cruzadas, featurizadas e gravadas em lotes por
+  faixa de RideID (junção particionada): a memória depende do lote, não do histórico
+- iter_frames(): leitura em blocos (check_metrics.py e o treino out-of-core do out_of_core.py)
+
+Suposição: RideID cresce com o tempo (corridas novas têm ids maiores).
+"""
+
+import os
+import time
+import logging
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from holiday_calendar import calendar_from_env
+from datetime_parsing import parse_datetimes
+from featurizer import time_features
+from raw_cache import RawCache, read_cached_rows
+
+logger = logging.getLogger("feature_store")
+
+# Incrementar quando featurize() mudar: força a reconstrução da tabela
+# (2: features do featurizer.py, dia da semana Segunda=0 como na API, is_peak_hour;
+#  3: data/hora com fuso mantém a hora local em vez de ir para UTC)
+FEATURE_STORE_VERSION = 3
+DEFAULT_PATH = os.path.join("data", "feature_store.sqlite")
+CSV_CHUNK_ROWS = 500_000
+
+# Colunas calculadas por featurize() (além da chave, preço, distância e duração)
+FEATURE_COLUMNS = ["datetime_ns", "hour_min", "hour_sin", "hour_cos", "weekday", "weekday_sin",
+                   "weekday_cos", "is_peak_hour", "is_holiday", "day", "month", "year"]
+
+
+def featurize(df, datetime_col):
+    """Features de data/hora, cíclicas, de pico e de feriado (featurizer.time_features).
+
+    Devolve (df com FEATURE_COLUMNS, linhas removidas por data/hora inválida).
+    """
+    df = df.copy()
+    # fix_date_str + to_datetime(format ISO 8601), vetorizado (datetime_parsing.py). Formato
+    # fixo e nao inferido do primeiro valor: o resultado de uma linha nao pode depender de
+    # quais outras linhas estao no mesmo lote incremental
+    df["datetime"] = parse_datetimes(df[datetime_col])
+    initial_len = len(df)
+    df = df.dropna(subset=["datetime"])
+    removed = initial_len - len(df)
+
+    holidays = None
+    if len(df):
+        try:
+            # Mesmo calendario da API (main.py), marcado de forma vetorizada (bitmap por dia)
+            holidays = calendar_from_env(first_year=int(df["datetime"].min().year),
+                                         last_year=int(df["datetime"].max().year))
+        except Exception:
+            # Sem fallback para is_holiday=0: as linhas abaixo do high-water mark nunca são
+            # recalculadas, então o erro aborta o lote (nada é gravado) e a próxima execução refaz
+            logger.exception("Erro ao montar o calendário de feriados; lote não gravado.")
+            raise
+    features = time_features(df["datetime"], holidays=holidays)
+    features.setdefault("is_holiday", np.zeros(len(df), dtype=np.int8))
+    for name in FEATURE_COLUMNS[1:]:
+        df[name] = features[name]
+    df["datetime_ns"] = df["datetime"].astype("datetime64[ns]").astype(np.int64)
+    return df, removed
+
+
+def read_csv_rows(path, columns, key, keep, sep=';', column_types=None, key_range=None):
+    """Lê só `columns` do CSV em blocos, mantendo as linhas em que keep(ids numéricos) é True.
+
+    column_types ({coluna: 'id' | 'float' | 'category' | 'datetime'}): lê do cache tipado do
+    raw_cache.py em vez de parsear o CSV; key_range (menor, maior id aceito por keep) encurta
+    a busca no cache quando o CSV está ordenado pela chave.
+    """
+    if column_types is not None:
+        return read_cached_rows(path, columns, key, keep, column_types, sep=sep, key_range=key_range)
+    parts = []
+    for chunk in pd.read_csv(path, sep=sep, usecols=columns, chunksize=CSV_CHUNK_ROWS,
+                             on_bad_lines="warn", low_memory=False):
+        ids = pd.to_numeric(chunk[key], errors="coerce")
+        mask = ids.notna() & keep(ids)
+        if mask.any():
+            chunk = chunk[mask].copy()
+            chunk[key] = ids[mask].astype(np.int64)
+            parts.append(chunk)
+    if not parts:
+        return pd.DataFrame({c: pd.Series(dtype=np.int64 if c == key else object) for c in columns})
+    return pd.concat(parts, ignore_index=True)
+
+
+def _new_ride_batches(rides_csv, key, datetime_col, high_water_mark, column_types, batch_rides):
+    """Corridas com RideID acima do high-water mark: (lotes, CSV ordenado por RideID).
+
+    Sem batch_rides, um lote só. Sempre há ao menos um lote (talvez vazio): os pendentes entram nele.
+    """
+    keep = lambda ids: ids > high_water_mark if high_water_mark is not None else ids.notna()
+    if batch_rides is None:
+        return [read_csv_rows(rides_csv, [key, datetime_col], key, keep=keep, column_types=column_types)], True
+    if column_types is None:
+        raise ValueError("batch_rides exige column_types (lotes lidos do cache colunar dos CSVs).")
+    rides = RawCache(rides_csv, {c: column_types[c] for c in (key, datetime_col)})
+    key_range = (high_water_mark + 1, np.iinfo(np.int64).max) if high_water_mark is not None else None
+
+    def batches():
+        empty = True
+        for rows in rides.iter_rows(key, keep, key_range, block_rows=batch_rides):
+            if len(rows):
+                empty = False
+                yield rides.frame([key, datetime_col], rows, key)
+        if empty:
+            yield rides.frame([key, datetime_col], np.empty(0, dtype=np.int64), key)
+
+    return batches(), rides.is_sorted(key)
+
+
+def refresh(store, rides_csv, datetime_col, estim_csv, estim_columns, read_distances, rebuild=False,
+            column_types=None, batch_rides=None):
+    """Atualiza o store: corridas novas (acima do high-water mark) + pendentes, merge e featurize.
+
+    - estim_columns: colunas do CSV de estimativas gravadas no store (além da chave)
+    - read_distances(ride_ids): DataFrame (chave, distância, duração) dessas corridas
+    - column_types: tipos das colunas dos CSVs (read_csv_rows); None = parsing direto do CSV
+    - batch_rides: processa as corridas novas em lotes de até batch_rides linhas do CSV de
+      corridas, cada um com seu merge e sua gravação (exige column_types). Com o CSV ordenado
+      por RideID, cada lote também avança o high-water mark e só lê a faixa de estimativas
+      dele; fora de ordem, o high-water mark só é gravado no último lote
+    Usado por save_model.py e train_models.py. Devolve as contagens do passo (para os logs).
+    """
+    key = store.key
+    if rebuild:
+        store.reset()
+    high_water_mark = store.high_water_mark()
+    pending = store.pending().rename(columns={"created": datetime_col})
+    stats = {"stored": store.count(), "high_water_mark": high_water_mark, "pending_before": len(pending),
+             "new_rides": 0, "merged": 0, "invalid_datetime": 0, "added": 0, "batches": 0}
+    if len(pending) and column_types is not None and column_types.get(datetime_col) == "datetime":
+        # Pendentes guardam o texto; do cache a data/hora já vem convertida
+        pending[datetime_col] = parse_datetimes(pending[datetime_col])
+
+    # Seleciona apenas as colunas e as linhas necessárias ANTES do merge
+    batches, ordered = _new_ride_batches(rides_csv, key, datetime_col, high_water_mark, column_types, batch_rides)
+    newest, waiting = high_water_mark, []
+    for new_rides in batches:
+        # Pendentes de execuções anteriores são tentados junto com o primeiro lote
+        rides_subset = pd.concat([pending, new_rides], ignore_index=True) if len(pending) else new_rides
+        pending = pending.iloc[:0]
+        wanted = rides_subset[key].unique()
+        key_range = (wanted.min(), wanted.max()) if len(wanted) else None
+        estim_subset = read_csv_rows(estim_csv, [key, *estim_columns], key, keep=lambda ids: ids.isin(wanted),
+                                     column_types=column_types, key_range=key_range)
+        dist_subset = read_distances(wanted)
+        new_df = rides_subset.merge(estim_subset, on=key, how="inner").merge(dist_subset, on=key, how="inner")
+        stats["new_rides"] += len(new_rides)
+        stats["merged"] += len(new_df)
+
+        new_df, invalid = featurize(new_df, datetime_col)
+        stats["invalid_datetime"] += invalid
+
+        # Corridas sem estimativa ou distancia ainda: ficam pendentes para a proxima execucao
+        waiting.append(rides_subset[~rides_subset[key].isin(
+            np.intersect1d(estim_subset[key].unique(), dist_subset[key].unique()))])
+        still_pending = pd.concat(waiting, ignore_index=True)
+        if len(new_rides):
+            batch_newest = int(new_rides[key].max())
+            newest = batch_newest if newest is None else max(newest, batch_newest)
+        # Fora de ordem, um high-water mark parcial pularia corridas de lotes seguintes
+        stats["batches"] += 1
+        store.commit_batch(new_df, still_pending[[key, datetime_col]], newest if ordered else high_water_mark)
+        stats["added"] += len(new_df)
+    if not ordered and newest != high_water_mark:
+        store.commit_batch(new_df.iloc[:0], still_pending[[key, datetime_col]], newest)
+    stats["pending"] = len(still_pending)
+    return stats
+
+
+class FeatureStore:
+    """Tabela de features por corrida + high-water mark + corridas pendentes."""
+
+    def __init__(self, path=DEFAULT_PATH, key="RideID", value_columns=()):
+        self.path = path
+        self.key = key
+        self.columns = [key, *value_columns, *FEATURE_COLUMNS]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pending (ride_id INTEGER PRIMARY KEY, created TEXT)")
+        self._conn.commit()
+        signature = f"{FEATURE_STORE_VERSION}:{','.join(self.columns)}"
+        if self._get_meta("signature") != signature:
+            # Features ou colunas mudaram: reconstrói do zero na próxima atualização
+            self.reset()
+            self._set_meta("signature", signature)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _get_meta(self, name):
+        row = self._conn.execute("SELECT value FROM meta WHERE name=?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def reset(self):
+        """Apaga features, pendentes e high-water mark (a próxima atualização refaz tudo)."""
+        with self._conn:
+            self._conn.execute("DROP TABLE IF EXISTS features")
+            self._conn.execute("DELETE FROM pending")
+            self._conn.execute("DELETE FROM meta WHERE name<>'signature'")
+
+    def high_water_mark(self):
+        """Maior RideID do CSV de corridas já considerado (None = nada ainda)."""
+        value = self._get_meta("high_water_mark")
+        return int(value) if value is not None else None
+
+    def pending(self):
+        """DataFrame (key, created) das corridas que ainda não tinham estimativa/distância."""
+        frame = pd.read_sql_query("SELECT ride_id, created FROM pending", self._conn)
+        return frame.rename(columns={"ride_id": self.key}).astype({self.key: np.int64})
+
+    def count(self):
+        if not self._has_features_table():
+            return 0
+        return self._conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+
+    def _has_features_table(self):
+        return self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='features'").fetchone() is not None
+
+    def commit_batch(self, features, pending, high_water_mark):
+        """Grava numa transação: linhas novas de features, nova lista de pendentes e o high-water mark.
+
+        Linhas de uma corrida já presente são substituídas (a estimativa pode ter várias linhas
+        por corrida; todas entram, como no merge original).
+        """
+        features = features[self.columns]
+        with self._conn:
+            if len(features):
+                if self._has_features_table():
+                    ids = features[self.key].unique().tolist()
+                    for start in range(0, len(ids), 900):
+                        chunk = ids[start:start + 900]
+                        self._conn.execute(f'DELETE FROM features WHERE "{self.key}" IN ({",".join("?" * len(chunk))})',
+                                           chunk)
+                features.to_sql("features", self._conn, if_exists="append", index=False)
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS features_key ON features ("{self.key}")')
+            self._conn.execute("DELETE FROM pending")
+            self._conn.executemany("INSERT OR REPLACE INTO pending (ride_id, created) VALUES (?, ?)",
+                                   [(int(k), None if pd.isna(c) else str(c)) for k, c in pending.itertuples(index=False)])
+            if high_water_mark is not None:
+                self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('high_water_mark', ?)",
+                                   (str(int(high_water_mark)),))
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('updated_at', ?)",
+                               (str(time.time()),))
+
+    def read_frame(self):
+        """Tabela completa, tipada, com a coluna 'datetime' reconstruída."""
+        if not self._has_features_table():
+            return pd.DataFrame(columns=self.columns + ["datetime"])
+        columns = ", ".join(f'"{c}"' for c in self.columns)
+        frame = pd.read_sql_query(f"SELECT {columns} FROM features", self._conn)
+        frame["datetime"] = pd.to_datetime(frame["datetime_ns"].astype(np.int64), unit="ns")
+        return frame
+
+    def iter_frames(self, chunk_rows=CSV_CHUNK_ROWS, columns=None):
+        """Como read_frame, mas em blocos de até chunk_rows linhas (memória limitada).
+
+        columns: só essas colunas do store ('datetime' é reconstruída se datetime_ns vier junto).
+        """
+        if not self._has_features_table():
+            return
+        selected = ", ".join(f'"{c}"' for c in (columns or self.columns))
+        for frame in pd.read_sql_query(f"SELECT {selected} FROM features", self._conn, chunksize=chunk_rows):
+            if "datetime_ns" in frame:
+                frame["datetime"] = pd.to_datetime(frame["datetime_ns"].astype(np.int64), unit="ns")
+            yield frame
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# src/python/featurizer.py
+"""
+Features de data/hora — implementação única para o treino (feature_store.featurize, usado por
+save_model.py e train_models.py), a avaliação (check_metrics.py) e a API (calendar_features.py
+→ main.py):
+- Entrada colunar: um instante (datetime/np.datetime64) ou um array/Series datetime64;
+  saída: dict {feature: array NumPy}, uma posição por instante
+- Aritmética inteira direto sobre os nanossegundos (dia, hora, calendário civil), sem os
+  acessores .dt do pandas: o mesmo código serve 1 linha (requisição) e 10M linhas (treino)
+- Uma só convenção: dia da semana com Segunda=0 (datetime.weekday(), como a API sempre usou),
+  hora fracionária hora + minuto/60, pico às 5–8h e 16–19h
+- is_holiday pelo HolidayCalendar (holiday_calendar.py), se um for passado
+
+NaT não é tratado: remova-os antes (featurize descarta as linhas com data/hora inválida).
+
+Paridade + benchmark: python featurizer.py --rows 10000000
+"""
+
+import time
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Features geradas por time_features (is_holiday só quando há calendário)
+TIME_FEATURES = ["year", "month", "day", "hour_min", "hour_sin", "hour_cos", "weekday",
+                 "weekday_sin", "weekday_cos", "is_peak_hour"]
+PEAK_HOURS = ((5, 8), (16, 19))   # faixas de horário de pico, inclusivas
+
+# Linhas por bloco: os temporários de cada bloco cabem no cache em vez de percorrer a RAM
+CHUNK_ROWS = 1 << 16
+_NS_PER_MINUTE = 60 * 1_000_000_000
+_NS_PER_DAY = 1440 * _NS_PER_MINUTE
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_HOUR_TO_RAD = 2 * np.pi / 24
+_WEEKDAY_TO_RAD = 2 * np.pi / 7
+_EPOCH_WEEKDAY = 3   # 1970-01-01 foi uma quinta-feira (Segunda=0)
+
+
+def _calendar_parts(days, minutes_of_day, select):
+    """Ano, mês, dia, hora, hora fracionária e dia da semana (Segunda=0).
+
+    days: dias desde 1970-01-01; minutes_of_day: minutos desde a meia-noite (arrays NumPy;
+    select=np.where). Uma linha só usa time_features_row.
+    """
+    hour = minutes_of_day // 60
+    hour_min = hour + (minutes_of_day - hour * 60) / 60.0
+    weekday = (days + _EPOCH_WEEKDAY) % 7
+
+    # Calendário civil a partir dos dias (algoritmo civil_from_days, só inteiros)
+    shifted = days + 719468
+    era = shifted // 146097
+    day_of_era = shifted - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    month_index = (5 * day_of_year + 2) // 153                       # março = 0
+    month = select(month_index < 10, month_index + 3, month_index - 9)
+    year = year_of_era + era * 400 + (month <= 2)
+    day = day_of_year - (153 * month_index + 2) // 5 + 1
+    return year, month, day, hour, hour_min, weekday
+
+
+def _is_peak(hour):
+    peak = False
+    for first, last in PEAK_HOURS:
+        peak = peak | ((hour >= first) & (hour <= last))
+    return peak
+
+
+def time_features_row(now):
+    """Features de um único instante (datetime sem fuso), como escalares: caminho da API.
+
+    Lê ano/mês/dia/dia da semana direto do datetime: por requisição isso custa menos que a
+    aritmética de _calendar_parts em int do Python (mesmos valores; paridade no benchmark).
+    """
+    if isinstance(now, np.datetime64):
+        now = pd.Timestamp(now)
+    hour = now.hour
+    hour_min = hour + now.minute / 60.0
+    weekday = now.weekday()
+    hour_rad = hour_min * _HOUR_TO_RAD
+    weekday_rad = weekday * _WEEKDAY_TO_RAD
+    return {
+        "year": now.year, "month": now.month, "day": now.day, "hour_min": hour_min,
+        "hour_sin": np.sin(hour_rad), "hour_cos": np.cos(hour_rad), "weekday": weekday,
+        "weekday_sin": np.sin(weekday_rad), "weekday_cos": np.cos(weekday_rad),
+        "is_peak_hour": int(_is_peak(hour)),
+    }
+
+
+def _fill(nanos, out, start):
+    # Calcula as features de um bloco e grava em out[...][start:start + len(nanos)]
+    stop = start + len(nanos)
+    days = nanos // _NS_PER_DAY
+    minutes_of_day = (nanos - days * _NS_PER_DAY) // _NS_PER_MINUTE
+    year, month, day, hour, hour_min, weekday = _calendar_parts(days, minutes_of_day, np.where)
+    out["year"][start:stop] = year
+    out["month"][start:stop] = month
+    out["day"][start:stop] = day
+    out["hour_min"][start:stop] = hour_min
+    hour_rad = hour_min * _HOUR_TO_RAD
+    np.sin(hour_rad, out=out["hour_sin"][start:stop])
+    np.cos(hour_rad, out=out["hour_cos"][start:stop])
+    out["weekday"][start:stop] = weekday
+    weekday_rad = weekday * _WEEKDAY_TO_RAD
+    np.sin(weekday_rad, out=out["weekday_sin"][start:stop])
+    np.cos(weekday_rad, out=out["weekday_cos"][start:stop])
+    out["is_peak_hour"][start:stop] = _is_peak(hour)
+
+
+def time_features(when, holidays=None, chunk_rows=CHUNK_ROWS):
+    """Features de data/hora de `when` (instante ou coluna datetime64): {feature: array}.
+
+    holidays: HolidayCalendar opcional; com ele o resultado inclui 'is_holiday' (0/1).
+    """
+    if isinstance(when, (datetime.datetime, np.datetime64)):
+        # Um instante: campos lidos do próprio datetime (time_features_row), sem o custo fixo
+        # das ~50 operações NumPy do caminho em bloco
+        row = time_features_row(when)
+        features = {name: np.array([row[name]]) for name in TIME_FEATURES}
+        if holidays is not None:
+            features["is_holiday"] = np.array([holidays.is_holiday(pd.Timestamp(when).date())], dtype=np.int8)
+        return features
+
+    values = np.asarray(when)
+    if values.dtype != "datetime64[ns]":
+        values = values.astype("datetime64[ns]")
+    nanos = values.view(np.int64)
+    n = len(nanos)
+    out = {name: np.empty(n, dtype=np.float64) for name in ("hour_min", "hour_sin", "hour_cos",
+                                                            "weekday_sin", "weekday_cos")}
+    out.update({name: np.empty(n, dtype=np.int64) for name in ("year", "month", "day", "weekday")})
+    out["is_peak_hour"] = np.empty(n, dtype=np.int8)
+    for start in range(0, n, chunk_rows):
+        _fill(nanos[start:start + chunk_rows], out, start)
+    features = {name: out[name] for name in TIME_FEATURES}
+    if holidays is not None:
+        features["is_holiday"] = holidays.is_holiday_array(values)
+    return features
+
+
+# — Paridade + benchmark —
+def time_features_reference(datetimes):
+    """Mesmas features com os acessores .dt do pandas (forma do save_model.py original)."""
+    dt = pd.Series(datetimes).dt
+    hour_min = dt.hour + dt.minute / 60.0
+    hour = dt.hour
+    return {
+        "year": dt.year, "month": dt.month, "day": dt.day, "hour_min": hour_min,
+        "hour_sin": np.sin(hour_min * _HOUR_TO_RAD), "hour_cos": np.cos(hour_min * _HOUR_TO_RAD),
+        "weekday": dt.weekday, "weekday_sin": np.sin(dt.weekday * _WEEKDAY_TO_RAD),
+        "weekday_cos": np.cos(dt.weekday * _WEEKDAY_TO_RAD),
+        "is_peak_hour": (hour.between(5, 8) | hour.between(16, 19)).astype(np.int8),
+    }
+
+
+def _scalar_reference(now):
+    # Forma escalar que a API usava por requisição (calendar_features.compute_calendar_features)
+    hour_rad = (now.hour + now.minute / 60) * _HOUR_TO_RAD
+    weekday_rad = now.weekday() * _WEEKDAY_TO_RAD
+    return {
+        "year": now.year, "month": now.month, "day": now.day, "hour_min": now.hour + now.minute / 60,
+        "hour_sin": np.sin(hour_rad), "hour_cos": np.cos(hour_rad), "weekday": now.weekday(),
+        "weekday_sin": np.sin(weekday_rad), "weekday_cos": np.cos(weekday_rad),
+        "is_peak_hour": int((5 <= now.hour <= 8) or (16 <= now.hour <= 19)),
+    }
+
+
+def _benchmark(n_rows):
+    rng = np.random.default_rng(0)
+    # 1900–2200, com segundos e frações, para cobrir anos bissextos e as viradas de século
+    offsets = rng.integers(-70 * 365 * 86400, 230 * 365 * 86400, n_rows) * 1_000_000_000
+    offsets += rng.integers(0, 1_000_000_000, n_rows)
+    stamps = offsets.view("datetime64[ns]")
+    print(f"{n_rows:,} linhas")
+
+    start = time.perf_counter()
+    expected = time_features_reference(stamps)
+    t_reference = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = time_features(stamps)
+    t_columnar = time.perf_counter() - start
+    mismatched = [name for name in TIME_FEATURES
+                  if not np.array_equal(np.asarray(expected[name]), actual[name])]
+    print(f"pandas .dt: {t_reference:.2f}s | time_features: {t_columnar:.2f}s | "
+          f"{t_reference / t_columnar:.1f}x | paridade: {not mismatched}")
+
+    # Uma linha (requisição da API): igual à forma escalar antiga e ao caminho colunar
+    samples = [datetime.datetime(1999, 12, 31, 0, 0) + datetime.timedelta(minutes=int(m))
+               for m in rng.integers(0, 30 * 365 * 1440, 2_000)]
+    columnar = time_features(np.array(samples, dtype="datetime64[ns]"))
+    for i, now in enumerate(samples):
+        row = time_features_row(now)
+        scalar = _scalar_reference(now)
+        if any(row[name] != scalar[name] or row[name] != columnar[name][i] for name in TIME_FEATURES):
+            mismatched.append(f"1 linha: {now}")
+            break
+    timings = {}
+    for label, fn in (("time_features_row", time_features_row), ("time_features(instante)", time_features),
+                      ("escalar antigo", _scalar_reference)):
+        start = time.perf_counter()
+        for i in range(20_000):
+            fn(samples[i % len(samples)])
+        timings[label] = (time.perf_counter() - start) / 20_000
+    print("1 linha: " + " | ".join(f"{label} {t * 1e6:.1f}µs" for label, t in timings.items()) +
+          f" | paridade: {not mismatched}")
+    if mismatched:
+        print(f"diferenças em: {mismatched}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paridade e benchmark de time_features")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    _benchmark(parser.parse_args().rows)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# src/python/holiday_calendar.py
+# Calendário de feriados local, compartilhado entre o treino (save_model.py) e a API (main.py).
+#
+# Os feriados de um intervalo de anos são pré-calculados na inicialização (sem rede) em um
+# conjunto de datas e em um bitmap por dia. Consultas de uma data são O(1) e a marcação de
+# uma coluna inteira de datas no treino é vetorizada (sem .apply(lambda ...) por linha).
+import datetime
+import os
+import unicodedata
+
+import holidays
+import numpy as np
+import pandas as pd
+
+# Feriados municipais de data fixa que o pacote 'holidays' não cobre: {cidade: [(mes, dia), ...]}
+CITY_HOLIDAYS = {
+    "SAO_PAULO": [(1, 25)],       # Aniversário de São Paulo
+    "RIO_DE_JANEIRO": [(1, 20)],  # Dia de São Sebastião
+}
+
+
+def _normalize_city(city):
+    if not city:
+        return None
+    ascii_name = unicodedata.normalize("NFKD", city).encode("ascii", "ignore").decode("ascii")
+    return ascii_name.strip().upper().replace(" ", "_")
+
+
+class HolidayCalendar:
+    """Índice de feriados (nacionais, estaduais e municipais) para um intervalo de anos.
+
+    - state: sigla da UF (ex: 'SP') para incluir os feriados estaduais.
+    - city: chave de CITY_HOLIDAYS (ex: 'SAO_PAULO') para incluir os feriados municipais.
+    - extra_dates: datas adicionais (date/str 'YYYY-MM-DD') tratadas como feriado.
+    """
+
+    def __init__(self, first_year, last_year, state=None, city=None, extra_dates=()):
+        if last_year < first_year:
+            raise ValueError("last_year deve ser maior ou igual a first_year.")
+        self.first_year = first_year
+        self.last_year = last_year
+        self.state = state
+        self.city = _normalize_city(city)
+        if self.city and self.city not in CITY_HOLIDAYS:
+            raise ValueError(f"Cidade '{city}' sem feriados cadastrados. Opções: {sorted(CITY_HOLIDAYS)}")
+
+        years = list(range(first_year, last_year + 1))
+        dates = set(holidays.Brazil(years=years, subdiv=state).keys())
+        if self.city:
+            for year in years:
+                dates.update(datetime.date(year, month, day) for month, day in CITY_HOLIDAYS[self.city])
+        for extra in extra_dates:
+            extra_date = pd.Timestamp(extra).date()
+            if first_year <= extra_date.year <= last_year:
+                dates.add(extra_date)
+        self.dates = frozenset(dates)
+
+        # Bitmap: posição = dias desde 1º de janeiro de first_year
+        self._origin = np.datetime64(f"{first_year}-01-01", "D")
+        n_days = int((np.datetime64(f"{last_year + 1}-01-01", "D") - self._origin).astype(int))
+        self._bitmap = np.zeros(n_days, dtype=np.int8)
+        if self.dates:
+            offsets = (np.array(sorted(self.dates), dtype="datetime64[D]") - self._origin).astype(int)
+            self._bitmap[offsets] = 1
+
+    def is_holiday(self, date):
+        """0/1 para uma data (date ou datetime). Datas fora do intervalo retornam 0."""
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        return 1 if date in self.dates else 0
+
+    def is_holiday_array(self, values):
+        """Vetorizado: recebe uma Series/array de datetimes e devolve um array int8 de 0/1.
+
+        NaT e datas fora do intervalo do calendário retornam 0.
+        """
+        days = np.asarray(pd.to_datetime(values), dtype="datetime64[ns]").astype("datetime64[D]")
+        offsets = (days - self._origin).astype(np.int64)
+        valid = ~np.isnat(days) & (offsets >= 0) & (offsets < len(self._bitmap))
+        flags = np.zeros(len(days), dtype=np.int8)
+        flags[valid] = self._bitmap[offsets[valid]]
+        return flags
+
+
+def calendar_from_env(first_year=None, last_year=None):
+    """Cria o calendário a partir das variáveis HOLIDAY_FIRST_YEAR, HOLIDAY_LAST_YEAR,
+    HOLIDAY_STATE e HOLIDAY_CITY (os argumentos, se dados, têm prioridade sobre o ambiente).
+
+    Treino e API devem usar a mesma configuração para não haver diferença treino/produção.
+    """
+    current_year = datetime.date.today().year
+    if first_year is None:
+        first_year = int(os.getenv("HOLIDAY_FIRST_YEAR", str(current_year - 10)))
+    if last_year is None:
+        last_year = int(os.getenv("HOLIDAY_LAST_YEAR", str(current_year + 2)))
+    return HolidayCalendar(
+        first_year,
+        last_year,
+        state=os.getenv("HOLIDAY_STATE") or None,
+        city=os.getenv("HOLIDAY_CITY") or None
+    )
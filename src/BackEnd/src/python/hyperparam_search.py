@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+# src/python/hyperparam_search.py
+"""
+Busca de hiperparâmetros do XGBoost para o save_model.py (TUNE_TRIALS > 0):
+- Combinações sorteadas de um espaço configurável (JSON {parâmetro: [valores]}); a ordem do
+  sorteio é fixa, então aumentar o número de tentativas só acrescenta combinações novas
+- Validação cruzada em k folds por hash do RideID (ride_stream.shard_of): as várias
+  estimativas de uma corrida ficam sempre no mesmo fold
+- Early stopping em cada fold, no fold de validação: o número de árvores vem da busca
+- Tabela de features gravada uma vez em .npy (cache_dir) e aberta por memmap nos processos;
+  cada processo monta os QuantileDMatrix de cada fold uma única vez e os reusa em todas as
+  tentativas que executa
+- Tentativas gravadas em SQLite à medida que terminam: uma busca interrompida retoma de onde
+  parou (chave = assinatura dos dados + parâmetros)
+- Latência do predict de 1 linha no formato da API (compiled_trees), medida depois da busca,
+  sem tentativas concorrentes na máquina; o relatório mostra a fronteira erro × latência e a
+  escolha é o modelo mais barato que atinge target_rmse (ou o de menor erro)
+
+Uso: TUNE_TRIALS=40 TUNE_TARGET_RMSE=2.5 python save_model.py
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import xgboost as xgb
+
+from compiled_trees import compile_model
+from ride_stream import shard_of
+
+DEFAULT_DB_PATH = os.path.join("data", "hyperparam_trials.sqlite")
+DEFAULT_CACHE_DIR = os.path.join("data", "hyperparam_cache")
+RANDOM_STATE = 42
+MAX_ROUNDS = 2000
+EARLY_STOPPING_ROUNDS = 30
+LATENCY_ROWS = 300
+
+# Espaço padrão (max_bin não entra: é fixado na construção dos QuantileDMatrix em cache)
+DEFAULT_SEARCH_SPACE = {
+    "max_depth": [3, 4, 5, 6, 8],
+    "learning_rate": [0.03, 0.05, 0.1, 0.2],
+    "min_child_weight": [1, 5, 20],
+    "subsample": [0.7, 0.8, 1.0],
+    "colsample_bytree": [0.7, 0.8, 1.0],
+    "reg_lambda": [0.5, 1.0, 5.0],
+}
+BASE_PARAMS = {"objective": "reg:squarederror", "eval_metric": "rmse", "seed": RANDOM_STATE}
+
+
+def load_search_space(path=None):
+    """Espaço de busca do arquivo JSON em path ou DEFAULT_SEARCH_SPACE."""
+    if not path:
+        return dict(DEFAULT_SEARCH_SPACE)
+    with open(path, encoding="utf-8") as f:
+        space = json.load(f)
+    if not isinstance(space, dict) or not all(isinstance(v, list) and v for v in space.values()):
+        raise ValueError(f"'{path}' deve ter o formato {{parâmetro: [valores]}}.")
+    if "max_bin" in space:
+        raise ValueError("max_bin não pode ser buscado (os QuantileDMatrix em cache usam um valor fixo).")
+    return space
+
+
+def sample_trials(space, n_trials, seed=RANDOM_STATE):
+    """n_trials combinações distintas do produto cartesiano do espaço, em ordem fixa por seed.
+
+    A ordem vem de uma permutação completa: com mais tentativas, as primeiras continuam as mesmas.
+    """
+    names = sorted(space)
+    sizes = [len(space[name]) for name in names]
+    order = np.random.default_rng(seed).permutation(int(np.prod(sizes)))[:n_trials]
+    trials = []
+    for index in order:
+        params, index = {}, int(index)
+        for name, size in zip(reversed(names), reversed(sizes)):
+            index, position = divmod(index, size)
+            params[name] = space[name][position]
+        trials.append({name: params[name] for name in names})
+    return trials
+
+
+class TrialStore:
+    """Tentativas já avaliadas (SQLite), por assinatura dos dados + parâmetros."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trials ("
+            " signature TEXT, params TEXT, cv_rmse REAL, cv_rmse_std REAL, rounds INTEGER,"
+            " seconds REAL, model BLOB, latency_p50_us REAL, latency_p95_us REAL, finished_at REAL,"
+            " PRIMARY KEY (signature, params))")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def done(self, signature):
+        """{params_json: linha} das tentativas já gravadas para esta assinatura."""
+        cursor = self._conn.execute(
+            "SELECT params, cv_rmse, cv_rmse_std, rounds, seconds, latency_p50_us, latency_p95_us "
+            "FROM trials WHERE signature=?", (signature,))
+        names = ["params", "cv_rmse", "cv_rmse_std", "rounds", "seconds", "latency_p50_us", "latency_p95_us"]
+        return {row[0]: dict(zip(names, row)) for row in cursor}
+
+    def save(self, signature, key, result):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO trials (signature, params, cv_rmse, cv_rmse_std, rounds, seconds, model,"
+                " finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (signature, key, result["cv_rmse"], result["cv_rmse_std"], result["rounds"], result["seconds"],
+                 result["model"], time.time()))
+
+    def missing_latency(self, signature):
+        return self._conn.execute("SELECT params, model FROM trials WHERE signature=? AND latency_p50_us IS NULL",
+                                  (signature,)).fetchall()
+
+    def save_latency(self, signature, key, p50_us, p95_us):
+        with self._conn:
+            self._conn.execute("UPDATE trials SET latency_p50_us=?, latency_p95_us=? WHERE signature=? AND params=?",
+                               (p50_us, p95_us, signature, key))
+
+
+def data_signature(X, y, folds, n_folds):
+    """Hash dos dados e das regras da busca: outra tabela ou outro k não reaproveita tentativas."""
+    digest = hashlib.sha1()
+    for array in (X, y, folds):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(json.dumps([n_folds, MAX_ROUNDS, EARLY_STOPPING_ROUNDS, BASE_PARAMS]).encode())
+    return digest.hexdigest()
+
+
+def write_cache(cache_dir, signature, X, y, folds, feature_names):
+    """Grava X/y/folds em cache_dir/<assinatura>/ (uma vez) e apaga caches de outras assinaturas."""
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in os.listdir(cache_dir):
+        if name != signature:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+    path = os.path.join(cache_dir, signature)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "X.npy"), X)
+        np.save(os.path.join(path, "y.npy"), y)
+        np.save(os.path.join(path, "folds.npy"), folds)
+        # meta.json por último: marca o cache como completo
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"feature_names": list(feature_names)}, f)
+    return path
+
+
+# Estado de cada processo da busca: dados em memmap e QuantileDMatrix por fold (montados sob demanda)
+_worker = {}
+
+
+def _init_worker(cache_path, nthread):
+    with open(os.path.join(cache_path, "meta.json"), encoding="utf-8") as f:
+        feature_names = json.load(f)["feature_names"]
+    folds = np.load(os.path.join(cache_path, "folds.npy"))
+    _worker.clear()
+    _worker.update(
+        X=np.load(os.path.join(cache_path, "X.npy"), mmap_mode="r"),
+        y=np.load(os.path.join(cache_path, "y.npy"), mmap_mode="r"),
+        folds=folds, fold_ids=np.unique(folds), feature_names=feature_names, nthread=nthread, matrices={},
+    )
+
+
+def _fold_matrices(fold):
+    if fold not in _worker["matrices"]:
+        valid = _worker["folds"] == fold
+        X, y, names = _worker["X"], _worker["y"], _worker["feature_names"]
+        train = xgb.QuantileDMatrix(X[~valid], y[~valid], feature_names=names, nthread=_worker["nthread"])
+        _worker["matrices"][fold] = (train, xgb.QuantileDMatrix(X[valid], y[valid], feature_names=names, ref=train,
+                                                                 nthread=_worker["nthread"]))
+    return _worker["matrices"][fold]
+
+
+def run_trial(key):
+    """CV com early stopping de uma combinação (params em JSON); roda num processo da busca."""
+    started = time.perf_counter()
+    params = {**BASE_PARAMS, **json.loads(key), "nthread": _worker["nthread"]}
+    scores, rounds, first = [], [], None
+    for fold in _worker["fold_ids"]:
+        train, valid = _fold_matrices(fold)
+        booster = xgb.train(params, train, num_boost_round=MAX_ROUNDS, evals=[(valid, "valid")],
+                            early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+        scores.append(booster.best_score)
+        rounds.append(booster.best_iteration + 1)
+        if first is None:
+            first = booster
+    n_rounds = int(round(np.mean(rounds)))
+    # Modelo do 1º fold com o nº de árvores escolhido: só para medir a latência depois
+    model = first[:min(n_rounds, first.num_boosted_rounds())]
+    return key, {"cv_rmse": float(np.mean(scores)), "cv_rmse_std": float(np.std(scores)), "rounds": n_rounds,
+                 "seconds": time.perf_counter() - started, "model": bytes(model.save_raw(raw_format="ubj"))}
+
+
+class _BoosterModel:
+    # compile_model só precisa de get_booster()
+    def __init__(self, booster):
+        self._booster = booster
+
+    def get_booster(self):
+        return self._booster
+
+
+def predict_latency(model_bytes, feature_names, rows):
+    """Percentis 50/95 (µs) do predict de 1 linha do modelo compilado, como no /predict da API."""
+    booster = xgb.Booster()
+    booster.load_model(bytearray(model_bytes))
+    compiled = compile_model(_BoosterModel(booster), feature_names)
+    for row in rows[:20]:
+        compiled.predict(row[None, :])
+    timings = []
+    for row in rows:
+        start = time.perf_counter()
+        compiled.predict(row[None, :])
+        timings.append(time.perf_counter() - start)
+    return float(np.percentile(timings, 50) * 1e6), float(np.percentile(timings, 95) * 1e6)
+
+
+def search(X, y, ride_ids, n_trials, n_folds=5, workers=0, space=None, target_rmse=None,
+           db_path=DEFAULT_DB_PATH, cache_dir=DEFAULT_CACHE_DIR, log=print):
+    """Executa (ou retoma) a busca e devolve (escolhida, tentativas ordenadas por latência).
+
+    X: DataFrame de features; y: target; ride_ids: RideID de cada linha (define os folds).
+    Cada tentativa: params, cv_rmse, cv_rmse_std, rounds (nº de árvores), latency_p50_us,
+    latency_p95_us e pareto (nenhuma outra é mais rápida e mais precisa ao mesmo tempo).
+    """
+    feature_names = list(X.columns)
+    X = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    y = np.ascontiguousarray(np.asarray(y, dtype=np.float32))
+    folds = shard_of(np.asarray(ride_ids), n_folds)
+    if len(np.unique(folds)) < 2:
+        raise ValueError("A validação cruzada precisa de corridas em pelo menos 2 folds.")
+    signature = data_signature(X, y, folds, n_folds)
+    cache_path = write_cache(cache_dir, signature, X, y, folds, feature_names)
+    keys = [json.dumps(params, sort_keys=True) for params in sample_trials(space or DEFAULT_SEARCH_SPACE, n_trials)]
+
+    with TrialStore(db_path) as store:
+        pending = [key for key in keys if key not in store.done(signature)]
+        log(f"   → {len(keys) - len(pending)} tentativas ja avaliadas (retomada), {len(pending)} a executar")
+        if pending:
+            cores = os.cpu_count() or 1
+            workers = min(workers or cores, len(pending))
+            nthread = max(1, cores // workers)
+            started = time.perf_counter()
+            # spawn, como no train_models.py: cada processo começa limpo (sem threads OpenMP
+            # herdadas) e funciona igual em todas as plataformas; o save_model.py tem main()
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(cache_path, nthread))
+            results = (future.result() for future in as_completed([pool.submit(run_trial, key)
+                                                                   for key in pending]))
+            try:
+                for finished, (key, result) in enumerate(results, 1):
+                    # Gravada assim que termina: uma interrupção perde só as tentativas em andamento
+                    store.save(signature, key, result)
+                    log(f"   [{finished}/{len(pending)}] {key}: CV RMSE {result['cv_rmse']:.4f} "
+                        f"± {result['cv_rmse_std']:.4f}, {result['rounds']} arvores ({result['seconds']:.1f}s)")
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+            log(f"   → {len(pending)} tentativas em {time.perf_counter() - started:.1f}s "
+                f"({workers} processos x {nthread} threads)")
+
+        # Latência depois da busca, sem outras tentativas disputando a CPU
+        rows = X[np.random.default_rng(RANDOM_STATE).choice(len(X), min(LATENCY_ROWS, len(X)), replace=False)]
+        for key, model in store.missing_latency(signature):
+            store.save_latency(signature, key, *predict_latency(model, feature_names, rows))
+        done = store.done(signature)
+
+    trials = [{**done[key], "params": json.loads(key)} for key in keys]
+    trials.sort(key=lambda trial: (trial["latency_p50_us"], trial["cv_rmse"]))
+    best_rmse = np.inf
+    for trial in trials:
+        trial["pareto"] = trial["cv_rmse"] < best_rmse
+        best_rmse = min(best_rmse, trial["cv_rmse"])
+    return choose(trials, target_rmse), trials
+
+
+def choose(trials, target_rmse=None):
+    """A de menor latência com cv_rmse <= target_rmse; sem alvo (ou se nenhuma atinge), a de menor erro."""
+    if target_rmse is not None:
+        meeting = [trial for trial in trials if trial["cv_rmse"] <= target_rmse]
+        if meeting:
+            return min(meeting, key=lambda trial: trial["latency_p50_us"])
+    return min(trials, key=lambda trial: trial["cv_rmse"])
+
+
+def format_report(trials, chosen, limit=15):
+    """Tabela erro × latência: a fronteira de Pareto primeiro, depois as demais mais precisas."""
+    frontier = [trial for trial in trials if trial["pareto"]]
+    others = sorted((trial for trial in trials if not trial["pareto"]), key=lambda trial: trial["cv_rmse"])
+    lines = [f"{'':2}{'CV RMSE':>9} {'±':>7} {'arvores':>7} {'p50 µs':>8} {'p95 µs':>8}  parametros"]
+    for trial in (frontier + others)[:limit]:
+        mark = "→" if trial is chosen else ("*" if trial["pareto"] else " ")
+        lines.append(f"{mark:2}{trial['cv_rmse']:9.4f} {trial['cv_rmse_std']:7.4f} {trial['rounds']:7d} "
+                     f"{trial['latency_p50_us']:8.1f} {trial['latency_p95_us']:8.1f}  "
+                     f"{json.dumps(trial['params'], sort_keys=True)}")
+    lines.append("(* fronteira erro x latencia; → escolhida)")
+    return "\n".join(lines)
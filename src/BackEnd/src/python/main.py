@@ -1,62 +1,102 @@
 # src/python/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi.responses import PlainTextResponse, JSONResponse
 from pydantic import BaseModel, Field
 import numpy as np
-import joblib # Usar joblib para carregar os modelos .pkl
 import time
+import os
+import logging
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import datetime # Para gerar features de data/hora atuais
-# 'requests' para BrasilAPI, se a função get_holiday_info for usada aqui
-import requests 
 import pandas as pd
+from typing import List, Optional
+from feature_layout import FeatureLayout, ignore_feature_names_warning
+from calendar_features import CalendarFeatureProvider, compute_calendar_features, DEFAULT_BUCKET_SECONDS
+from featurizer import time_features
+from holiday_calendar import calendar_from_env
+from prediction_cache import PredictionCache, LocalSharedBackend
+from metrics import MetricsRegistry
+from model_registry import ModelRegistry
+from route_cache import route_cache_from_env
 
-# --- Funções Auxiliares (Copie do seu Bloco 5 de previsão) ---
-# É importante que estas funções sejam consistentes com as usadas na previsão offline
-def get_holiday_info_api(target_year): # Renomeada para evitar conflito se você tiver outra
-    today = datetime.date.today()
-    if target_year != today.year: return 0
-    try:
-        # Substitua por sua lógica real de API de feriados se necessário
-        # Exemplo simplificado, pode não funcionar sem 'requests' e uma API real
-        # response = requests.get(f"https://brasilapi.com.br/api/feriados/v1/{target_year}", timeout=2)
-        # response.raise_for_status()
-        # feriados = response.json()
-        # return 1 if any(f.get('date') == today.strftime('%Y-%m-%d') for f in feriados) else 0
-        print("AVISO: get_holiday_info_api usando mock (retornando 0). Implemente com API real se necessário.")
-        return 0 # Mock para rodar sem a API
-    except Exception:
-        return 0
+# Logging com níveis no lugar de print(): o detalhe por requisição/modelo fica em DEBUG
+# (desligado por padrão) e não custa nada no caminho quente. Ajuste com LOG_LEVEL=DEBUG.
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)s %(name)s: %(message)s',
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger("ml_api")
 
-def prepare_input_for_fastapi_model(
+# Métricas de latência (perf_counter) expostas em /metrics no formato do Prometheus
+metrics_registry = MetricsRegistry()
+FEATURE_PREP_LATENCY = metrics_registry.histogram(
+    "ml_api_feature_prep_seconds", "Tempo de montagem do input de cada modelo.")
+MODEL_PREDICT_LATENCY = metrics_registry.histogram(
+    "ml_api_model_predict_seconds", "Tempo do predict() de cada modelo.")
+REQUEST_LATENCY = metrics_registry.histogram(
+    "ml_api_request_seconds", "Tempo total de cada requisição de previsão.")
+PREDICTION_ERRORS = metrics_registry.counter(
+    "ml_api_prediction_errors_total", "Previsões que falharam ou retornaram valor inválido.")
+
+# --- Funções Auxiliares ---
+# As features de data/hora vêm do featurizer.py, a mesma implementação usada no treino
+# (save_model.py / train_models.py) e na avaliação (check_metrics.py)
+
+# Calendário de feriados local, o mesmo usado no treino: pré-calculado na inicialização,
+# consulta O(1) e sem chamadas de rede. Configurável por HOLIDAY_STATE / HOLIDAY_CITY.
+holiday_calendar = calendar_from_env()
+
+def _holiday_lookup_api(date):
+    return holiday_calendar.is_holiday(date)
+
+# Features de calendário compartilhadas entre modelos e requisições, recalculadas
+# uma vez por balde de tempo (padrão: 1 minuto)
+calendar_provider = CalendarFeatureProvider(
+    _holiday_lookup_api,
+    bucket_seconds=int(os.getenv("CALENDAR_BUCKET_SECONDS", str(DEFAULT_BUCKET_SECONDS)))
+)
+
+def generate_request_features(
     distance_m_user, duration_s_user,
-    expected_column_names_model, # Lista de colunas que o pipeline específico espera
-    target_subcategory_for_big_model=None # Ex: 'uberx', para a feature 'subcategory_feature' do Modelão
+    target_subcategory_for_big_model=None, # Ex: 'uberx', para a feature 'subcategory_feature' do Modelão
+    now=None, # Permite fixar a data/hora (ex: verificação de paridade); padrão: balde atual do cache
+    calendar=None # Features de calendário já obtidas do calendar_provider nesta requisição
 ):
-    now = datetime.datetime.now()
-    current_year = now.year
-    current_month = now.month
-    current_weekday_num = now.weekday()
-    current_hour_of_day = now.hour
-    current_minute = now.minute
-
-    is_holiday_val = get_holiday_info_api(current_year)
-    hour_rad = (current_hour_of_day + current_minute / 60) * (2 * np.pi / 24)
-    weekday_rad = current_weekday_num * (2 * np.pi / 7)
-    is_peak = ((5 <= current_hour_of_day <= 8) or (16 <= current_hour_of_day <= 19))
-    
+    # Gera o dicionário {feature: valor} da requisição. distance/duration podem ser
+    # escalares (uma viagem) ou arrays (lote); as features de data/hora são escalares.
+    if calendar is None:
+        if now is None:
+            calendar = calendar_provider.get()
+        else:
+            calendar = compute_calendar_features(now, _holiday_lookup_api)
+
     generated_features = {
         'distance_m': distance_m_user,
         'duration_s': duration_s_user,
-        'year': current_year,
-        'month': current_month,
-        'is_holiday': is_holiday_val,
-        'hour_sin': np.sin(hour_rad),
-        'hour_cos': np.cos(hour_rad),
-        'weekday_sin': np.sin(weekday_rad),
-        'weekday_cos': np.cos(weekday_rad),
-        'is_peak_hour': int(is_peak)
+        **calendar
     }
     if target_subcategory_for_big_model: # Se estiver usando um Modelão que espera esta feature
         generated_features['subcategory_feature'] = target_subcategory_for_big_model
+    return generated_features
+
+# Features numéricas geradas por generate_request_features (usadas pelo FeatureLayout)
+NUMERIC_REQUEST_FEATURES = [
+    'distance_m', 'duration_s', 'year', 'month', 'is_holiday',
+    'hour_sin', 'hour_cos', 'weekday_sin', 'weekday_cos', 'is_peak_hour'
+]
+
+def prepare_input_for_fastapi_model(
+    distance_m_user, duration_s_user,
+    expected_column_names_model, # Lista de colunas que o pipeline específico espera
+    target_subcategory_for_big_model=None, # Ex: 'uberx', para a feature 'subcategory_feature' do Modelão
+    generated_features=None # Features já geradas para esta requisição (evita recalcular por modelo)
+):
+    if generated_features is None:
+        generated_features = generate_request_features(
+            distance_m_user, duration_s_user, target_subcategory_for_big_model
+        )
     
     input_dict = {}
     missing_cols_debug_api = []
@@ -70,10 +110,55 @@ def prepare_input_for_fastapi_model(
             input_dict[col_expected] = np.nan # Ou um valor default mais apropriado
     
     if missing_cols_debug_api:
-        print(f"    ALERTA API (prepare_input): Colunas esperadas pelo modelo mas não geradas: {missing_cols_debug_api}. Usando NaN.")
+        logger.warning("prepare_input: colunas esperadas pelo modelo mas não geradas: %s. Usando NaN.", missing_cols_debug_api)
             
     return pd.DataFrame([input_dict], columns=expected_column_names_model)
 
+def prepare_batch_input_for_fastapi_model(
+    distances_m_user, durations_s_user,
+    expected_column_names_model,
+    target_subcategory_for_big_model=None,
+    generated_features=None
+):
+    # Versão em lote de prepare_input_for_fastapi_model: monta UMA matriz (N linhas)
+    # por modelo. As features de data/hora são as mesmas para todas as viagens do lote,
+    # então são calculadas uma vez e replicadas (broadcast) pelo pandas.
+    distances = np.asarray(distances_m_user, dtype=float)
+    durations = np.asarray(durations_s_user, dtype=float)
+    n_rows = len(distances)
+
+    if generated_features is None:
+        generated_features = generate_request_features(
+            distances, durations, target_subcategory_for_big_model
+        )
+
+    missing_cols_debug_api = [c for c in expected_column_names_model if c not in generated_features]
+    if missing_cols_debug_api:
+        logger.warning("prepare_batch_input: colunas esperadas pelo modelo mas não geradas: %s. Usando NaN.", missing_cols_debug_api)
+
+    columns_data = {
+        col: generated_features.get(col, np.nan) for col in expected_column_names_model
+    }
+    return pd.DataFrame(columns_data, index=pd.RangeIndex(n_rows), columns=expected_column_names_model)
+
+def _parity_sample_features():
+    # Amostra fixa (várias distâncias/durações, horários e dias) para comparar o caminho
+    # rápido (FeatureLayout) com o caminho DataFrame no carregamento de cada modelo.
+    sample_points = [
+        (datetime.datetime(2024, 1, 1, 0, 0), 800.0, 120.0),
+        (datetime.datetime(2024, 3, 15, 7, 45), 5200.0, 900.0),
+        (datetime.datetime(2024, 7, 20, 13, 10), 14000.0, 1800.0),
+        (datetime.datetime(2024, 11, 30, 18, 30), 38000.0, 3600.0),
+    ]
+    # Todas as amostras de uma vez pelo caminho colunar do featurizer (o mesmo do treino)
+    when = np.array([dt for dt, _, _ in sample_points], dtype="datetime64[ns]")
+    features = {
+        **time_features(when, holidays=holiday_calendar),
+        'distance_m': np.array([dist for _, dist, _ in sample_points], dtype=float),
+        'duration_s': np.array([dur for _, _, dur in sample_points], dtype=float),
+    }
+    return {col: np.asarray(features[col], dtype=float) for col in NUMERIC_REQUEST_FEATURES}, len(sample_points)
+
 # --- Fim das Funções Auxiliares ---
 
 
@@ -89,32 +174,63 @@ MODEL_FILES = {
     # "MODELAO_RF": "MODELAO_Random_Forest.pkl" 
 }
 
-# Dicionário para armazenar os modelos carregados e suas features esperadas
-loaded_models_dict = {}
+def _prepare_model_entry(model_key_name, data):
+    # Converte o conteúdo do .pkl na entrada usada pela API. As previsões da verificação de
+    # paridade também aquecem o modelo antes de ele receber tráfego.
+    # Layout compilado das features: caminho rápido sem DataFrame, ativado
+    # apenas se der exatamente o mesmo resultado que o caminho DataFrame.
+    layout = FeatureLayout(data["feature_columns"], NUMERIC_REQUEST_FEATURES)
+    parity_features, parity_rows = _parity_sample_features()
+    layout.verify_parity(data["pipeline"], parity_features, parity_rows)
+    # Previsão de teste: um artefato que não gera preços finitos não entra em produção
+    smoke_input = prepare_batch_input_for_fastapi_model(
+        parity_features['distance_m'], parity_features['duration_s'],
+        expected_column_names_model=data["feature_columns"],
+        generated_features=parity_features
+    )
+    smoke_predictions = np.asarray(data["pipeline"].predict(smoke_input), dtype=float).ravel()
+    if len(smoke_predictions) != parity_rows or not np.isfinite(smoke_predictions).all():
+        raise ValueError(f"Previsão de teste inválida para '{model_key_name}': {smoke_predictions}")
+    logger.info("Modelo '%s': features esperadas: %d. Caminho rápido (sem pandas): %s.",
+                model_key_name, len(data['feature_columns']),
+                'ativo' if layout.fast_path_ok else 'inativo (usando DataFrame)')
+    return {
+        "pipeline": data["pipeline"],
+        "features": data["feature_columns"], # A lista de colunas salva com o pipeline
+        "layout": layout
+    }
 
-print("--- Carregando Modelos Para API ---")
-for model_key_name, pkl_filename in MODEL_FILES.items():
-    try:
-        # Assumindo que os arquivos .pkl estão no mesmo diretório ou em 'modelos_exportados/'
-        # Ajuste o caminho se necessário, ex: f"modelos_exportados/{pkl_filename}"
-        full_path = f"modelos_final/{pkl_filename}" # << AJUSTE O CAMINHO SE NECESSÁRIO
-        with open(full_path, "rb") as f:
-            data = joblib.load(f) # Usar joblib se salvou com joblib
-        
-        loaded_models_dict[model_key_name] = {
-            "pipeline": data["pipeline"],
-            "features": data["feature_columns"] # A lista de colunas salva com o pipeline
-        }
-        print(f"  Modelo '{model_key_name}' ({pkl_filename}) carregado. Features esperadas: {len(data['feature_columns'])}.")
-    except FileNotFoundError:
-        print(f"  ERRO CRÍTICO: Arquivo do modelo '{full_path}' não encontrado.")
-        # Você pode decidir encerrar a aplicação se um modelo crucial não for encontrado
-        # ou apenas logar e continuar (o modelo não estará disponível para previsão).
-    except Exception as e:
-        print(f"  ERRO CRÍTICO ao carregar o modelo '{pkl_filename}': {type(e).__name__} - {e}")
+# Registro dos modelos: carregamento paralelo em segundo plano (a API sobe na hora e
+# /health/ready indica quando os modelos estão prontos).
+# MODEL_MMAP_MODE=r compartilha os arrays dos modelos entre workers do uvicorn pelo page cache.
+# MODEL_LOAD_MODE=eager volta a carregar tudo de forma bloqueante na importação.
+# MODEL_FORMAT=auto usa o <modelo>.trees.npz gerado por compiled_trees.py quando existir
+# (árvores em arrays, sem xgboost/sklearn no predict); MODEL_FORMAT=pickle força os .pkl.
+MODEL_DIR = os.getenv("MODEL_DIR", "modelos_final") # << AJUSTE O CAMINHO SE NECESSÁRIO
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background").lower()
+model_registry = ModelRegistry(
+    MODEL_DIR,
+    MODEL_FILES,
+    _prepare_model_entry,
+    mmap_mode=os.getenv("MODEL_MMAP_MODE") or None,
+    max_workers=int(os.getenv("MODEL_LOAD_WORKERS", "0")) or None,
+    require_all=os.getenv("MODEL_REQUIRE_ALL", "0") == "1",
+    prefer_compiled=os.getenv("MODEL_FORMAT", "auto").lower() != "pickle"
+)
+
+if MODEL_LOAD_MODE == "eager":
+    model_registry.load_all()
+else:
+    model_registry.start_background_load()
 
-if not loaded_models_dict:
-    print("ALERTA: Nenhum modelo foi carregado com sucesso. O endpoint /predict não funcionará corretamente.")
+# Recarga a quente: com MODEL_WATCH_INTERVAL > 0 (segundos) o diretório dos modelos é
+# verificado periodicamente e um .pkl alterado é testado e trocado sem reiniciar a API.
+# As rotas /admin/models/... fazem o mesmo sob demanda, com o cabeçalho X-Admin-Token; sem
+# ADMIN_TOKEN definido, as rotas /admin ficam desativadas (403).
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+if MODEL_WATCH_INTERVAL > 0:
+    model_registry.start_watching(MODEL_WATCH_INTERVAL)
 
 # Define o Pydantic Model para o payload do Node.js
 # Este payload SÓ precisa de distância e duração, o resto será gerado no Python.
@@ -123,70 +239,406 @@ class PredictRequest(BaseModel):
     tempo_estim_segundos: float = Field(..., alias='tempo_estim_segundos')
     # Não precisamos mais das features de data/hora aqui, pois serão geradas no Python
 
-app = FastAPI()
+# Payload do /predict/batch: lista de viagens no mesmo formato do /predict
+class PredictBatchRequest(BaseModel):
+    trips: List[PredictRequest]
 
-@app.post("/predict")
-async def predict_prices(req: PredictRequest):
-    if not loaded_models_dict:
-         raise HTTPException(status_code=503, detail="Serviço de modelos indisponível (nenhum modelo carregado).")
+# Limite de viagens por chamada do /predict/batch (protege a memória do serviço)
+MAX_BATCH_SIZE = 10000
 
-    print(f"INFO: Requisição recebida em /predict com payload: {req.dict(by_alias=True)}")
-    
-    predictions = {}
-    distance = req.distancia_m
-    duration = req.tempo_estim_segundos
+# --- Execução dos modelos fora do event loop ---
+# "concurrent": cada modelo roda em uma thread do pool e os resultados são reunidos
+#               (latência ~ modelo mais lento, em vez da soma dos cinco).
+# "sequential": os modelos rodam em série, mas ainda em uma thread do pool,
+#               para não bloquear o event loop do FastAPI.
+# Threads (e não processos) porque os pipelines já estão na memória deste processo
+# e o predict() do numpy/sklearn/XGBoost libera o GIL na maior parte do tempo.
+PREDICT_EXECUTION_MODE = os.getenv("PREDICT_EXECUTION_MODE", "concurrent").lower()
+PREDICT_MAX_WORKERS = int(os.getenv("PREDICT_MAX_WORKERS", str(max(1, len(MODEL_FILES)))))
+model_executor = ThreadPoolExecutor(max_workers=PREDICT_MAX_WORKERS, thread_name_prefix="predict")
 
-    start_time_total = time.time()
+if PREDICT_EXECUTION_MODE not in ("concurrent", "sequential"):
+    logger.warning("PREDICT_EXECUTION_MODE='%s' desconhecido. Usando 'concurrent'.", PREDICT_EXECUTION_MODE)
+    PREDICT_EXECUTION_MODE = "concurrent"
 
-    for model_name, model_data in loaded_models_dict.items():
-        pipeline = model_data["pipeline"]
-        expected_features_list = model_data["features"]
-        
-        print(f"  INFO: Preparando input para o modelo '{model_name}'...")
+def _predict_single_trip_with_model(model_name, model_data, features):
+    # Roda UM modelo para UMA viagem. `features` vem de generate_request_features e é
+    # gerado uma vez por requisição para todos os modelos.
+    # Retorna o preço arredondado ou None em caso de erro.
+    pipeline = model_data["pipeline"]
+    expected_features_list = model_data["features"]
+    layout = model_data["layout"]
+
+    logger.debug("Preparando input para o modelo '%s'...", model_name)
+    start_prep_time = time.perf_counter()
+    if layout.fast_path_ok:
+        # Caminho rápido: preenche a linha NumPy pré-alocada, sem DataFrame
+        model_input = layout.fill_row(features)
+    else:
         # Se este modelo for um "Modelão" que espera 'subcategory_feature',
         # você precisaria passar o 'target_subcategory_for_big_model' apropriado.
         # Para modelos individuais, target_subcategory_for_big_model é None.
-        
-        # Exemplo: Se você tivesse um MODELAO_RF e quisesse prever como se fosse 'uberX'
-        # target_subcat = None
-        # if model_name == "MODELAO_RF": # Ou qualquer nome que você deu ao seu modelão
-        #     target_subcat = "uberX" # Ou outra subcategoria base para a previsão do modelão
-
-        input_df = prepare_input_for_fastapi_model(
-            distance, 
-            duration,
-            expected_column_names_model=expected_features_list
-            # target_subcategory_for_big_model=target_subcat # Descomente e ajuste se tiver um modelão
+        model_input = prepare_input_for_fastapi_model(
+            features['distance_m'],
+            features['duration_s'],
+            expected_column_names_model=expected_features_list,
+            generated_features=features
         )
-        
-        # print(f"    DEBUG: Input DF para '{model_name}':\n{input_df.to_string()}")
-
-        try:
-            print(f"  INFO: Chamando predict() para '{model_name}'...")
-            start_predict_time = time.time()
-            prediction_array = pipeline.predict(input_df)
-            end_predict_time = time.time()
-            print(f"  INFO: Predição para '{model_name}' concluída em {end_predict_time - start_predict_time:.4f}s.")
-
-            if prediction_array is None or len(prediction_array) == 0 or not np.isfinite(prediction_array[0]):
-                print(f"  ERRO: Predição inválida para '{model_name}': {prediction_array}")
-                predictions[model_name] = None # Ou "Erro"
-            else:
-                predictions[model_name] = round(float(prediction_array[0]), 2)
-        except Exception as e:
-            print(f"  ERRO ao prever com o modelo '{model_name}': {type(e).__name__} - {e}")
-            # import traceback # Para depuração mais profunda
-            # traceback.print_exc()
-            predictions[model_name] = None # Ou "Erro"
-
-    end_time_total = time.time()
-    print(f"INFO: Todas as previsões concluídas em {end_time_total - start_time_total:.4f} segundos.")
-    print(f"INFO: Preços previstos: {predictions}")
+    FEATURE_PREP_LATENCY.observe(time.perf_counter() - start_prep_time, model=model_name, mode="single")
+
+    try:
+        start_predict_time = time.perf_counter()
+        with ignore_feature_names_warning():
+            prediction_array = pipeline.predict(model_input)
+        predict_elapsed = time.perf_counter() - start_predict_time
+        MODEL_PREDICT_LATENCY.observe(predict_elapsed, model=model_name, mode="single")
+        logger.debug("Predição para '%s' concluída em %.4fs.", model_name, predict_elapsed)
+
+        if prediction_array is None or len(prediction_array) == 0 or not np.isfinite(prediction_array[0]):
+            logger.error("Predição inválida para '%s': %s", model_name, prediction_array)
+            PREDICTION_ERRORS.inc(model=model_name)
+            return None
+        return round(float(prediction_array[0]), 2)
+    except Exception as e:
+        logger.error("Erro ao prever com o modelo '%s': %s - %s", model_name, type(e).__name__, e)
+        PREDICTION_ERRORS.inc(model=model_name)
+        return None
+
+def _predict_batch_with_model(model_name, model_data, features):
+    # Roda UM modelo para N viagens com uma única chamada de predict().
+    # Retorna o array de previsões (float) ou None em caso de erro.
+    distances = features['distance_m']
+    layout = model_data["layout"]
+    start_prep_time = time.perf_counter()
+    if layout.fast_path_ok:
+        model_input = layout.build_matrix(features, len(distances))
+    else:
+        model_input = prepare_batch_input_for_fastapi_model(
+            distances,
+            features['duration_s'],
+            expected_column_names_model=model_data["features"],
+            generated_features=features
+        )
+    FEATURE_PREP_LATENCY.observe(time.perf_counter() - start_prep_time, model=model_name, mode="batch")
+    try:
+        start_predict_time = time.perf_counter()
+        with ignore_feature_names_warning():
+            prediction_array = np.asarray(model_data["pipeline"].predict(model_input), dtype=float).ravel()
+        MODEL_PREDICT_LATENCY.observe(time.perf_counter() - start_predict_time, model=model_name, mode="batch")
+    except Exception as e:
+        logger.error("Erro ao prever em lote com o modelo '%s': %s - %s", model_name, type(e).__name__, e)
+        PREDICTION_ERRORS.inc(model=model_name)
+        return None
+
+    if len(prediction_array) != len(distances):
+        logger.error("Predição em lote inválida para '%s': %d valores para %d viagens.",
+                     model_name, len(prediction_array), len(distances))
+        PREDICTION_ERRORS.inc(model=model_name)
+        return None
+    return prediction_array
+
+def _snapshot_models():
+    # Foto dos modelos atuais: uma troca de versão durante a requisição não a afeta
+    # (model_registry.models é substituído a cada troca, na ordem de MODEL_FILES)
+    return list(model_registry.models.items())
+
+def _versions_header(items):
+    # Valor do cabeçalho X-Model-Versions: quais versões responderam a requisição
+    return ",".join(f"{name}={data.get('version')}" for name, data in items)
+
+def _run_models(fn, *args, items=None):
+    # Executa fn(model_name, model_data, *args) para todos os modelos carregados
+    # e devolve {model_name: resultado}, preservando a ordem de MODEL_FILES.
+    if items is None:
+        items = _snapshot_models()
+    if PREDICT_EXECUTION_MODE == "sequential":
+        return {name: fn(name, data, *args) for name, data in items}
+    futures = [model_executor.submit(fn, name, data, *args) for name, data in items]
+    return {name: future.result() for (name, _), future in zip(items, futures)}
+
+async def _run_models_async(fn, *args, items=None):
+    # Versão para os endpoints: aguarda os modelos sem bloquear o event loop,
+    # de modo que outras requisições continuam sendo atendidas durante o scoring.
+    loop = asyncio.get_running_loop()
+    if items is None:
+        items = _snapshot_models()
+    if PREDICT_EXECUTION_MODE == "sequential":
+        return await loop.run_in_executor(model_executor, lambda: _run_models(fn, *args, items=items))
+    futures = [loop.run_in_executor(model_executor, fn, name, data, *args) for name, data in items]
+    values = await asyncio.gather(*futures)
+    return {name: value for (name, _), value in zip(items, values)}
+
+def _collect_batch_results(per_model_predictions, n_trips):
+    # Transpõe {modelo: array[N]} em uma lista de N dicionários {modelo: preço},
+    # mantendo apenas as previsões finitas.
+    results = [{} for _ in range(n_trips)]
+    for model_name, prediction_array in per_model_predictions.items():
+        if prediction_array is None:
+            continue
+        rounded = np.round(prediction_array, 2)
+        for i in np.flatnonzero(np.isfinite(prediction_array)):
+            results[i][model_name] = float(rounded[i])
+    return results
+
+def _as_trip_arrays(distances_m, durations_s):
+    distances = np.asarray(distances_m, dtype=float)
+    durations = np.asarray(durations_s, dtype=float)
+    if distances.shape != durations.shape or distances.ndim != 1:
+        raise ValueError("distances_m e durations_s devem ser sequências 1-D de mesmo tamanho.")
+    return distances, durations
+
+def predict_prices_batch(distances_m, durations_s):
+    """Prevê os preços de N viagens com UMA chamada de predict() por modelo.
+
+    Retorna uma lista (na mesma ordem da entrada) de dicionários
+    {nome_do_modelo: preço}, contendo apenas as previsões válidas de cada viagem.
+    """
+    distances, durations = _as_trip_arrays(distances_m, durations_s)
+    if len(distances) == 0:
+        return []
+    model_registry.wait_until_loaded()
+    features = generate_request_features(distances, durations)
+    per_model = _run_models(_predict_batch_with_model, features)
+    return _collect_batch_results(per_model, len(distances))
+
+# Cache de preços do /predict, chaveado por distância/duração quantizadas + balde de calendário.
+# PREDICTION_CACHE_ENABLED=0 desativa; PREDICTION_CACHE_SHARED_BACKEND=local liga o
+# backend compartilhado de exemplo (substituível por um cliente Redis com get/set).
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "1") == "1"
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "300")),
+    distance_step_m=float(os.getenv("PREDICTION_CACHE_DISTANCE_STEP_M", "50")),
+    duration_step_s=float(os.getenv("PREDICTION_CACHE_DURATION_STEP_S", "15")),
+    backend=LocalSharedBackend() if os.getenv("PREDICTION_CACHE_SHARED_BACKEND") == "local" else None
+)
+metrics_registry.callback("ml_api_prediction_cache_hits_total", "Acertos do cache de previsões.",
+                          lambda: prediction_cache.hits, metric_type="counter")
+metrics_registry.callback("ml_api_prediction_cache_misses_total", "Faltas do cache de previsões.",
+                          lambda: prediction_cache.misses, metric_type="counter")
+metrics_registry.callback("ml_api_prediction_cache_evictions_total", "Entradas descartadas do cache de previsões (limite de tamanho).",
+                          lambda: prediction_cache.evictions, metric_type="counter")
+metrics_registry.callback("ml_api_prediction_cache_expirations_total", "Entradas vencidas (TTL) do cache de previsões.",
+                          lambda: prediction_cache.expirations, metric_type="counter")
+
+# Preços em cache foram gerados por uma versão que pode ter sido trocada: descarta tudo (as
+# chaves já levam as versões; o clear() só libera a memória das entradas que não valem mais)
+model_registry.on_swap.append(lambda model_name, entry: prediction_cache.clear())
+metrics_registry.callback("ml_api_model_swaps_total", "Trocas de versão de modelo (recarga ou rollback).",
+                          lambda: model_registry.swaps, metric_type="counter")
+
+# Cache persistente de rotas (SQLite) compartilhado com o rotas.py: o servidor Node consulta
+# /routes/cache antes de chamar o ORS e grava a rota obtida com PUT /routes/cache.
+# ROUTE_CACHE_PATH / ROUTE_CACHE_PRECISION / ROUTE_CACHE_GRAPH_VERSION configuram; ROUTE_CACHE_ENABLED=0 desativa.
+# Aberto na subida do app (startup), não na importação: importar main.py não cria arquivos.
+route_cache = None
+# Uma rota gravada é servida a todos os clientes (e vira preço no /simulate): PUT /routes/cache
+# exige o token interno (ROUTE_CACHE_WRITE_TOKEN, o mesmo do servidor Node, no cabeçalho
+# X-Internal-Token) ou o ADMIN_TOKEN. Sem nenhum dos dois definido, a gravação fica desativada (403).
+ROUTE_CACHE_WRITE_TOKEN = os.getenv("ROUTE_CACHE_WRITE_TOKEN") or None
+metrics_registry.callback("ml_api_route_cache_hits_total", "Acertos do cache de rotas.",
+                          lambda: route_cache.hits if route_cache is not None else 0, metric_type="counter")
+metrics_registry.callback("ml_api_route_cache_misses_total", "Faltas do cache de rotas.",
+                          lambda: route_cache.misses if route_cache is not None else 0, metric_type="counter")
+
+# Rota calculada pelo ORS para gravar no cache (coordenadas em graus)
+class RouteCacheEntry(BaseModel):
+    origin_lng: float
+    origin_lat: float
+    dest_lng: float
+    dest_lat: float
+    distance_m: float = Field(..., ge=0)
+    duration_s: float = Field(..., ge=0)
+    geometry: Optional[str] = None
+
+app = FastAPI()
+
+@app.on_event("startup")
+def open_route_cache():
+    global route_cache
+    if route_cache is None:
+        route_cache = route_cache_from_env()
+    if route_cache is not None and ROUTE_CACHE_WRITE_TOKEN is None and ADMIN_TOKEN is None:
+        logger.warning("Sem ROUTE_CACHE_WRITE_TOKEN nem ADMIN_TOKEN: PUT /routes/cache desativado (só leitura).")
+
+@app.on_event("shutdown")
+def shutdown_model_executor():
+    model_executor.shutdown(wait=False)
+
+@app.post("/predict")
+async def predict_prices(req: PredictRequest, response: Response):
+    if not model_registry.ready:
+         raise HTTPException(status_code=503, detail="Serviço de modelos indisponível (modelos carregando ou nenhum modelo carregado).")
+
+    distance = req.distancia_m
+    duration = req.tempo_estim_segundos
+    logger.debug("Requisição recebida em /predict: distancia_m=%s tempo_estim_segundos=%s", distance, duration)
+
+    start_time_total = time.perf_counter()
+
+    calendar, time_bucket = calendar_provider.get_with_bucket()
+    # Foto dos modelos antes do cache: a chave leva as versões que vão (ou foram) usadas, então
+    # um resultado calculado antes de uma troca de versão não é servido depois dela
+    items = _snapshot_models()
+    model_versions = _versions_header(items)
+    response.headers["X-Model-Versions"] = model_versions
+    cache_key = None
+    if PREDICTION_CACHE_ENABLED:
+        cache_key = prediction_cache.make_key(distance, duration, time_bucket, model_versions)
+        cached_predictions = prediction_cache.get(cache_key)
+        if cached_predictions is not None:
+            REQUEST_LATENCY.observe(time.perf_counter() - start_time_total, endpoint="/predict", cache="hit")
+            return cached_predictions
+
+    # Features geradas uma vez e compartilhadas por todos os modelos
+    features = generate_request_features(distance, duration, calendar=calendar)
+    predictions = await _run_models_async(_predict_single_trip_with_model, features, items=items)
+
+    elapsed_total = time.perf_counter() - start_time_total
+    REQUEST_LATENCY.observe(elapsed_total, endpoint="/predict", cache="miss")
+    logger.debug("Todas as previsões concluídas em %.4fs: %s", elapsed_total, predictions)
     
     # Filtrar apenas os resultados que não são None (ou "Erro")
     valid_predictions = {k: v for k, v in predictions.items() if v is not None}
     
     if not valid_predictions:
         raise HTTPException(status_code=500, detail="Nenhuma previsão válida pôde ser gerada.")
+
+    if cache_key is not None:
+        prediction_cache.set(cache_key, valid_predictions)
         
-    return valid_predictions
\ No newline at end of file
+    return valid_predictions
+
+@app.get("/health/live")
+async def health_live():
+    # O processo está de pé (não depende dos modelos)
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def health_ready():
+    # Só aceita tráfego depois que os modelos estão carregados e aquecidos
+    status = model_registry.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/cache/stats")
+async def prediction_cache_stats():
+    return {"enabled": PREDICTION_CACHE_ENABLED, **prediction_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+def _check_admin_token(token):
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Rotas de administração desativadas: defina ADMIN_TOKEN.")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Token de administração inválido.")
+
+def _check_route_cache_write_token(internal_token, admin_token):
+    tokens = [token for token in (ROUTE_CACHE_WRITE_TOKEN, ADMIN_TOKEN) if token is not None]
+    if not tokens:
+        raise HTTPException(status_code=403, detail="Gravação no cache de rotas desativada: defina ROUTE_CACHE_WRITE_TOKEN.")
+    if internal_token not in tokens and admin_token not in tokens:
+        raise HTTPException(status_code=401, detail="Token inválido para gravar no cache de rotas.")
+
+def _check_model_name(model_name):
+    if model_name not in MODEL_FILES:
+        raise HTTPException(status_code=404, detail=f"Modelo '{model_name}' desconhecido. Opções: {list(MODEL_FILES)}")
+
+@app.get("/admin/models")
+async def admin_list_models(x_admin_token: str = Header(None)):
+    _check_admin_token(x_admin_token)
+    return model_registry.status()
+
+@app.post("/admin/models/{model_name}/reload")
+async def admin_reload_model(model_name: str, x_admin_token: str = Header(None)):
+    # Carrega, testa e troca fora do event loop; em caso de falha a versão atual continua
+    _check_admin_token(x_admin_token)
+    _check_model_name(model_name)
+    loop = asyncio.get_running_loop()
+    try:
+        version = await loop.run_in_executor(None, model_registry.reload_model, model_name)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Nova versão rejeitada: {type(e).__name__}: {e}")
+    return {"model": model_name, "version": version, "previous_version": model_registry.previous_version(model_name)}
+
+@app.post("/admin/models/{model_name}/rollback")
+async def admin_rollback_model(model_name: str, x_admin_token: str = Header(None)):
+    _check_admin_token(x_admin_token)
+    _check_model_name(model_name)
+    try:
+        version = model_registry.rollback(model_name)
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"model": model_name, "version": version, "previous_version": model_registry.previous_version(model_name)}
+
+def _require_route_cache():
+    if route_cache is None:
+        raise HTTPException(status_code=404, detail="Cache de rotas desativado.")
+    return route_cache
+
+# Endpoints do cache de rotas são síncronos (def): o FastAPI os roda no threadpool,
+# fora do event loop, pois cada um faz I/O no SQLite.
+@app.get("/routes/cache")
+def route_cache_lookup(origin_lng: float, origin_lat: float, dest_lng: float, dest_lat: float,
+                       require_geometry: bool = False):
+    cache = _require_route_cache()
+    hit = cache.get((origin_lng, origin_lat), (dest_lng, dest_lat), require_geometry=require_geometry)
+    if hit is None:
+        raise HTTPException(status_code=404, detail="Rota não está no cache.")
+    return hit
+
+@app.put("/routes/cache", status_code=204)
+def route_cache_store(entry: RouteCacheEntry, x_internal_token: str = Header(None),
+                      x_admin_token: str = Header(None)):
+    _check_route_cache_write_token(x_internal_token, x_admin_token)
+    cache = _require_route_cache()
+    cache.put((entry.origin_lng, entry.origin_lat), (entry.dest_lng, entry.dest_lat),
+              entry.distance_m, entry.duration_s, entry.geometry)
+    return Response(status_code=204)
+
+@app.get("/routes/cache/stats")
+def route_cache_stats():
+    if route_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **route_cache.stats()}
+
+@app.post("/admin/routes/cache/purge")
+def route_cache_purge(all_versions: bool = False, x_admin_token: str = Header(None)):
+    # Remove entradas de outras versões do grafo (ou todas) após atualizar o ORS
+    _check_admin_token(x_admin_token)
+    cache = _require_route_cache()
+    return {"deleted": cache.purge(all_versions=all_versions), **cache.stats()}
+
+@app.post("/predict/batch")
+async def predict_prices_batch_endpoint(req: PredictBatchRequest, response: Response):
+    if not model_registry.ready:
+         raise HTTPException(status_code=503, detail="Serviço de modelos indisponível (modelos carregando ou nenhum modelo carregado).")
+    if not req.trips:
+        raise HTTPException(status_code=400, detail="Lista 'trips' vazia.")
+    if len(req.trips) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Lote muito grande ({len(req.trips)} viagens). Máximo: {MAX_BATCH_SIZE}.")
+
+    logger.debug("Requisição recebida em /predict/batch com %d viagens.", len(req.trips))
+    start_time_total = time.perf_counter()
+
+    distances, durations = _as_trip_arrays(
+        [trip.distancia_m for trip in req.trips],
+        [trip.tempo_estim_segundos for trip in req.trips]
+    )
+    features = generate_request_features(distances, durations)
+    items = _snapshot_models()
+    per_model = await _run_models_async(_predict_batch_with_model, features, items=items)
+    predictions = _collect_batch_results(per_model, len(distances))
+    response.headers["X-Model-Versions"] = _versions_header(items)
+
+    elapsed_total = time.perf_counter() - start_time_total
+    REQUEST_LATENCY.observe(elapsed_total, endpoint="/predict/batch", cache="none")
+    logger.debug("Lote de %d viagens previsto em %.4fs.", len(req.trips), elapsed_total)
+
+    if not any(predictions):
+        raise HTTPException(status_code=500, detail="Nenhuma previsão válida pôde ser gerada.")
+
+    return {"predictions": predictions}
@@ -0,0 +1,290 @@
+# src/python/model_registry.py
+# Registro dos modelos da API: carregamento paralelo em segundo plano e estado de prontidão.
+#
+# Antes, main.py carregava cada .pkl em série na importação, antes de o FastAPI existir, e o
+# tempo de subida era a soma de todos os carregamentos. Aqui os arquivos são carregados em
+# paralelo por um pool de threads, em uma thread de fundo, enquanto a API já responde
+# /health/live. /health/ready só fica OK quando os modelos estão carregados e aquecidos.
+#
+# Com mmap_mode='r' o joblib mapeia os arrays NumPy dos artefatos direto do arquivo: vários
+# workers do uvicorn compartilham as mesmas páginas pelo page cache do SO em vez de cada
+# processo manter uma cópia própria.
+#
+# Recarga a quente: um .pkl alterado em model_dir (detectado pelo watcher ou pedido via
+# reload_model) é carregado fora do caminho das requisições, validado por prepare_entry
+# (que faz uma previsão de teste) e trocado atomicamente. A versão anterior fica guardada
+# para rollback imediato. Cada entrada carrega sua "version" para identificar quem respondeu.
+#
+# Com prefer_compiled=True, se existir um <modelo>.trees.npz exportado por compiled_trees.py
+# ao lado do .pkl, ele é carregado no lugar do pipeline completo (mais leve e mais rápido) —
+# desde que tenha sido exportado do .pkl atual (sha1 no meta); senão o .pkl é carregado. O
+# watcher observa o .pkl (e o .npz), então um .pkl novo nunca fica escondido por um .npz antigo.
+import datetime
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+
+from compiled_trees import compiled_path_for, is_current, load_compiled
+
+logger = logging.getLogger("ml_api.registry")
+
+
+def artifact_version(path):
+    """Versão de um artefato: data de modificação + início do SHA-256 do conteúdo."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    modified = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+    return f"{modified:%Y%m%d%H%M%S}-{digest.hexdigest()[:8]}"
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ModelRegistry:
+    """Carrega {nome: arquivo .pkl} de model_dir e mantém os modelos prontos em self.models.
+
+    prepare_entry(nome, dados_do_pkl) transforma o conteúdo do .pkl na entrada usada pela API
+    (ex: pipeline + features + layout) e também serve de aquecimento (warm-up) e de teste do
+    modelo: se levantar exceção, o artefato é rejeitado.
+    """
+
+    def __init__(self, model_dir, model_files, prepare_entry, mmap_mode=None, max_workers=None,
+                 require_all=False, prefer_compiled=False):
+        self.model_dir = model_dir
+        self.model_files = dict(model_files)
+        self.prepare_entry = prepare_entry
+        self.mmap_mode = mmap_mode
+        self.max_workers = max_workers or max(1, len(self.model_files))
+        self.require_all = require_all
+        self.prefer_compiled = prefer_compiled
+        # Dicionário usado pela API; só é preenchido ao final do carregamento, já na ordem de model_files.
+        # Cada troca de versão o substitui por outro: leia sempre registry.models (não guarde o dict)
+        self.models = {}
+        self._loaded = {}
+        self.failed = {}
+        self.load_seconds = {}
+        # Versão anterior de cada modelo (para rollback) e assinatura do arquivo carregado
+        self.previous = {}
+        self._signatures = {}
+        # Callbacks chamados após cada troca de versão (ex: limpar o cache de previsões)
+        self.on_swap = []
+        self.swaps = 0
+        self._swap_lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    def _pkl_path(self, model_name):
+        return os.path.join(self.model_dir, self.model_files[model_name])
+
+    def artifact_path(self, model_name):
+        """Arquivo que será carregado para o modelo: o .trees.npz compilado, se preferido, presente e
+        exportado do .pkl atual (sem o .pkl ao lado, o .npz vale sozinho); senão o .pkl."""
+        pkl_path = self._pkl_path(model_name)
+        if self.prefer_compiled:
+            compiled_path = compiled_path_for(pkl_path)
+            if os.path.exists(compiled_path):
+                if not os.path.exists(pkl_path) or is_current(compiled_path, pkl_path):
+                    return compiled_path
+                logger.warning("'%s' não corresponde ao .pkl atual; usando '%s'.",
+                               os.path.basename(compiled_path), os.path.basename(pkl_path))
+        return pkl_path
+
+    def watch_signature(self, model_name):
+        """Assinatura (mtime, tamanho) do .pkl e, se preferido, do .trees.npz: muda quando qualquer um muda."""
+        pkl_path = self._pkl_path(model_name)
+        paths = (pkl_path, compiled_path_for(pkl_path)) if self.prefer_compiled else (pkl_path,)
+        signature = tuple(_file_signature(path) if os.path.exists(path) else None for path in paths)
+        if not any(signature):
+            raise FileNotFoundError(pkl_path)
+        return signature
+
+    def _load_entry(self, model_name, pkl_filename):
+        # Carrega e valida um artefato; levanta exceção se o arquivo ou o teste falhar
+        signature = self.watch_signature(model_name)
+        full_path = self.artifact_path(model_name)
+        version = artifact_version(full_path)
+        if full_path.endswith(".npz"):
+            data = load_compiled(full_path, source_path=self._pkl_path(model_name))
+        else:
+            data = joblib.load(full_path, mmap_mode=self.mmap_mode)
+        entry = self.prepare_entry(model_name, data)
+        entry["version"] = version
+        entry["artifact"] = os.path.basename(full_path)
+        return entry, signature
+
+    def _load_one(self, model_name, pkl_filename):
+        full_path = self._pkl_path(model_name)
+        start = time.perf_counter()
+        try:
+            entry, signature = self._load_entry(model_name, pkl_filename)
+        except FileNotFoundError:
+            logger.critical("Arquivo do modelo '%s' não encontrado.", full_path)
+            self.failed[model_name] = "arquivo não encontrado"
+            return
+        except Exception as e:
+            logger.critical("Erro ao carregar o modelo '%s': %s - %s", pkl_filename, type(e).__name__, e)
+            self.failed[model_name] = f"{type(e).__name__}: {e}"
+            return
+        self.load_seconds[model_name] = time.perf_counter() - start
+        self._signatures[model_name] = signature
+        self._loaded[model_name] = entry
+        logger.info("Modelo '%s' (%s) versão %s pronto em %.2fs.",
+                    model_name, entry["artifact"], entry["version"], self.load_seconds[model_name])
+
+    def load_all(self):
+        """Carrega todos os modelos em paralelo e bloqueia até terminar."""
+        logger.info("--- Carregando Modelos Para API (%d em paralelo, mmap_mode=%s) ---",
+                    self.max_workers, self.mmap_mode)
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="model-load") as pool:
+                for model_name, pkl_filename in self.model_files.items():
+                    pool.submit(self._load_one, model_name, pkl_filename)
+            # Publica na ordem de model_files para manter a ordem das respostas da API
+            self.models.update(
+                (name, self._loaded[name]) for name in self.model_files if name in self._loaded
+            )
+        finally:
+            self._done.set()
+        if not self.models:
+            logger.warning("Nenhum modelo foi carregado com sucesso. O endpoint /predict não funcionará corretamente.")
+        logger.info("Carregamento concluído em %.2fs: %d ok, %d com erro.",
+                    time.perf_counter() - start, len(self.models), len(self.failed))
+
+    def start_background_load(self):
+        """Dispara load_all() em uma thread de fundo (não bloqueia a importação da API)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.load_all, name="model-registry-loader", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def wait_until_loaded(self, timeout=None):
+        """Bloqueia até o fim do carregamento (uso offline, ex: predict_prices_batch)."""
+        if self._thread is None and not self._done.is_set():
+            self.load_all()
+        return self._done.wait(timeout)
+
+    def _swap(self, model_name, entry):
+        # Troca atômica: um dict novo, na ordem de model_files (um modelo que tinha falhado não vai
+        # para o fim da resposta), substitui o anterior numa só atribuição; requisições em
+        # andamento seguem com a foto que já tinham em mãos
+        models = {**self.models, model_name: entry}
+        self.models = {name: models[name] for name in self.model_files if name in models}
+        self.swaps += 1
+        for callback in self.on_swap:
+            try:
+                callback(model_name, entry)
+            except Exception as e:
+                logger.error("Callback on_swap falhou para '%s': %s - %s", model_name, type(e).__name__, e)
+
+    def reload_model(self, model_name):
+        """Carrega de novo o .pkl de um modelo, testa e troca. Devolve a nova versão.
+
+        Em caso de erro a versão atual continua servindo e a exceção é propagada.
+        """
+        if model_name not in self.model_files:
+            raise KeyError(model_name)
+        with self._swap_lock:
+            start = time.perf_counter()
+            entry, signature = self._load_entry(model_name, self.model_files[model_name])
+            current = self.models.get(model_name)
+            self._signatures[model_name] = signature
+            if current is not None and current.get("version") == entry["version"]:
+                logger.info("Modelo '%s' já está na versão %s.", model_name, entry["version"])
+                return entry["version"]
+            if current is not None:
+                self.previous[model_name] = current
+            self.failed.pop(model_name, None)
+            self.load_seconds[model_name] = time.perf_counter() - start
+            self._swap(model_name, entry)
+            logger.info("Modelo '%s' recarregado: %s -> %s.", model_name,
+                        current.get("version") if current else None, entry["version"])
+            return entry["version"]
+
+    def rollback(self, model_name):
+        """Volta para a versão anterior guardada. Devolve a versão restaurada."""
+        with self._swap_lock:
+            previous = self.previous.get(model_name)
+            if previous is None:
+                raise LookupError(f"Modelo '{model_name}' não tem versão anterior para rollback.")
+            current = self.models.get(model_name)
+            self.previous[model_name] = current
+            self._swap(model_name, previous)
+            logger.warning("Rollback do modelo '%s': %s -> %s.", model_name,
+                           current.get("version") if current else None, previous["version"])
+            return previous["version"]
+
+    def check_for_changes(self):
+        """Recarrega os modelos cujo .pkl (ou .trees.npz) mudou desde o último carregamento."""
+        reloaded = {}
+        for model_name in self.model_files:
+            try:
+                signature = self.watch_signature(model_name)
+            except FileNotFoundError:
+                continue
+            if signature == self._signatures.get(model_name):
+                continue
+            try:
+                reloaded[model_name] = self.reload_model(model_name)
+            except Exception as e:
+                # Não tenta de novo até o arquivo mudar outra vez
+                self._signatures[model_name] = signature
+                logger.error("Nova versão do modelo '%s' rejeitada: %s - %s", model_name, type(e).__name__, e)
+        return reloaded
+
+    def start_watching(self, interval_seconds):
+        """Verifica model_dir a cada interval_seconds em uma thread de fundo."""
+        def watch():
+            self._done.wait()
+            while not self._stop_watching.wait(interval_seconds):
+                self.check_for_changes()
+
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=watch, name="model-registry-watcher", daemon=True)
+            self._watcher.start()
+        return self._watcher
+
+    def stop_watching(self):
+        self._stop_watching.set()
+
+    def previous_version(self, model_name):
+        previous = self.previous.get(model_name)
+        return previous.get("version") if previous else None
+
+    def versions(self):
+        return {name: entry.get("version") for name, entry in self.models.items()}
+
+    @property
+    def loading_finished(self):
+        return self._done.is_set()
+
+    @property
+    def ready(self):
+        if not self._done.is_set() or not self.models:
+            return False
+        return not self.require_all or len(self.models) == len(self.model_files)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "loading_finished": self.loading_finished,
+            "loaded": list(self.models),
+            "failed": dict(self.failed),
+            "pending": [name for name in self.model_files
+                        if name not in self._loaded and name not in self.failed],
+            "load_seconds": {name: round(secs, 3) for name, secs in self.load_seconds.items()},
+            "versions": self.versions(),
+            "artifacts": {name: entry.get("artifact") for name, entry in self.models.items()},
+            "previous_versions": {name: entry.get("version") for name, entry in self.previous.items() if entry}
+        }
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+# src/python/ors_client.py
+"""
+Cliente assíncrono do ORS local usado pelo rotas.py:
+- Janela limitada de requisições em voo (matrix/directions) sobre um pool HTTP
+- Concorrência adaptativa (AIMD): sobe +1 a cada sequência de sucessos, cai pela metade em erro
+- Retry com backoff exponencial + jitter para 429/5xx/timeouts
+- Só as rotas origem → destino necessárias (Matrix 1→N / N→1 / 1×1), sem N×N por batch
+- Fallback Directions concorrente quando a Matrix de um par/grupo falha
+- Cache persistente de rotas (route_cache.RouteCache) consultado antes do ORS
+"""
+
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("ors_client")
+
+# Códigos HTTP que indicam sobrecarga/indisponibilidade temporária do ORS
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+# Como cada batch de pares origem → destino vira requisições de Matrix:
+# - grouped:  pares com a mesma origem viram uma Matrix 1→N (e com o mesmo destino, N→1);
+#             os demais são pedidos 1×1 concorrentes. Calcula só as rotas necessárias.
+# - pairwise: uma Matrix 1×1 por par, todas concorrentes.
+# - matrix:   legado; uma Matrix N×N por batch aproveitando só a diagonal (N² rotas).
+ROUTING_MODES = ("grouped", "pairwise", "matrix")
+
+
+def _cell(rows, i, j):
+    if i < len(rows) and j < len(rows[i]) and rows[i][j] is not None:
+        return rows[i][j]
+    return np.nan
+
+
+def group_pairs(origins, destinations, share=True):
+    """Agrupa os pares origem[i] → destino[i] em requisições de Matrix sem rotas desnecessárias.
+
+    Devolve [(sources, targets, cells)], com cells = [(índice_do_par, linha, coluna)].
+    Com share=True, pares que repetem a origem (ou, entre os restantes, o destino) são
+    atendidos por uma única Matrix 1→N (N→1); o resto vira Matrix 1×1.
+    """
+    groups = []
+    remaining = list(range(len(origins)))
+    if share:
+        for anchor_of, other_of, one_to_many in ((origins, destinations, True), (destinations, origins, False)):
+            by_anchor = {}
+            for index in remaining:
+                by_anchor.setdefault(tuple(anchor_of[index]), []).append(index)
+            remaining = []
+            for anchor, indices in by_anchor.items():
+                if len(indices) == 1:
+                    remaining.extend(indices)
+                    continue
+                others = list(dict.fromkeys(tuple(other_of[index]) for index in indices))
+                position = {point: k for k, point in enumerate(others)}
+                if one_to_many:
+                    cells = [(index, 0, position[tuple(other_of[index])]) for index in indices]
+                    groups.append(([anchor], others, cells))
+                else:
+                    cells = [(index, position[tuple(other_of[index])], 0) for index in indices]
+                    groups.append((others, [anchor], cells))
+            remaining.sort()
+    for index in remaining:
+        groups.append(([tuple(origins[index])], [tuple(destinations[index])], [(index, 0, 0)]))
+    return groups
+
+
+class RetryableError(Exception):
+    """Falha temporária (sobrecarga, timeout, conexão): vale tentar de novo após backoff."""
+
+
+class AdaptiveLimiter:
+    """Limite de requisições em voo que se ajusta à capacidade do servidor.
+
+    - Começa em `initial` e nunca passa de `max_in_flight` nem fica abaixo de `min_in_flight`.
+    - A cada `increase_after` sucessos seguidos o limite sobe 1 (aumento aditivo).
+    - Um erro temporário corta o limite pela metade (redução multiplicativa).
+    """
+
+    def __init__(self, max_in_flight, min_in_flight=1, initial=None, increase_after=10):
+        if not 1 <= min_in_flight <= max_in_flight:
+            raise ValueError("Esperado 1 <= min_in_flight <= max_in_flight.")
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.limit = min(max(initial or min_in_flight, min_in_flight), max_in_flight)
+        self.increase_after = increase_after
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = None
+
+    def _get_condition(self):
+        # Criada sob demanda para ficar presa ao event loop em execução
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def __aenter__(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+        return False
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.increase_after and self.limit < self.max_in_flight:
+            self.limit += 1
+            self._successes = 0
+
+    def on_error(self):
+        self._successes = 0
+        self.limit = max(self.min_in_flight, self.limit // 2)
+
+
+class AsyncORSRouter:
+    """Roteamento concorrente contra o ORS (endpoints /v2/matrix e /v2/directions).
+
+    As chamadas HTTP rodam em um pool de threads com uma requests.Session (conexões
+    reaproveitadas, pool do tamanho de max_in_flight); o asyncio coordena a janela.
+    """
+
+    def __init__(self, base_url, profile="driving-car", max_in_flight=8, min_in_flight=1,
+                 initial_in_flight=None, timeout=60, max_retries=4, backoff_base=0.5, backoff_max=30.0,
+                 routing_mode="grouped", route_cache=None):
+        if routing_mode not in ROUTING_MODES:
+            raise ValueError(f"routing_mode deve ser um de {ROUTING_MODES}.")
+        self.base_url = base_url.rstrip("/")
+        self.profile = profile
+        self.routing_mode = routing_mode
+        self.route_cache = route_cache
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = AdaptiveLimiter(max_in_flight, min_in_flight, initial=initial_in_flight or max_in_flight)
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight))
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight))
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="ors")
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "matrix_fallbacks": 0, "routes_computed": 0,
+                      "cache_hits": 0}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # — HTTP —
+    def _post_json(self, path, body):
+        try:
+            resp = self._session.post(f"{self.base_url}{path}", json=body, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(f"{type(e).__name__}: {e}") from e
+        if resp.status_code in RETRYABLE_STATUS:
+            raise RetryableError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+        resp.raise_for_status()
+        return resp.json()
+
+    def _backoff_seconds(self, attempt):
+        # Exponencial com jitter completo: evita que todas as requisições voltem juntas
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _request(self, path, body):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            async with self.limiter:
+                self.stats["requests"] += 1
+                try:
+                    result = await loop.run_in_executor(self._executor, self._post_json, path, body)
+                except RetryableError as e:
+                    self.limiter.on_error()
+                    if attempt == self.max_retries:
+                        self.stats["errors"] += 1
+                        raise
+                    self.stats["retries"] += 1
+                    logger.debug("ORS %s falhou (%s); limite=%d, nova tentativa.", path, e, self.limiter.limit)
+                except Exception:
+                    # Erro definitivo (ex: 400/404 sem rota): não adianta repetir
+                    self.stats["errors"] += 1
+                    raise
+                else:
+                    self.limiter.on_success()
+                    return result
+            await asyncio.sleep(self._backoff_seconds(attempt))
+
+    # — Endpoints —
+    async def _matrix_cells(self, locations, sources, destinations):
+        # Uma chamada /v2/matrix; devolve as linhas de distâncias e durações (sources x destinations)
+        body = {
+            "locations": list(locations),
+            "metrics": ["distance", "duration"],
+            "units": "m",
+            "sources": list(sources),
+            "destinations": list(destinations)
+        }
+        self.stats["routes_computed"] += len(sources) * len(destinations)
+        resp = await self._request(f"/v2/matrix/{self.profile}", body)
+        return resp.get("distances") or [], resp.get("durations") or []
+
+    async def matrix(self, origins, destinations):
+        """Modo 'matrix' (legado): N×N rotas para aproveitar só a diagonal origem[i] → destino[i].
+
+        (None, None) se a Matrix falhar.
+        """
+        n = len(origins)
+        try:
+            dists, durs = await self._matrix_cells(
+                list(origins) + list(destinations), range(n), range(n, n + len(destinations)))
+        except Exception as e:
+            logger.warning("Matrix falhou: %s", e)
+            return None, None
+        return [_cell(dists, i, i) for i in range(n)], [_cell(durs, i, i) for i in range(n)]
+
+    async def pairs(self, origins, destinations):
+        """Modos 'grouped'/'pairwise': calcula só as rotas origem[i] → destino[i].
+
+        Devolve (distâncias, durações, índices_que_falharam).
+        """
+        groups = group_pairs(origins, destinations, share=self.routing_mode == "grouped")
+        dists = [np.nan] * len(origins)
+        durs = [np.nan] * len(origins)
+
+        async def run_group(group_sources, group_targets, cells):
+            n_sources = len(group_sources)
+            try:
+                rows_dist, rows_dur = await self._matrix_cells(
+                    group_sources + group_targets, range(n_sources), range(n_sources, n_sources + len(group_targets)))
+            except Exception as e:
+                logger.debug("Matrix de grupo falhou (%d pares): %s", len(cells), e)
+                return [index for index, _, _ in cells]
+            for index, row, col in cells:
+                dists[index] = _cell(rows_dist, row, col)
+                durs[index] = _cell(rows_dur, row, col)
+            return []
+
+        failed = await asyncio.gather(*(run_group(*group) for group in groups))
+        return dists, durs, [index for group_failed in failed for index in group_failed]
+
+    async def directions(self, origin, destination):
+        """(distância_m, duração_s) de uma rota; levanta exceção se o ORS não achar rota."""
+        resp = await self._request(f"/v2/directions/{self.profile}/json", {"coordinates": [origin, destination]})
+        summary = resp["routes"][0]["summary"]
+        return summary.get("distance", 0.0), summary.get("duration", 0.0)
+
+    # — Batches —
+    async def route_batch(self, ride_ids, origins, destinations, skip=frozenset()):
+        """Roteia um batch: primeiro o cache de rotas, depois o ORS para o que faltar.
+
+        Devolve [(ride_id, distance_m, duration_s, error)] das corridas fora de `skip`.
+        """
+        todo = [(ride_id, o, d) for ride_id, o, d in zip(ride_ids, origins, destinations) if ride_id not in skip]
+        cached_results = []
+        if todo and self.route_cache is not None:
+            # SQLite síncrono: numa thread, para não travar o event loop (e as outras requisições)
+            cached = await asyncio.to_thread(self.route_cache.get_many, [(o, d) for _, o, d in todo])
+            cached_results = [(ride_id, hit["distance_m"], hit["duration_s"], None)
+                              for (ride_id, _, _), hit in zip(todo, cached) if hit is not None]
+            todo = [item for item, hit in zip(todo, cached) if hit is None]
+            self.stats["cache_hits"] += len(cached_results)
+        if not todo:
+            return cached_results
+        ride_ids, origins, destinations = (list(column) for column in zip(*todo))
+        results = await self._route_pairs(ride_ids, origins, destinations)
+        if self.route_cache is not None:
+            await asyncio.to_thread(self.route_cache.put_many, [
+                (origins[i], destinations[i], dist, dur)
+                for i, (_, dist, dur, error) in enumerate(results) if error is None
+            ])
+        return cached_results + results
+
+    async def _route_pairs(self, ride_ids, origins, destinations):
+        # Roteia no ORS (modo configurado) e manda para Directions os pares cuja Matrix falhou
+        if self.routing_mode == "matrix":
+            dists, durs = await self.matrix(origins, destinations)
+            failed = list(range(len(ride_ids))) if dists is None else []
+        else:
+            dists, durs, failed = await self.pairs(origins, destinations)
+
+        results = []
+        for ride_id, dist, dur in zip(ride_ids, dists or [np.nan] * len(ride_ids), durs or [np.nan] * len(ride_ids)):
+            if not np.isnan(dist) and not np.isnan(dur):
+                results.append((ride_id, dist, dur, None))
+            else:
+                results.append((ride_id, np.nan, np.nan, "NO_ROUTE"))
+        if not failed:
+            return results
+
+        self.stats["matrix_fallbacks"] += 1
+
+        async def one(index):
+            ride_id = ride_ids[index]
+            try:
+                dist, dur = await self.directions(origins[index], destinations[index])
+                results[index] = (ride_id, dist, dur, None)
+            except Exception as e:
+                logger.debug("Fallback erro ride %s: %s", ride_id, e)
+                results[index] = (ride_id, np.nan, np.nan, "FALLBACK_ERR")
+
+        await asyncio.gather(*(one(index) for index in failed))
+        return results
+
+    async def run_batches(self, batches, on_batch_done, skip=frozenset(), threaded_source=False):
+        """Processa (ride_ids, origins, destinations) mantendo a janela de batches em voo.
+
+        on_batch_done(resultados) é chamado no event loop assim que cada batch termina
+        (em ordem de conclusão); no máximo 2x max_in_flight batches ficam pendentes em memória.
+        Com threaded_source=True o iterador de batches avança numa thread (ex: leitura do CSV
+        em streaming), sem travar o event loop enquanto as requisições em voo terminam.
+        """
+        window = 2 * self.limiter.max_in_flight
+        pending = set()
+        iterator = iter(batches)
+        while True:
+            if threaded_source:
+                batch = await asyncio.to_thread(next, iterator, None)
+            else:
+                batch = next(iterator, None)
+            if batch is None:
+                break
+            ride_ids, origins, destinations = batch
+            pending.add(asyncio.ensure_future(self.route_batch(ride_ids, origins, destinations, skip)))
+            if len(pending) >= window:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    on_batch_done(task.result())
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                on_batch_done(task.result())
+
+
+def wait_until_ready(base_url, attempts=20, pause_seconds=5):
+    """Health-check com retry em {base_url}/v2/health."""
+    logger.info("Verificando ORS em %s/v2/health …", base_url)
+    for _ in range(attempts):
+        try:
+            r = requests.get(f"{base_url}/v2/health", timeout=10)
+            r.raise_for_status()
+            if r.json().get('status') == 'ready':
+                logger.info("ORS está pronto!")
+                return
+            logger.warning("ORS não pronto (status=%s), retry…", r.json().get('status'))
+        except Exception as e:
+            logger.warning("Health-check falhou (%s), retry em %ss…", e, pause_seconds)
+        time.sleep(pause_seconds)
+    raise RuntimeError("ORS local não ficou pronto a tempo.")
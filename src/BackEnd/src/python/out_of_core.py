@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# src/python/out_of_core.py
+"""
+Treino out-of-core do save_model.py (OUT_OF_CORE=1), para históricos maiores que a RAM:
+- O feature store é lido em blocos (FeatureStore.iter_frames, só as colunas do modelo) e
+  entregue ao XGBoost por um DataIter; o ExtMemQuantileDMatrix guarda as páginas quantizadas
+  em disco (cache_dir), então nem a tabela nem o DMatrix ficam inteiros na memória
+- Mesmo tratamento de ausentes do caminho em memória: sem distância a linha sai, duração
+  ausente vira a média (calculada numa passada de contagem, antes do treino)
+- Teste fixo por hash do RideID (ride_stream.is_holdout), decidido bloco a bloco: as mesmas
+  corridas de teste do caminho em memória, sem precisar de todas as linhas de uma vez
+- Avaliação em streaming: RMSE e R² por somas (n, Σerro², Σy, Σy²), bloco a bloco
+- O booster volta como XGBRegressor (load_model): o model.pkl e o .trees.npz saem no mesmo
+  formato de sempre
+
+A memória depende de chunk_rows e das páginas do XGBoost, não do tamanho da tabela. As junções
+por RideID que alimentam o store são feitas em lotes pelo feature_store.refresh (batch_rides).
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from ride_stream import is_holdout
+
+# Linhas por bloco lido do store: o pico de memória do modo out-of-core vem daqui (o sqlite3
+# devolve cada valor como objeto Python antes do pandas tipar o bloco)
+CHUNK_ROWS = 100_000
+DEFAULT_CACHE_DIR = os.path.join("data", "xgb_external")
+
+
+def booster_params(params):
+    """Parâmetros do XGBRegressor (n_estimators, random_state, n_jobs) → (params do xgb.train, nº de rodadas)."""
+    params = dict(params)
+    rounds = params.pop("n_estimators", 100)
+    if "random_state" in params:
+        params["seed"] = params.pop("random_state")
+    if "n_jobs" in params:
+        n_jobs = params.pop("n_jobs")
+        if n_jobs is not None and n_jobs > 0:
+            params["nthread"] = n_jobs
+    params.pop("enable_categorical", None)
+    return params, rounds
+
+
+def scan(store, distance_col, duration_col, chunk_rows=CHUNK_ROWS):
+    """Passada de contagem: linhas, NaNs de distância/duração e a média da duração (sem distância NaN)."""
+    counts = {"rows": 0, "distance_nan": 0, "duration_nan": 0}
+    total, count = 0.0, 0
+    for frame in store.iter_frames(chunk_rows, columns=[distance_col, duration_col]):
+        distance = frame[distance_col].to_numpy(dtype=np.float64)
+        duration = frame[duration_col].to_numpy(dtype=np.float64)
+        counts["rows"] += len(frame)
+        counts["distance_nan"] += int(np.isnan(distance).sum())
+        counts["duration_nan"] += int(np.isnan(duration).sum())
+        kept = duration[~np.isnan(distance)]
+        total += float(np.nansum(kept))
+        count += int((~np.isnan(kept)).sum())
+    counts["duration_mean"] = total / count if count else np.nan
+    return counts
+
+
+class _StoreIter(xgb.DataIter):
+    # Blocos de treino (holdout=False) ou de teste do store; o XGBoost relê tudo a cada passada
+    def __init__(self, trainer, holdout, cache_prefix):
+        super().__init__(cache_prefix=cache_prefix)
+        self._trainer = trainer
+        self._holdout = holdout
+        self._frames = None
+
+    def reset(self):
+        self._frames = None
+
+    def next(self, input_data):
+        if self._frames is None:
+            self._frames = self._trainer.iter_blocks(self._holdout)
+        for X, y in self._frames:
+            input_data(data=X, label=y, feature_names=self._trainer.features)
+            return True
+        return False
+
+
+class OutOfCoreTrainer:
+    """Treino e avaliação em blocos a partir de um FeatureStore aberto.
+
+    duration_mean: valor das durações ausentes (scan()['duration_mean']).
+    """
+
+    def __init__(self, store, features, target, distance_col, duration_col, duration_mean, chunk_rows=CHUNK_ROWS,
+                 cache_dir=DEFAULT_CACHE_DIR):
+        self.store = store
+        self.features = list(features)
+        self.target = target
+        self.distance_col = distance_col
+        self.duration_col = duration_col
+        self.duration_mean = duration_mean
+        self.chunk_rows = chunk_rows
+        self.cache_dir = cache_dir
+        self._columns = list(dict.fromkeys([store.key, *self.features, target, distance_col, duration_col]))
+
+    def iter_blocks(self, holdout):
+        """(X float32, y) de cada bloco do store, só das linhas de teste (holdout=True) ou de treino."""
+        for frame in self.store.iter_frames(self.chunk_rows, columns=self._columns):
+            frame = frame.dropna(subset=[self.distance_col])
+            frame = frame[is_holdout(frame[self.store.key].to_numpy()) == holdout]
+            if not len(frame):
+                continue
+            frame = frame.assign(**{self.duration_col: frame[self.duration_col].fillna(self.duration_mean)})
+            yield (frame[self.features].to_numpy(dtype=np.float32),
+                   pd.to_numeric(frame[self.target], errors="coerce").to_numpy(dtype=np.float32))
+
+    def train(self, params):
+        """Treina com os parâmetros do XGBRegressor; devolve um XGBRegressor com o booster treinado."""
+        train_params, rounds = booster_params(params)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        try:
+            dtrain = xgb.ExtMemQuantileDMatrix(_StoreIter(self, False, os.path.join(self.cache_dir, "train")),
+                                               nthread=train_params.get("nthread"))
+            booster = xgb.train(train_params, dtrain, num_boost_round=rounds)
+            del dtrain
+        finally:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        model = xgb.XGBRegressor()
+        model.load_model(bytearray(booster.save_raw(raw_format="ubj")))
+        return model
+
+    def evaluate(self, model):
+        """RMSE e R² nas linhas de teste, somando bloco a bloco."""
+        booster = model.get_booster()
+        n, sse, sum_y, sum_y2 = 0, 0.0, 0.0, 0.0
+        for X, y in self.iter_blocks(holdout=True):
+            y = y.astype(np.float64)
+            error = y - booster.inplace_predict(X).astype(np.float64)
+            n += len(y)
+            sse += float(error @ error)
+            sum_y += float(y.sum())
+            sum_y2 += float(y @ y)
+        if not n:
+            raise RuntimeError("Nenhuma linha de teste no feature store.")
+        total = sum_y2 - sum_y * sum_y / n
+        return {"rows": n, "rmse": float(np.sqrt(sse / n)), "r2": float(1 - sse / total) if total > 0 else float("nan")}
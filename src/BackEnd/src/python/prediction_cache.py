@@ -0,0 +1,144 @@
+# src/python/prediction_cache.py
+# Cache dos preços previstos pelo /predict.
+#
+# Muitas cotações do servidor Node são para rotas iguais ou quase iguais (aeroportos, pares
+# populares) em poucos minutos. A chave do cache é a distância e a duração quantizadas
+# (passos configuráveis) mais o balde das features de calendário, de modo que uma entrada
+# nunca é reaproveitada com hora/dia/feriado diferentes dos usados na previsão. As versões dos
+# modelos que responderam também entram na chave: uma requisição que começou antes de uma troca
+# de versão e grava depois do clear() só grava sob a chave da versão antiga, que ninguém mais
+# consulta (vale também para o backend compartilhado, que o clear() não alcança).
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalSharedBackend:
+    """Substituto local de um backend compartilhado (ex: Redis): get/set com TTL.
+
+    Qualquer objeto com os métodos get(key) -> str|None e set(key, value, ttl_seconds)
+    pode ser usado como backend do PredictionCache.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if self._clock() >= expires_at:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl_seconds):
+        with self._lock:
+            self._data[key] = (value, self._clock() + ttl_seconds)
+
+
+class PredictionCache:
+    """Cache LRU + TTL em processo, com backend compartilhado opcional.
+
+    - max_entries: tamanho máximo do LRU local (a entrada menos usada é descartada).
+    - ttl_seconds: validade de cada entrada.
+    - distance_step_m / duration_step_s: passos de quantização da chave.
+    - backend: consultado quando o LRU local não tem a chave (e alimentado a cada set).
+    - evictions conta as entradas descartadas pelo limite do LRU; expirations, as vencidas
+      (TTL) encontradas numa consulta.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=300, distance_step_m=50.0, duration_step_s=15.0,
+                 backend=None, clock=time.monotonic):
+        if max_entries <= 0 or ttl_seconds <= 0:
+            raise ValueError("max_entries e ttl_seconds devem ser positivos.")
+        if distance_step_m <= 0 or duration_step_s <= 0:
+            raise ValueError("Os passos de quantização devem ser positivos.")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.distance_step_m = distance_step_m
+        self.duration_step_s = duration_step_s
+        self.backend = backend
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend_hits = 0
+
+    def make_key(self, distance_m, duration_s, time_bucket, model_versions=None):
+        """Chave da previsão; model_versions (ex: 'uberX=v1,99Pop=v2') identifica os modelos usados."""
+        distance_q = int(round(distance_m / self.distance_step_m))
+        duration_q = int(round(duration_s / self.duration_step_s))
+        bucket = time_bucket.isoformat() if hasattr(time_bucket, "isoformat") else str(time_bucket)
+        key = f"{distance_q}:{duration_q}:{bucket}"
+        if model_versions is not None:
+            key += ":" + hashlib.sha1(model_versions.encode()).hexdigest()[:12]
+        return key
+
+    def get(self, key):
+        """Devolve uma cópia do dicionário de preços em cache ou None."""
+        now = self._clock()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                value, expires_at = item
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(value)
+                del self._entries[key]
+                self.expirations += 1
+
+        if self.backend is not None:
+            raw = self.backend.get(key)
+            if raw is not None:
+                value = json.loads(raw)
+                self._store_local(key, value, now)
+                with self._lock:
+                    self.hits += 1
+                    self.backend_hits += 1
+                return dict(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._store_local(key, dict(value), self._clock())
+        if self.backend is not None:
+            self.backend.set(key, json.dumps(value), self.ttl_seconds)
+
+    def _store_local(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "backend_hits": self.backend_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
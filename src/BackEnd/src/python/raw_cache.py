@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+# src/python/raw_cache.py
+"""
+Cache colunar e tipado dos CSVs brutos (ride_v2.csv, rideestimative_v3.csv, ...):
+- Só as colunas pedidas, convertidas uma vez para tipos compactos: ids int32 (int64 se não
+  couberem), valores float32, categorias como códigos int16 + lista de rótulos e data/hora
+  já convertida (datetime_parsing.parse_datetimes) em datetime64[ns]
+- Um .npy por coluna em cache_dir, aberto por memmap: só as linhas selecionadas (keep) são
+  copiadas para a memória; rodar de novo com o mesmo CSV não faz parsing nenhum
+- Invalidação pelo CSV de origem: tamanho + mtime iguais → cache válido; se mudaram, o sha1
+  decide: mesmo conteúdo só atualiza o mtime, conteúdo acrescentado ao fim (o dump cresce)
+  converte só as linhas novas, qualquer outra mudança reconstrói o cache
+- Colunas pedidas que o cache ainda não tem: reconstrói com a união das colunas, então
+  save_model.py e train_models.py compartilham o cache do mesmo CSV
+- Seleção de linhas em blocos de SCAN_ROWS ids; numa coluna de ids ordenada (marcada no
+  meta.json), key_range limita a busca ao trecho [menor, maior] por busca binária — é o que
+  permite ao feature_store.refresh juntar as corridas em lotes sem percorrer o CSV inteiro
+
+Linhas com id não numérico são descartadas na conversão (como em feature_store.read_csv_rows).
+
+Paridade + benchmark: python raw_cache.py --rows 2000000
+"""
+
+import os
+import json
+import time
+import logging
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from datetime_parsing import parse_datetimes
+
+logger = logging.getLogger("raw_cache")
+
+CACHE_VERSION = 3   # 3: data/hora com fuso convertida mantendo a hora local (datetime_parsing)
+DEFAULT_CACHE_DIR = os.path.join("data", "raw_cache")
+CSV_CHUNK_ROWS = 500_000
+SCAN_ROWS = 1 << 22      # ids avaliados por vez por keep() na seleção de linhas
+HASH_BLOCK = 1 << 20
+
+# Tipos aceitos em column_types
+ID, FLOAT, CATEGORY, DATETIME = "id", "float", "category", "datetime"
+_KINDS = (ID, FLOAT, CATEGORY, DATETIME)
+
+
+def _fingerprint(path, prefix_size=None):
+    """sha1 do arquivo inteiro e, se prefix_size for dado, dos seus primeiros prefix_size bytes."""
+    digest, prefix, offset = hashlib.sha1(), None, 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK)
+            if not block:
+                break
+            if prefix_size is not None and prefix is None and offset + len(block) >= prefix_size:
+                cut = prefix_size - offset
+                digest.update(block[:cut])
+                prefix = digest.hexdigest()
+                digest.update(block[cut:])
+            else:
+                digest.update(block)
+            offset += len(block)
+    return digest.hexdigest(), prefix
+
+
+def _source_state(path):
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        f.seek(max(stat.st_size - 1, 0))
+        ends_with_newline = f.read(1) == b"\n"
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "ends_with_newline": ends_with_newline}
+
+
+def _convert_chunk(chunk, column_types, categories):
+    """Bloco do CSV → {coluna: array tipado}; categories (rótulo → código) cresce com rótulos novos."""
+    ids = {c: pd.to_numeric(chunk[c], errors="coerce") for c, kind in column_types.items() if kind == ID}
+    valid = np.ones(len(chunk), dtype=bool)
+    for values in ids.values():
+        valid &= values.notna().to_numpy()
+    out = {}
+    for column, kind in column_types.items():
+        if kind == ID:
+            out[column] = ids[column].to_numpy()[valid].astype(np.int64)
+        elif kind == FLOAT:
+            out[column] = pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype=np.float32)[valid]
+        elif kind == DATETIME:
+            out[column] = parse_datetimes(chunk[column]).to_numpy()[valid]
+        else:
+            codes, labels = pd.factorize(chunk[column].to_numpy(dtype=object)[valid])
+            mapping = categories.setdefault(column, {})
+            lookup = np.array([mapping.setdefault(label, len(mapping)) for label in labels] + [-1], dtype=np.int64)
+            out[column] = lookup[codes]   # código -1 (NaN) cai na última posição
+    return out, int((~valid).sum())
+
+
+def _read_typed(path, sep, column_types, header, offset=0):
+    """Converte o CSV (a partir do byte offset, sem cabeçalho) em blocos; devolve (colunas, descartadas, rótulos)."""
+    text_columns = {c: str for c, kind in column_types.items() if kind in (CATEGORY, DATETIME)}
+    parts, dropped, categories = {c: [] for c in column_types}, 0, {}
+    with open(path, "rb") as f:
+        f.seek(offset)
+        options = dict(sep=sep, usecols=list(column_types), dtype=text_columns, chunksize=CSV_CHUNK_ROWS,
+                       on_bad_lines="warn", low_memory=False)
+        if offset:
+            options.update(header=None, names=header)
+        for chunk in pd.read_csv(f, **options):
+            converted, bad = _convert_chunk(chunk, column_types, categories)
+            dropped += bad
+            for column, values in converted.items():
+                parts[column].append(values)
+    columns = {c: np.concatenate(values) if values else np.empty(0, dtype=_empty_dtype(column_types[c]))
+               for c, values in parts.items()}
+    return columns, dropped, {c: list(mapping) for c, mapping in categories.items()}
+
+
+def _empty_dtype(kind):
+    return {ID: np.int64, FLOAT: np.float32, CATEGORY: np.int64, DATETIME: "datetime64[ns]"}[kind]
+
+
+def _compact(values, kind):
+    # ids em int32 e códigos de categoria em int16 quando cabem
+    if kind == ID:
+        fits = not len(values) or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max)
+        return values.astype(np.int32) if fits else values.astype(np.int64)
+    if kind == CATEGORY:
+        fits = not len(values) or values.max() < np.iinfo(np.int16).max
+        return values.astype(np.int16) if fits else values.astype(np.int32)
+    return values
+
+
+class RawCache:
+    """Colunas tipadas de um CSV, em cache_dir/<nome do CSV>.<hash do caminho>/ (um .npy por coluna)."""
+
+    def __init__(self, csv_path, column_types, sep=";", cache_dir=DEFAULT_CACHE_DIR):
+        unknown = {c: k for c, k in column_types.items() if k not in _KINDS}
+        if unknown:
+            raise ValueError(f"Tipos de coluna desconhecidos: {unknown} (use {_KINDS}).")
+        self.csv_path = csv_path
+        self.sep = sep
+        name = hashlib.sha1(f"{os.path.abspath(csv_path)}|{sep}".encode()).hexdigest()[:10]
+        self.dir = os.path.join(cache_dir, f"{os.path.basename(csv_path)}.{name}")
+        self.meta = self._sync(dict(column_types))
+
+    def _meta_path(self):
+        return os.path.join(self.dir, "meta.json")
+
+    def _load_meta(self):
+        try:
+            with open(self._meta_path(), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == CACHE_VERSION and meta.get("sep") == self.sep else None
+
+    def _sync(self, column_types):
+        """Garante o cache em dia com o CSV e com as colunas pedidas; devolve o meta.json."""
+        meta = self._load_meta()
+        state = _source_state(self.csv_path)
+        if meta is not None and not all(meta["types"].get(c) == k for c, k in column_types.items()):
+            column_types = {**meta["types"], **column_types}
+            logger.info("%s: colunas novas no cache %s; reconstruindo", self.csv_path, sorted(column_types))
+            meta = None
+        if meta is not None:
+            old = meta["source"]
+            if old["size"] == state["size"] and old["mtime_ns"] == state["mtime_ns"]:
+                return meta
+            grew = state["size"] > old["size"] and old["ends_with_newline"]
+            sha1, prefix = _fingerprint(self.csv_path, old["size"] if grew else None)
+            if sha1 == old["sha1"]:
+                # Mesmo conteúdo (arquivo copiado/tocado): só registra o novo mtime
+                meta["source"].update(state)
+                self._write_meta(meta)
+                return meta
+            if grew and prefix == old["sha1"]:
+                return self._append(meta, state, sha1)
+            logger.info("%s mudou; reconstruindo o cache", self.csv_path)
+        return self._build(column_types, state)
+
+    def _build(self, column_types, state):
+        started = time.perf_counter()
+        header = pd.read_csv(self.csv_path, sep=self.sep, nrows=0).columns.tolist()
+        missing = [c for c in column_types if c not in header]
+        if missing:
+            raise ValueError(f"Colunas {missing} não existem em '{self.csv_path}'.")
+        sha1, _ = _fingerprint(self.csv_path)
+        columns, dropped, categories = _read_typed(self.csv_path, self.sep, column_types, header)
+        meta = {"version": CACHE_VERSION, "sep": self.sep, "header": header, "types": column_types,
+                "source": {**state, "sha1": sha1}, "dropped": dropped}
+        self._write_columns(meta, columns, categories)
+        logger.info("%s: cache criado com %d linhas em %.1fs", self.csv_path, meta["rows"], time.perf_counter() - started)
+        return meta
+
+    def _append(self, meta, state, sha1):
+        # Só as linhas depois do tamanho antigo (que terminava em '\n') são convertidas
+        started = time.perf_counter()
+        types = meta["types"]
+        new, dropped, new_categories = _read_typed(self.csv_path, self.sep, types, meta["header"],
+                                                   offset=meta["source"]["size"])
+        columns, categories = {}, {}
+        for column, kind in types.items():
+            old = self.column(column, meta)
+            values = new[column]
+            if kind == CATEGORY:
+                # Códigos do bloco novo → posição na lista de rótulos já existente (novos vão ao fim)
+                labels = list(meta["categories"][column])
+                position = {label: i for i, label in enumerate(labels)}
+                for label in new_categories.get(column, []):
+                    if label not in position:
+                        position[label] = len(labels)
+                        labels.append(label)
+                lookup = np.array([position[label] for label in new_categories.get(column, [])] + [-1], dtype=np.int64)
+                values = lookup[values]
+                categories[column] = labels
+            columns[column] = np.concatenate([np.asarray(old).astype(values.dtype, copy=False), values])
+        meta = {**meta, "source": {**state, "sha1": sha1}, "dropped": meta["dropped"] + dropped}
+        self._write_columns(meta, columns, categories)
+        logger.info("%s: %d linhas novas acrescentadas ao cache em %.1fs", self.csv_path, len(new[next(iter(new))]),
+                    time.perf_counter() - started)
+        return meta
+
+    def _write_columns(self, meta, columns, categories):
+        # Arquivos de uma nova geração (nomes nunca reusados: um processo pode ainda ter os antigos
+        # em memmap); o meta.json trocado por último aponta para eles
+        os.makedirs(self.dir, exist_ok=True)
+        generation = time.time_ns()
+        meta.update(generation=generation, files={}, dtypes={}, categories={}, sorted={})
+        for column, values in columns.items():
+            kind = meta["types"][column]
+            values = _compact(values, kind) if kind != DATETIME else values.astype("datetime64[ns]")
+            if kind == ID:
+                meta["sorted"][column] = bool(np.all(values[1:] >= values[:-1]))
+            filename = f"{hashlib.sha1(column.encode()).hexdigest()[:8]}.{generation}.npy"
+            np.save(os.path.join(self.dir, filename), values)
+            meta["files"][column] = filename
+            meta["dtypes"][column] = str(values.dtype)
+            if kind == CATEGORY:
+                meta["categories"][column] = categories.get(column, [])
+        meta["rows"] = len(next(iter(columns.values()))) if columns else 0
+        self._write_meta(meta)
+        keep = set(meta["files"].values()) | {"meta.json"}
+        for filename in os.listdir(self.dir):
+            if filename not in keep:
+                os.remove(os.path.join(self.dir, filename))
+
+    def _write_meta(self, meta):
+        temp = f"{self._meta_path()}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp, self._meta_path())
+
+    def column(self, name, meta=None):
+        """Coluna inteira em memmap (códigos, no caso de categoria)."""
+        meta = meta or self.meta
+        return np.load(os.path.join(self.dir, meta["files"][name]), mmap_mode="r")
+
+    def is_sorted(self, key):
+        """True se a coluna de ids está em ordem não decrescente no CSV."""
+        return bool(self.meta["sorted"].get(key))
+
+    def iter_rows(self, key, keep, key_range=None, block_rows=SCAN_ROWS):
+        """Posições das linhas em que keep(Series de ids) é True, por blocos de block_rows linhas do CSV.
+
+        key_range: (menor, maior) id que keep pode aceitar; só encurta a busca se a coluna for ordenada.
+        """
+        ids = self.column(key)
+        start, stop = 0, len(ids)
+        if key_range is not None and self.is_sorted(key):
+            bounds = np.iinfo(ids.dtype)
+            start = int(np.searchsorted(ids, max(int(key_range[0]), bounds.min), side="left"))
+            stop = int(np.searchsorted(ids, min(int(key_range[1]), bounds.max), side="right"))
+        for first in range(start, stop, block_rows):
+            block = pd.Series(ids[first:min(first + block_rows, stop)], copy=False)
+            yield np.flatnonzero(np.asarray(keep(block), dtype=bool)) + first
+
+    def frame(self, columns, rows, key):
+        """DataFrame das linhas `rows`, com a chave em int64 (como no caminho do CSV)."""
+        frame = pd.DataFrame({c: self.take(c, rows) for c in columns})
+        frame[key] = frame[key].astype(np.int64)
+        return frame
+
+    def take(self, name, rows):
+        """Linhas `rows` (índices ou máscara) da coluna, já como Series tipada."""
+        values = self.column(name)[rows]
+        if self.meta["types"][name] == CATEGORY:
+            return pd.Series(pd.Categorical.from_codes(values.astype(np.int64),
+                                                       categories=self.meta["categories"][name]), name=name)
+        return pd.Series(values, name=name)
+
+
+def read_cached_rows(path, columns, key, keep, column_types, sep=";", cache_dir=DEFAULT_CACHE_DIR, key_range=None):
+    """Como feature_store.read_csv_rows, mas das colunas tipadas em cache (o CSV só é lido se mudou).
+
+    column_types: {coluna: 'id' | 'float' | 'category' | 'datetime'} de todas as `columns`.
+    key_range: (menor, maior) id aceito por keep, para a busca binária (RawCache.iter_rows).
+    A chave volta como int64, como no caminho do CSV.
+    """
+    missing = [c for c in columns if c not in column_types]
+    if missing:
+        raise ValueError(f"Sem tipo para as colunas {missing} em column_types.")
+    cache = RawCache(path, {c: column_types[c] for c in columns}, sep=sep, cache_dir=cache_dir)
+    rows = np.concatenate([np.empty(0, dtype=np.int64), *cache.iter_rows(key, keep, key_range)])
+    return cache.frame(columns, rows, key)
+
+
+# — Paridade + benchmark —
+def _write_synthetic(folder, n_rides):
+    rng = np.random.default_rng(0)
+    ids = np.arange(1, n_rides + 1)
+    stamps = np.datetime64("2023-01-01") + rng.integers(0, 3 * 365 * 86400, n_rides).astype("timedelta64[s]")
+    created = pd.Series(stamps).dt.strftime("%Y-%m-%d %H:%M:%S.%f").to_numpy(dtype=object)
+    created[rng.random(n_rides) < 0.001] = "invalido"
+    rides = pd.DataFrame({"RideID": ids, "Create": created, "UserID": rng.integers(0, 10**6, n_rides),
+                          "Status": rng.choice(["done", "cancelled"], n_rides), "Notes": "x" * 20})
+    products = np.array(["UberX", "Comfort", "Black", "pop99", "comfort99"])
+    repeated = np.repeat(ids, 3)
+    estimates = pd.DataFrame({"RideID": repeated, "ProductID": rng.choice(products, len(repeated)),
+                              "Price": rng.uniform(5, 120, len(repeated)).round(2),
+                              "Eta": rng.integers(1, 20, len(repeated)), "Currency": "BRL"})
+    paths = os.path.join(folder, "ride_v2.csv"), os.path.join(folder, "rideestimative_v3.csv")
+    rides.to_csv(paths[0], sep=";", index=False)
+    estimates.to_csv(paths[1], sep=";", index=False)
+    return paths
+
+
+def _timed(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+def _benchmark(n_rides):
+    from feature_store import read_csv_rows
+    types = {"RideID": ID, "Create": DATETIME, "ProductID": CATEGORY, "Price": FLOAT}
+    with tempfile.TemporaryDirectory() as folder:
+        rides_csv, estim_csv = _write_synthetic(folder, n_rides)
+        cache_dir = os.path.join(folder, "cache")
+        print(f"{n_rides:,} corridas, {3 * n_rides:,} estimativas")
+        mismatched = []
+        for label, csv, columns in (("corridas", rides_csv, ["RideID", "Create"]),
+                                    ("estimativas", estim_csv, ["RideID", "ProductID", "Price"])):
+            # Rodada completa (tudo é novo) e re-execução (só as corridas acima de um high-water mark)
+            for keep_label, keep in (("todas", lambda ids: ids.notna()),
+                                     ("novas", lambda ids: ids > int(n_rides * 0.99))):
+                expected, t_csv, m_csv = _timed(lambda: read_csv_rows(csv, columns, "RideID", keep))
+                cold = ""
+                if keep_label == "todas":
+                    _, t_cold, m_cold = _timed(lambda: read_cached_rows(csv, columns, "RideID", keep, types,
+                                                                         cache_dir=cache_dir))
+                    cold = f" | cache (criação) {t_cold:.2f}s {m_cold:.0f}MB"
+                actual, t_warm, m_warm = _timed(lambda: read_cached_rows(csv, columns, "RideID", keep, types,
+                                                                          cache_dir=cache_dir))
+                print(f"{label:11} {keep_label:5} ({len(actual):,} linhas): CSV {t_csv:.2f}s {m_csv:.0f}MB{cold} | "
+                      f"cache {t_warm:.3f}s {m_warm:.0f}MB | {t_csv / t_warm:.0f}x")
+                if not _same_rows(expected, actual, types):
+                    mismatched.append(f"{label}/{keep_label}")
+
+        # CSV que cresceu: só as linhas novas são convertidas
+        extra = pd.read_csv(estim_csv, sep=";", nrows=1000)
+        extra["RideID"] += n_rides
+        extra.loc[0, "ProductID"] = "taxi"
+        extra.to_csv(estim_csv, sep=";", index=False, header=False, mode="a")
+        keep = lambda ids: ids > n_rides
+        actual, t_append, _ = _timed(lambda: read_cached_rows(estim_csv, ["RideID", "ProductID", "Price"], "RideID",
+                                                              keep, types, cache_dir=cache_dir))
+        expected = read_csv_rows(estim_csv, ["RideID", "ProductID", "Price"], "RideID", keep)
+        print(f"estimativas + 1.000 linhas no fim: {t_append:.2f}s (só o trecho novo)")
+        if not _same_rows(expected, actual, types):
+            mismatched.append("append")
+    print(f"paridade: {not mismatched}")
+    if mismatched:
+        print(f"diferenças em: {mismatched}")
+        raise SystemExit(1)
+
+
+def _same_rows(expected, actual, types):
+    # Compara após aplicar ao CSV as mesmas conversões do cache
+    if len(expected) != len(actual):
+        return False
+    for column in expected.columns:
+        kind = types[column]
+        left, right = expected[column].reset_index(drop=True), actual[column].reset_index(drop=True)
+        if kind == DATETIME:
+            left = parse_datetimes(left)
+        elif kind == FLOAT:
+            left = pd.to_numeric(left, errors="coerce").astype(np.float32)
+        elif kind == CATEGORY:
+            left, right = left.astype(object), right.astype(object)
+        if not left.equals(right.astype(left.dtype)):
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paridade e benchmark do cache colunar dos CSVs")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    _benchmark(parser.parse_args().rows)
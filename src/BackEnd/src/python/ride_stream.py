@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+# src/python/ride_stream.py
+"""
+Leitura em streaming do rideaddress_v1.csv para o rotas.py, com memória limitada:
+- CSV lido em blocos de chunk_rows linhas (só as 4 colunas usadas)
+- Coordenadas limpas por bloco (coord_parsing.clean_coords)
+- Por corrida, só somas/contagens de origem e destino em colunas tipadas (float64/int32),
+  o mesmo resultado do pivot_table(aggfunc='mean') sem montar o arquivo inteiro
+- Uma corrida sai assim que tem origem e destino e passou settle_chunks blocos sem novas
+  linhas; o roteamento começa antes do fim do arquivo
+- Filtro de bounding-box aplicado a cada corrida emitida
+- shard=(i, n): só as corridas com shard_of(ride_id, n) == i (execução em vários processos)
+
+Ordem: um dump ordenado por RideID (as linhas de uma corrida juntas) é o caso rápido. Uma
+corrida com id abaixo do último lido não recebe mais linhas, então sai do estado pendente
+(emitida ou, sem origem/destino, contada em stats['incomplete']) e deixa de ser lembrada.
+Antes da leitura, uma passada só pela coluna RideID confere a ordem; fora de ordem, as somas
+de cada bloco vão para spill_partitions arquivos temporários por hash do RideID e cada
+partição é agregada inteira no fim (mesmo resultado, memória de uma partição; o roteamento
+só começa depois da leitura). Linhas que chegam depois de a corrida ter sido emitida
+(settle_chunks=0 na fronteira de um bloco) são descartadas e contadas em stats['late_rows'].
+"""
+
+import os
+import logging
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from coord_parsing import clean_coords
+
+logger = logging.getLogger("ride_stream")
+
+ORIGIN, DESTINATION = 1, 2
+CSV_COLUMNS = {"Lat": "raw_lat", "Lng": "raw_lng", "RideAddressTypeID": "address_type", "RideID": "ride_id"}
+_SUM_COLUMNS = ["lat_o_sum", "lng_o_sum", "n_o", "lat_d_sum", "lng_d_sum", "n_d"]
+RIDE_COLUMNS = ["ride_id", "lat_o", "lng_o", "lat_d", "lng_d"]
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Teste fixo = corridas com shard_of(RideID, 5) == 0 (~20%), o mesmo no treino e na avaliação
+HOLDOUT_SHARDS = 5
+# Registro das somas parciais de uma corrida nos arquivos de partição (CSV fora de ordem)
+_SPILL_DTYPE = np.dtype([("ride_id", np.int64), ("lat_o_sum", np.float64), ("lng_o_sum", np.float64),
+                         ("n_o", np.int64), ("lat_d_sum", np.float64), ("lng_d_sum", np.float64),
+                         ("n_d", np.int64)])
+
+
+def shard_of(ride_ids, shard_count):
+    """Shard de cada ride_id: hash multiplicativo (Fibonacci) % shard_count.
+
+    Espalha ids sequenciais de forma uniforme e é estável entre execuções (resume por shard).
+    """
+    hashed = np.asarray(ride_ids, dtype=np.int64).view(np.uint64) * _HASH_MULTIPLIER
+    return ((hashed >> np.uint64(32)) % np.uint64(shard_count)).astype(np.int64)
+
+
+def is_holdout(ride_ids):
+    """Máscara das corridas de teste: estável entre execuções e igual para todas as categorias."""
+    return shard_of(ride_ids, HOLDOUT_SHARDS) == 0
+
+
+class RideStream:
+    """Itera blocos (DataFrame com RIDE_COLUMNS) de corridas completas lidas do CSV de endereços.
+
+    - chunk_rows: linhas lidas por bloco (limita o pico de memória da leitura).
+    - settle_chunks: blocos sem novas linhas até a corrida ser considerada completa.
+    - bbox: (min_lng, max_lng, min_lat, max_lat); corridas fora dele são descartadas.
+    - skip_ids: ride_ids já processados (resume); suas linhas são ignoradas na leitura.
+    - results_store: route_results.RouteResultsStore; ride_ids já gravados nele também são
+      ignorados (consulta indexada por bloco, sem carregar os resultados em memória).
+    - shard: (índice, total); só as corridas desse shard são lidas (None = todas).
+    - spill_partitions: partições em disco para um CSV fora de ordem (None = uma por
+      chunk_rows linhas); spill_dir: onde criá-las (None = diretório temporário do sistema).
+    """
+
+    def __init__(self, path, chunk_rows=500_000, settle_chunks=1, bbox=None, skip_ids=(), results_store=None,
+                 shard=None, encoding="utf-8", spill_partitions=None, spill_dir=None):
+        if chunk_rows < 1 or settle_chunks < 0:
+            raise ValueError("chunk_rows deve ser >= 1 e settle_chunks >= 0.")
+        if shard is not None and not 0 <= shard[0] < shard[1]:
+            raise ValueError("shard deve ser (índice, total) com 0 <= índice < total.")
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.settle_chunks = settle_chunks
+        self.bbox = bbox
+        self.results_store = results_store
+        self.shard = shard
+        self.encoding = encoding
+        self.spill_partitions = spill_partitions
+        self.spill_dir = spill_dir
+        # ride_ids já emitidos (ou processados antes), ordenados; os abaixo do último id lido
+        # são esquecidos a cada bloco (com o CSV ordenado, não voltam a aparecer)
+        self._emitted = np.unique(np.fromiter(skip_ids, dtype=np.int64))
+        self._last_id = -np.inf
+        self._pending = pd.DataFrame(columns=_SUM_COLUMNS + ["last_chunk"], dtype=np.float64)
+        self.stats = {
+            "chunks": 0,
+            "rows": 0,
+            "invalid_rows": 0,
+            "late_rows": 0,
+            "skipped_rows": 0,
+            "rides": 0,
+            "out_of_bbox": 0,
+            "incomplete": 0,
+            "max_pending": 0,
+            "max_emitted": 0,
+            "sorted": None,
+            "spill_partitions": 0,
+        }
+
+    def _read_chunks(self, usecols=None):
+        return pd.read_csv(
+            self.path,
+            sep=";",
+            encoding=self.encoding,
+            usecols=usecols or list(CSV_COLUMNS),
+            dtype={"Lat": str, "Lng": str},
+            chunksize=self.chunk_rows
+        )
+
+    def _scan_order(self):
+        """(CSV ordenado por RideID?, nº de linhas), lendo só a coluna RideID."""
+        last, rows, ordered = -np.inf, 0, True
+        for chunk in self._read_chunks(usecols=["RideID"]):
+            rows += len(chunk)
+            ids = pd.to_numeric(chunk["RideID"], errors="coerce").dropna().to_numpy()
+            if ordered and len(ids):
+                ordered = ids[0] >= last and not (ids[1:] < ids[:-1]).any()
+                last = ids[-1]
+        return ordered, rows
+
+    def _aggregate(self, chunk):
+        """Somas e contagens de origem/destino por ride_id de um bloco (linhas válidas)."""
+        chunk = chunk.rename(columns=CSV_COLUMNS)
+        ride_id = pd.to_numeric(chunk["ride_id"], errors="coerce")
+        if ride_id.notna().any():
+            self._last_id = max(self._last_id, ride_id.max())
+        if self.shard is not None and self.shard[1] > 1:
+            # linhas sem ride_id ficam no shard 0 (contadas uma única vez como inválidas)
+            index, count = self.shard
+            mine = np.where(ride_id.isna(), 0, shard_of(ride_id.fillna(0), count)) == index
+            chunk, ride_id = chunk[mine], ride_id[mine]
+        self.stats["rows"] += len(chunk)
+        address_type = pd.to_numeric(chunk["address_type"], errors="coerce")
+        lat = clean_coords(chunk["raw_lat"]).to_numpy()
+        lng = clean_coords(chunk["raw_lng"]).to_numpy()
+        valid = (ride_id.notna() & address_type.isin((ORIGIN, DESTINATION))).to_numpy() & \
+            ~(np.isnan(lat) | np.isnan(lng))
+        self.stats["invalid_rows"] += int(len(chunk) - valid.sum())
+
+        ids = ride_id.to_numpy()[valid].astype(np.int64)
+        is_origin = address_type.to_numpy()[valid] == ORIGIN
+        lat, lng = lat[valid], lng[valid]
+        late = np.isin(ids, self._emitted) if len(self._emitted) else np.zeros(len(ids), bool)
+        if late.any():
+            self.stats["late_rows"] += int(late.sum())
+            ids, is_origin, lat, lng = ids[~late], is_origin[~late], lat[~late], lng[~late]
+        if self.results_store is not None and len(ids):
+            done = self.results_store.processed_mask(ids)
+            if done.any():
+                self.stats["skipped_rows"] += int(done.sum())
+                ids, is_origin, lat, lng = ids[~done], is_origin[~done], lat[~done], lng[~done]
+
+        is_destination = ~is_origin
+        parts = pd.DataFrame({
+            "lat_o_sum": np.where(is_origin, lat, 0.0),
+            "lng_o_sum": np.where(is_origin, lng, 0.0),
+            "n_o": is_origin.astype(np.int32),
+            "lat_d_sum": np.where(is_destination, lat, 0.0),
+            "lng_d_sum": np.where(is_destination, lng, 0.0),
+            "n_d": is_destination.astype(np.int32),
+        }, index=pd.Index(ids, name="ride_id"))
+        return parts.groupby(level=0, sort=False).sum()
+
+    def _merge(self, aggregated, chunk_no):
+        pending = self._pending
+        if len(pending):
+            merged = pending[_SUM_COLUMNS].add(aggregated, fill_value=0)
+            merged["last_chunk"] = pending["last_chunk"].reindex(merged.index)
+        else:
+            merged = aggregated.astype(np.float64)
+            merged["last_chunk"] = np.nan
+        merged.loc[aggregated.index, "last_chunk"] = chunk_no
+        self._pending = merged
+
+    def _release(self, ready):
+        """Tira as corridas prontas do estado pendente e devolve-as com as médias."""
+        done = self._pending[ready]
+        self._pending = self._pending[~ready]
+        if self.stats["sorted"]:
+            # Fora de ordem cada corrida sai uma única vez, já inteira: nada a lembrar
+            self._emitted = np.union1d(self._emitted, done.index.to_numpy(dtype=np.int64))
+            self.stats["max_emitted"] = max(self.stats["max_emitted"], len(self._emitted))
+        rides = pd.DataFrame({
+            "ride_id": done.index.to_numpy(dtype=np.int64),
+            "lat_o": (done["lat_o_sum"] / done["n_o"]).to_numpy(),
+            "lng_o": (done["lng_o_sum"] / done["n_o"]).to_numpy(),
+            "lat_d": (done["lat_d_sum"] / done["n_d"]).to_numpy(),
+            "lng_d": (done["lng_d_sum"] / done["n_d"]).to_numpy(),
+        })
+        if self.bbox is not None:
+            min_lng, max_lng, min_lat, max_lat = self.bbox
+            inside = (
+                rides.lng_o.between(min_lng, max_lng) &
+                rides.lat_o.between(min_lat, max_lat) &
+                rides.lng_d.between(min_lng, max_lng) &
+                rides.lat_d.between(min_lat, max_lat)
+            )
+            self.stats["out_of_bbox"] += int(len(rides) - inside.sum())
+            rides = rides[inside].reset_index(drop=True)
+        self.stats["rides"] += len(rides)
+        return rides
+
+    def __iter__(self):
+        self.stats["sorted"], total_rows = self._scan_order()
+        if self.stats["sorted"]:
+            yield from self._iter_sorted()
+        else:
+            yield from self._iter_spilled(total_rows)
+        logger.info("Leitura concluída: %s", self.stats)
+
+    def _iter_sorted(self):
+        for chunk_no, chunk in enumerate(self._read_chunks()):
+            self.stats["chunks"] += 1
+            self._merge(self._aggregate(chunk), chunk_no)
+            self.stats["max_pending"] = max(self.stats["max_pending"], len(self._pending))
+            pending = self._pending
+            settled = (pending["last_chunk"] <= chunk_no - self.settle_chunks).to_numpy()
+            complete = ((pending["n_o"] > 0) & (pending["n_d"] > 0)).to_numpy()
+            # Abaixo do último id lido a corrida não recebe mais linhas: sem origem ou destino, não completa
+            abandoned = settled & ~complete & (pending.index.to_numpy() < self._last_id)
+            if abandoned.any():
+                self.stats["incomplete"] += int(abandoned.sum())
+                self._pending = pending = pending[~abandoned]
+                settled, complete = settled[~abandoned], complete[~abandoned]
+            self._emitted = self._emitted[np.searchsorted(self._emitted, self._last_id):]
+            ready = settled & complete
+            if ready.any():
+                rides = self._release(ready)
+                if len(rides):
+                    yield rides
+        # fim do arquivo: tudo o que tem origem e destino está completo
+        yield from self._flush()
+
+    def _iter_spilled(self, total_rows):
+        # Somas parciais de cada bloco → arquivo da partição (ride_id % partições); depois, cada
+        # partição tem todas as linhas das suas corridas e é agregada e emitida de uma vez
+        partitions = self.spill_partitions or max(1, -(-total_rows // self.chunk_rows))
+        self.stats["spill_partitions"] = partitions
+        logger.info("'%s' fora de ordem por RideID: agregando em %d partições em disco.", self.path, partitions)
+        with tempfile.TemporaryDirectory(prefix="ride_stream_", dir=self.spill_dir) as folder:
+            paths = [os.path.join(folder, f"{i}.bin") for i in range(partitions)]
+            for chunk in self._read_chunks():
+                self.stats["chunks"] += 1
+                aggregated = self._aggregate(chunk)
+                records = np.empty(len(aggregated), dtype=_SPILL_DTYPE)
+                records["ride_id"] = aggregated.index.to_numpy(dtype=np.int64)
+                for column in _SUM_COLUMNS:
+                    records[column] = aggregated[column].to_numpy()
+                part = records["ride_id"] % partitions
+                order = np.argsort(part, kind="stable")
+                records, bounds = records[order], np.searchsorted(part[order], np.arange(partitions + 1))
+                for i in np.flatnonzero(bounds[1:] > bounds[:-1]):
+                    with open(paths[i], "ab") as f:
+                        records[bounds[i]:bounds[i + 1]].tofile(f)
+            for path in paths:
+                if not os.path.exists(path):
+                    continue
+                records = np.fromfile(path, dtype=_SPILL_DTYPE)
+                self._pending = pd.DataFrame({c: records[c] for c in _SUM_COLUMNS},
+                                             index=pd.Index(records["ride_id"], name="ride_id")).groupby(level=0).sum()
+                self.stats["max_pending"] = max(self.stats["max_pending"], len(self._pending))
+                yield from self._flush()
+
+    def _flush(self):
+        # Tudo o que está pendente recebeu todas as suas linhas: completas saem, o resto é incompleto
+        pending = self._pending
+        ready = ((pending["n_o"] > 0) & (pending["n_d"] > 0)).to_numpy()
+        self.stats["incomplete"] += int(len(pending) - ready.sum())
+        if ready.any():
+            rides = self._release(ready)
+            if len(rides):
+                yield rides
+        self._pending = self._pending.iloc[0:0]
+
+    def batches(self, batch_size, sort_window=20_000):
+        """(ride_ids, origins, destinations) em batches de batch_size para o AsyncORSRouter.
+
+        As corridas prontas são acumuladas até sort_window e ordenadas por origem/destino
+        dentro da janela, para que pontos repetidos caiam no mesmo batch (Matrix 1→N).
+        """
+        buffer = []
+        buffered = 0
+        for rides in self:
+            buffer.append(rides)
+            buffered += len(rides)
+            if buffered >= sort_window:
+                rest = yield from _emit_batches(pd.concat(buffer, ignore_index=True), batch_size, keep_partial=True)
+                buffer, buffered = [rest], len(rest)
+        if buffered:
+            yield from _emit_batches(pd.concat(buffer, ignore_index=True), batch_size, keep_partial=False)
+
+
+def _emit_batches(rides, batch_size, keep_partial):
+    # Ordena a janela e gera os batches; devolve a sobra (batch incompleto) se keep_partial
+    rides = rides.sort_values(["lat_o", "lng_o", "lat_d", "lng_d"], kind="stable").reset_index(drop=True)
+    end = (len(rides) // batch_size) * batch_size if keep_partial else len(rides)
+    ids = rides.ride_id.tolist()
+    coords = list(zip(rides.lng_o, rides.lat_o, rides.lng_d, rides.lat_d))
+    for start in range(0, end, batch_size):
+        batch = coords[start:start + batch_size]
+        yield (ids[start:start + batch_size],
+               [(lng_o, lat_o) for lng_o, lat_o, _, _ in batch],
+               [(lng_d, lat_d) for _, _, lng_d, lat_d in batch])
+    return rides.iloc[end:]
@@ -2,212 +2,259 @@
 """
 Script robusto para cálculo de rotas com ORS local, salvando em append:
 - Health‐check com retry
-- Limpeza e validação de coordenadas
+- Leitura do CSV em blocos, com memória limitada; o roteamento começa antes do fim
+  do arquivo (ride_stream.py). CSV fora de ordem por RideID: agregado por partições em disco
+- Limpeza vetorizada e validação de coordenadas (coord_parsing.py)
 - Filtro de bounding‐box (Brasil)
-- Batch Matrix + fallback Directions
+- Batch Matrix + fallback Directions, com vários batches em voo (ors_client.py)
+- Concorrência adaptativa e backoff em erros do ORS
+- Cache persistente de rotas por coordenadas arredondadas (route_cache.py)
 - Barra de progresso no terminal
-- Salvamento incremental + resume automático
+- Salvamento incremental em SQLite por ride_id + resume automático (route_results.py)
+- Execução em shards: N processos, cada um com as corridas de hash(ride_id) % N e
+  o seu próprio ORS (ORS_BASE_URLS), com uma barra de progresso única
+
+Uso: python rotas.py
+     ORS_BASE_URLS=http://localhost:8082/ors,http://localhost:8083/ors python rotas.py
+     ROUTING_SHARDS=4 ORS_BASE_URLS=... python rotas.py   (shards distribuídos entre as URLs)
 """
 
-import re
 import os
 import time
+import asyncio
 import logging
-import requests
-import pandas as pd
-import numpy as np
-import openrouteservice
+import multiprocessing as mp
+from queue import Empty
 from tqdm import tqdm
+from ors_client import AsyncORSRouter, wait_until_ready
+from route_cache import route_cache_from_env
+from ride_stream import RideStream
+from route_results import RouteResultsStore
 
 # — Configurações gerais —
 ADDRESS_FILE_PATH      = r'c:/Projetos/Projeto4/src/BackEnd/src/python/data/rideaddress_v1.csv'
 OUTPUT_DIR             = r'./data'
-OUTPUT_CSV_FILE        = os.path.join(OUTPUT_DIR, 'ors_local_coords_only_results.csv')
+OUTPUT_CSV_FILE        = os.path.join(OUTPUT_DIR, 'ors_local_coords_only_results.csv')  # formato antigo (só importação)
+RESULTS_DB_FILE        = os.getenv('ROUTE_RESULTS_PATH', os.path.join(OUTPUT_DIR, 'route_results.sqlite'))
 PORTA_ORS              = 8082
 ORS_BASE_URL           = f'http://localhost:{PORTA_ORS}/ors'
+# Um ORS por shard (separados por vírgula); sem a variável, todos usam ORS_BASE_URL
+ORS_BASE_URLS          = [u.strip() for u in os.getenv('ORS_BASE_URLS', ORS_BASE_URL).split(',') if u.strip()]
+ROUTING_SHARDS         = int(os.getenv('ROUTING_SHARDS', str(len(ORS_BASE_URLS))))  # processos de roteamento
 REQUEST_TIMEOUT        = 60
 PAUSE_BETWEEN_BATCHES  = 0      # segundos de pausa entre batches
 MATRIX_BATCH_SIZE      = 50    # ajuste conforme memória e latência
+MAX_IN_FLIGHT          = int(os.getenv('ORS_MAX_IN_FLIGHT', '8'))  # requisições simultâneas ao ORS por shard (teto)
+MIN_IN_FLIGHT          = 1     # piso da concorrência adaptativa
+MAX_RETRIES            = 4     # tentativas extras em 429/5xx/timeout (com backoff exponencial)
+ROUTING_MODE           = os.getenv('ORS_ROUTING_MODE', 'grouped')  # grouped | pairwise | matrix (N×N legado)
+CSV_CHUNK_ROWS         = int(os.getenv('CSV_CHUNK_ROWS', '500000'))  # linhas do CSV por bloco (teto de memória)
+SORT_WINDOW            = 20_000  # corridas ordenadas por origem/destino antes de virar batches
+PROGRESS_INTERVAL      = 1.0    # segundos entre atualizações de progresso enviadas por shard
+WORKER_POLL_SECONDS    = 5.0    # sem mensagens nesse intervalo, confere se algum shard morreu
 
 # Limites aproximados do grafo (Brasil)
 MIN_LNG, MAX_LNG = -74.0, -34.0
 MIN_LAT, MAX_LAT = -35.0,   6.0
 
-# — Logging básico —
-logging.basicConfig(
-    format='[%(asctime)s] %(levelname)s: %(message)s',
-    level=logging.INFO,
-    datefmt='%H:%M:%S'
-)
-
-# — 0) Prepara diretório e retoma progresso anterior —
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-if os.path.exists(OUTPUT_CSV_FILE):
-    processed = pd.read_csv(OUTPUT_CSV_FILE, sep=';')['ride_id'].unique()
-    processed_set = set(processed)
-    logging.info("Retomando: %d rides já processadas serão puladas", len(processed_set))
-else:
-    processed_set = set()
-    logging.info("Nenhum arquivo anterior encontrado — início completo")
-
-# — 1) Health-check com retry —
-logging.info("Verificando ORS em %s/v2/health …", ORS_BASE_URL)
-for attempt in range(20):
+
+def setup_logging(prefix=''):
+    # — Logging básico — (com o shard no prefixo quando há vários processos)
+    logging.basicConfig(
+        format=f'[%(asctime)s] {prefix}%(levelname)s: %(message)s',
+        level=logging.INFO,
+        datefmt='%H:%M:%S',
+        force=True
+    )
+
+
+def prepare_results_store():
+    # — 0) Prepara diretório e o store de resultados (resume por consulta indexada) —
+    # Um único SQLite (WAL) para todos os shards: cada shard só lê e grava os seus ride_ids,
+    # então o resume é por shard e continua válido se o número de shards mudar.
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with RouteResultsStore(RESULTS_DB_FILE) as results_store:
+        if results_store.count() == 0 and os.path.exists(OUTPUT_CSV_FILE):
+            # migração única do CSV em append das versões anteriores
+            logging.info("Importando resultados anteriores de %s…", OUTPUT_CSV_FILE)
+            results_store.import_csv(OUTPUT_CSV_FILE)
+        already_done = results_store.count()
+    if already_done:
+        logging.info("Retomando: %d rides já processadas serão puladas", already_done)
+    else:
+        logging.info("Nenhum resultado anterior encontrado — início completo")
+
+
+def route_shard(shard_index, shard_count, base_url, progress=None):
+    """Roteia as corridas do shard (hash(ride_id) % shard_count == shard_index) no ORS base_url.
+
+    progress(corridas_gravadas, postfix) é chamado a cada batch concluído. Devolve as
+    estatísticas da leitura e do ORS.
+    """
+    # — 1) Health-check com retry —
+    wait_until_ready(base_url)
+
+    # — 2) Inicializa cache de rotas e cliente ORS (assíncrono, com janela de requisições em voo) —
+    # O mesmo arquivo (ROUTE_CACHE_PATH) é consultado pela API antes de chamar o ORS
+    route_cache = route_cache_from_env(os.path.join(OUTPUT_DIR, 'route_cache.sqlite'))
+    router = AsyncORSRouter(
+        base_url,
+        max_in_flight=MAX_IN_FLIGHT,
+        min_in_flight=MIN_IN_FLIGHT,
+        timeout=REQUEST_TIMEOUT,
+        max_retries=MAX_RETRIES,
+        routing_mode=ROUTING_MODE,
+        route_cache=route_cache
+    )
+    logging.info("Cliente ORS inicializado em %s (até %d requisições em voo, modo %s)",
+                 base_url, MAX_IN_FLIGHT, ROUTING_MODE)
+
+    # — 3) Leitura em streaming: corridas completas viram batches enquanto o CSV é lido —
+    # Só somas/contagens das corridas ainda incompletas ficam em memória (ride_stream.py);
+    # as já gravadas no store (resume) e as de outros shards são ignoradas na leitura.
+    logging.info("1. Lendo CSV de endereços em blocos de %d linhas: %s", CSV_CHUNK_ROWS, ADDRESS_FILE_PATH)
+    results_store = RouteResultsStore(RESULTS_DB_FILE)
+    stream = RideStream(
+        ADDRESS_FILE_PATH,
+        chunk_rows=CSV_CHUNK_ROWS,
+        bbox=(MIN_LNG, MAX_LNG, MIN_LAT, MAX_LAT),
+        results_store=results_store,
+        shard=(shard_index, shard_count)
+    )
+
+    # — 4/5) Loop de batches concorrentes com salvamento incremental —
+    logging.info("2. Calculando em batches de %d (%d em voo no máximo)…", MATRIX_BATCH_SIZE, MAX_IN_FLIGHT)
+
+    def save_batch(batch_results):
+        # grava o batch numa transação assim que ele termina (ordem de conclusão; ride_id é a chave)
+        results_store.put_many(batch_results)
+        if progress is not None:
+            progress(len(batch_results), dict(em_voo=router.limiter.limit, retries=router.stats["retries"],
+                                              fallbacks=router.stats["matrix_fallbacks"],
+                                              cache=router.stats["cache_hits"]))
+        if PAUSE_BETWEEN_BATCHES:
+            time.sleep(PAUSE_BETWEEN_BATCHES)
+
+    started = time.perf_counter()
+    with router:
+        asyncio.run(router.run_batches(stream.batches(MATRIX_BATCH_SIZE, SORT_WINDOW), save_batch,
+                                       threaded_source=True))
+    elapsed = time.perf_counter() - started
+    results_store.close()
+    logging.info("ORS: %d requisições, %d rotas calculadas, %d retries, %d erros, %d fallbacks em %.1fs.",
+                 router.stats["requests"], router.stats["routes_computed"], router.stats["retries"],
+                 router.stats["errors"], router.stats["matrix_fallbacks"], elapsed)
+    if route_cache is not None:
+        logging.info("Cache de rotas: %s", route_cache.stats())
+    return dict(stream.stats)
+
+
+def _shard_worker(shard_index, shard_count, base_url, queue):
+    # Processo de um shard: o progresso vai por fila para a barra única do processo principal
+    setup_logging(f'shard {shard_index + 1}/{shard_count} ')
+    unreported = [0, time.monotonic()]
+
+    def progress(n_rides, postfix):
+        unreported[0] += n_rides
+        if time.monotonic() - unreported[1] >= PROGRESS_INTERVAL:
+            queue.put(('progress', shard_index, unreported[0], postfix))
+            unreported[:] = [0, time.monotonic()]
+
     try:
-        r = requests.get(f"{ORS_BASE_URL}/v2/health", timeout=10)
-        r.raise_for_status()
-        if r.json().get('status') == 'ready':
-            logging.info("ORS está pronto!")
-            break
-        logging.warning("ORS não pronto (status=%s), retry…", r.json().get('status'))
+        stats = route_shard(shard_index, shard_count, base_url, progress)
+        queue.put(('progress', shard_index, unreported[0], {}))
+        queue.put(('done', shard_index, stats, None))
     except Exception as e:
-        logging.warning("Health-check falhou (%s), retry em 5s…", e)
-    time.sleep(5)
-else:
-    raise RuntimeError("ORS local não ficou pronto a tempo.")
-
-# — 2) Inicializa cliente ORS —
-client = openrouteservice.Client(base_url=ORS_BASE_URL, timeout=REQUEST_TIMEOUT)
-logging.info("Cliente ORS inicializado em %s", ORS_BASE_URL)
-
-# — 3) Carregamento e limpeza dos dados —
-logging.info("1. Carregando CSV de endereços: %s", ADDRESS_FILE_PATH)
-df = pd.read_csv(
-    ADDRESS_FILE_PATH,
-    sep=';',
-    encoding='utf-8',
-    usecols=["Lat","Lng","RideAddressTypeID","RideID"],
-    low_memory=False
-).rename(columns={
-    "Lat":"raw_lat",
-    "Lng":"raw_lng",
-    "RideAddressTypeID":"address_type",
-    "RideID":"ride_id"
-})
-
-def clean_coord(x):
-    if pd.isna(x): return np.nan
-    s = str(x).replace(',', '.')
-    m = re.search(r'[-+]?\d*\.\d+|\d+', s)
-    return float(m.group()) if m else np.nan
-
-logging.info("2. Limpando coordenadas…")
-df['lat'] = df['raw_lat'].map(clean_coord)
-df['lng'] = df['raw_lng'].map(clean_coord)
-df.dropna(subset=['lat','lng'], inplace=True)
-
-# validação de origem/destino
-counts = df.groupby(['ride_id','address_type']).size().unstack(fill_value=0)
-valid_ids = counts[(counts.get(1,0)>=1) & (counts.get(2,0)>=1)].index.get_level_values(0)
-logging.info("→ %d rides com origem e destino válidos", len(valid_ids))
-df = df[df['ride_id'].isin(valid_ids)]
-
-# pivot para lat_o/lng_o e lat_d/lng_d
-logging.info("3. Pivotando origens/destinos…")
-pivot = df.pivot_table(
-    index='ride_id',
-    columns='address_type',
-    values=['lat','lng'],
-    aggfunc='mean'
-)
-pivot.columns = ['lat_o','lat_d','lng_o','lng_d']
-pivot.reset_index(inplace=True)
-
-# filtro pelo bounding-box do Brasil
-mask = (
-    pivot.lng_o.between(MIN_LNG,MAX_LNG) &
-    pivot.lat_o.between(MIN_LAT,MAX_LAT) &
-    pivot.lng_d.between(MIN_LNG,MAX_LNG) &
-    pivot.lat_d.between(MIN_LAT,MAX_LAT)
-)
-removed = len(pivot) - mask.sum()
-if removed:
-    logging.warning("Removendo %d rides fora do Brasil", removed)
-rides = pivot[mask].reset_index(drop=True)
-total = len(rides)
-logging.info("→ %d corridas finais para processar", total)
-
-# — 4) Função batch_matrix com fallback —
-def batch_matrix(origins, destinations):
-    try:
-        body = {
-            "locations": origins + destinations,
-            "metrics": ["distance","duration"],
-            "units": "m",
-            "sources": list(range(len(origins))),
-            "destinations": list(range(len(origins), len(origins)+len(destinations)))
-        }
-        resp = client.request("/v2/matrix/driving-car", post_json=body)
-        dists = resp.get("distances", [])
-        durs  = resp.get("durations", [])
-        return (
-            [dists[i][i] if i<len(dists) and i<len(dists[i]) else np.nan for i in range(len(origins))],
-            [durs[i][i]  if i<len(durs)  and i<len(durs[i])  else np.nan for i in range(len(origins))]
-        )
-    except openrouteservice.exceptions.ApiError as e:
-        logging.warning("Matrix falhou: %s", e)
-        return None, None
-
-# — 5) Loop de batches com salvamento incremental —
-coords = list(zip(rides.lng_o, rides.lat_o, rides.lng_d, rides.lat_d))
-ids    = rides.ride_id.tolist()
-write_header = not os.path.exists(OUTPUT_CSV_FILE)
-
-logging.info("5. Calculando em batches de %d…", MATRIX_BATCH_SIZE)
-with tqdm(range(0, total, MATRIX_BATCH_SIZE), desc="Batches") as bar:
-    for start in bar:
-        batch_ids = ids[start:start+MATRIX_BATCH_SIZE]
-        # se **todos** já processados, pula o batch inteiro
-        if all(rid in processed_set for rid in batch_ids):
-            continue
+        logging.exception("Shard %d falhou", shard_index + 1)
+        queue.put(('failed', shard_index, repr(e), None))
+
+
+def run_sharded(shard_count, base_urls):
+    """Um processo por shard; as URLs do ORS são distribuídas em rodízio entre os shards."""
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    workers = []
+    for i in range(shard_count):
+        base_url = base_urls[i % len(base_urls)]
+        logging.info("Shard %d/%d → %s", i + 1, shard_count, base_url)
+        worker = ctx.Process(target=_shard_worker, args=(i, shard_count, base_url, queue),
+                             name=f'rotas-shard-{i + 1}')
+        worker.start()
+        workers.append(worker)
 
-        batch = coords[start:start+MATRIX_BATCH_SIZE]
-        origins      = [(lng_o, lat_o) for lng_o,lat_o,_,_ in batch]
-        destinations = [(lng_d, lat_d) for _,_,lng_d,lat_d in batch]
-
-        dists, durs = batch_matrix(origins, destinations)
-        batch_results = []
-
-        if dists is None:
-            # fallback one-by-one sem sleep
-            for idx, (o, d) in enumerate(zip(origins, destinations)):
-                ride_id = batch_ids[idx]
-                if ride_id in processed_set:  # pula individuais já feitos
-                    continue
-                try:
-                    r = client.directions(coordinates=[o,d], profile="driving-car", format="json")
-                    s = r['routes'][0]['summary']
-                    batch_results.append((ride_id, s['distance'], s['duration'], None))
-                except Exception as e:
-                    logging.debug("Fallback erro ride %s: %s", ride_id, e)
-                    batch_results.append((ride_id, np.nan, np.nan, "FALLBACK_ERR"))
+    bar = tqdm(desc="Corridas", unit="corrida")
+    per_shard = [0] * shard_count
+    results, failures = {}, {}
+
+    def handle(message):
+        kind, shard_index, payload, postfix = message
+        if kind == 'progress':
+            per_shard[shard_index] += payload
+            bar.update(payload)
+            if postfix:
+                bar.set_postfix(shards='/'.join(map(str, per_shard)), **postfix)
+        elif kind == 'done':
+            results[shard_index] = payload
         else:
-            # usa matrix
-            for idx, (dist, dur) in enumerate(zip(dists, durs)):
-                ride_id = batch_ids[idx]
-                if ride_id in processed_set:
-                    continue
-                if pd.notna(dist) and pd.notna(dur):
-                    batch_results.append((ride_id, dist, dur, None))
-                else:
-                    batch_results.append((ride_id, np.nan, np.nan, "NO_ROUTE"))
-
-        # grava o batch
-        if batch_results:
-            df_out = pd.DataFrame(batch_results, columns=['ride_id','distance_m','duration_s','error'])
-            df_out.to_csv(
-                OUTPUT_CSV_FILE,
-                sep=';',
-                index=False,
-                header=write_header,
-                mode='a',
-                encoding='utf-8'
-            )
-            write_header = False
-            processed_set.update(r[0] for r in batch_results)
+            failures[shard_index] = payload
+
+    while len(results) + len(failures) < shard_count:
+        try:
+            handle(queue.get(timeout=WORKER_POLL_SECONDS))
+            continue
+        except Empty:
+            pass
+        # Um shard morto sem avisar (OOM kill, segfault, os._exit) nunca mandaria 'done'/'failed'
+        dead = [i for i, worker in enumerate(workers)
+                if worker.exitcode is not None and i not in results and i not in failures]
+        if not dead:
+            continue
+        try:
+            # O que ele tenha mandado antes de sair ainda pode estar no pipe
+            while True:
+                handle(queue.get(timeout=1.0))
+        except Empty:
+            pass
+        for i in dead:
+            if i not in results and i not in failures:
+                failures[i] = f"processo terminou sem resposta (exitcode {workers[i].exitcode})"
+    bar.close()
+    for worker in workers:
+        worker.join()
+    for shard_index, error in sorted(failures.items()):
+        logging.error("Shard %d/%d falhou: %s (rode de novo para retomar)", shard_index + 1, shard_count, error)
+    return list(results.values())
+
+
+def main():
+    setup_logging()
+    prepare_results_store()
+    if ROUTING_SHARDS > 1:
+        logging.info("Rodando %d shards em %d ORS", ROUTING_SHARDS, len(ORS_BASE_URLS))
+        shard_stats = run_sharded(ROUTING_SHARDS, ORS_BASE_URLS)
+    else:
+        bar = tqdm(desc="Corridas", unit="corrida")
+
+        def progress(n_rides, postfix):
+            bar.update(n_rides)
+            bar.set_postfix(**postfix)
+
+        shard_stats = [route_shard(0, 1, ORS_BASE_URLS[0], progress)]
+        bar.close()
+
+    if shard_stats:
+        read_stats = {key: sum(stats[key] for stats in shard_stats) for key in shard_stats[0]}
+        if read_stats["invalid_rows"] or read_stats["late_rows"]:
+            logging.warning("%d linhas inválidas (coordenada/tipo) e %d linhas tardias descartadas",
+                            read_stats["invalid_rows"], read_stats["late_rows"])
+        logging.info("→ %d corridas roteadas, %d fora do Brasil, %d sem origem ou destino",
+                     read_stats["rides"], read_stats["out_of_bbox"], read_stats["incomplete"])
+
+    # — 6) Conclusão —
+    with RouteResultsStore(RESULTS_DB_FILE) as results_store:
+        logging.info("Processamento finalizado. Total gravado: %d rides (%d com erro) em %s.",
+                     results_store.count(), results_store.count(errors=True), RESULTS_DB_FILE)
 
-        if PAUSE_BETWEEN_BATCHES:
-            time.sleep(PAUSE_BETWEEN_BATCHES)
 
-# — 6) Conclusão —
-logging.info("Processamento finalizado. Total gravado: %d rides.", len(processed_set))
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# src/python/route_cache.py
+# Cache persistente de rotas (SQLite), compartilhado pelo rotas.py e pela API.
+#
+# Muitas corridas repetem os mesmos pontos (prédios, aeroportos). A chave é o par
+# origem/destino com as coordenadas arredondadas para uma grade (precision casas decimais;
+# 4 casas ~ 11 m), de modo que pontos quase iguais reaproveitam a mesma rota.
+#
+# Invalidação: cada entrada guarda o graph_version com que foi calculada (ex: data do
+# extrato OSM do ORS). Ao trocar o grafo, basta mudar ROUTE_CACHE_GRAPH_VERSION: entradas
+# de outra versão passam a contar como falta e podem ser apagadas com purge(). Também é
+# possível limitar a idade das entradas com max_age_days.
+#
+# As coordenadas seguem a ordem do ORS: (lng, lat).
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS routes (
+    profile       TEXT    NOT NULL,
+    lng_o         INTEGER NOT NULL,
+    lat_o         INTEGER NOT NULL,
+    lng_d         INTEGER NOT NULL,
+    lat_d         INTEGER NOT NULL,
+    distance_m    REAL    NOT NULL,
+    duration_s    REAL    NOT NULL,
+    geometry      TEXT,
+    graph_version TEXT    NOT NULL,
+    created_at    REAL    NOT NULL,
+    PRIMARY KEY (profile, lng_o, lat_o, lng_d, lat_d)
+) WITHOUT ROWID
+"""
+
+# Limite de variáveis por consulta do SQLite (versões antigas aceitam só 999)
+_MAX_VARIABLES = 900
+
+
+class RouteCache:
+    """Cache de rotas em SQLite (modo WAL: vários processos leem enquanto um escreve).
+
+    - precision: casas decimais da grade de coordenadas (4 ~ 11 m, 3 ~ 110 m).
+    - graph_version: identifica o grafo de ruas; entradas de outra versão são ignoradas.
+    - max_age_days: se definido, entradas mais antigas também contam como falta.
+    """
+
+    def __init__(self, path, precision=4, graph_version="default", max_age_days=None, profile="driving-car"):
+        if not 0 <= precision <= 7:
+            raise ValueError("precision deve estar entre 0 e 7 casas decimais.")
+        self.path = path
+        self.precision = precision
+        self.graph_version = str(graph_version)
+        self.max_age_days = max_age_days
+        self.profile = profile
+        self._scale = 10 ** precision
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(SCHEMA)
+        conn.commit()
+
+    def _conn(self):
+        # Uma conexão por thread (sqlite3 não compartilha conexões entre threads por padrão)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def snap(self, origin, destination):
+        """Chave da grade: (lng_o, lat_o, lng_d, lat_d) como inteiros escalados."""
+        return tuple(int(round(float(value) * self._scale)) for value in (*origin, *destination))
+
+    def _min_created_at(self):
+        if self.max_age_days is None:
+            return 0.0
+        return time.time() - self.max_age_days * 86400
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get(self, origin, destination, require_geometry=False):
+        """{'distance_m', 'duration_s', 'geometry'} da rota em cache, ou None."""
+        return self.get_many([(origin, destination)], require_geometry=require_geometry)[0]
+
+    def get_many(self, pairs, require_geometry=False):
+        """Consulta vários pares (origem, destino) de uma vez; devolve uma lista alinhada (None = falta)."""
+        keys = [self.snap(origin, destination) for origin, destination in pairs]
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        conn = self._conn()
+        for start in range(0, len(unique), _MAX_VARIABLES // 4):
+            chunk = unique[start:start + _MAX_VARIABLES // 4]
+            condition = " OR ".join(["(lng_o=? AND lat_o=? AND lng_d=? AND lat_d=?)"] * len(chunk))
+            rows = conn.execute(
+                f"SELECT lng_o, lat_o, lng_d, lat_d, distance_m, duration_s, geometry FROM routes "
+                f"WHERE profile=? AND graph_version=? AND created_at>=? AND ({condition})",
+                [self.profile, self.graph_version, self._min_created_at(), *(v for key in chunk for v in key)]
+            ).fetchall()
+            for row in rows:
+                if require_geometry and row[6] is None:
+                    continue
+                found[tuple(row[:4])] = {"distance_m": row[4], "duration_s": row[5], "geometry": row[6]}
+        results = [found.get(key) for key in keys]
+        hits = sum(result is not None for result in results)
+        self._count(hits, len(results) - hits)
+        return results
+
+    def put(self, origin, destination, distance_m, duration_s, geometry=None):
+        self.put_many([(origin, destination, distance_m, duration_s, geometry)])
+
+    def put_many(self, routes):
+        """Grava [(origem, destino, distance_m, duration_s[, geometry])].
+
+        Uma rota já em cache com geometria mantém a geometria se a nova não tiver.
+        """
+        now = time.time()
+        rows = []
+        for route in routes:
+            origin, destination, distance_m, duration_s = route[:4]
+            geometry = route[4] if len(route) > 4 else None
+            rows.append((self.profile, *self.snap(origin, destination), float(distance_m), float(duration_s),
+                         geometry, self.graph_version, now))
+        if not rows:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO routes (profile, lng_o, lat_o, lng_d, lat_d, distance_m, duration_s, geometry, "
+                "graph_version, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (profile, lng_o, lat_o, lng_d, lat_d) DO UPDATE SET "
+                "distance_m=excluded.distance_m, duration_s=excluded.duration_s, "
+                "geometry=COALESCE(excluded.geometry, CASE WHEN routes.graph_version=excluded.graph_version "
+                "THEN routes.geometry END), graph_version=excluded.graph_version, created_at=excluded.created_at",
+                rows
+            )
+        with self._lock:
+            self.writes += len(rows)
+
+    def purge(self, all_versions=False):
+        """Apaga entradas de outras versões do grafo (ou tudo, com all_versions=True) e as expiradas."""
+        conn = self._conn()
+        with conn:
+            if all_versions:
+                deleted = conn.execute("DELETE FROM routes").rowcount
+            else:
+                deleted = conn.execute(
+                    "DELETE FROM routes WHERE graph_version<>? OR created_at<?",
+                    (self.graph_version, self._min_created_at())
+                ).rowcount
+        return deleted
+
+    def stats(self):
+        entries = self._conn().execute(
+            "SELECT COUNT(*) FROM routes WHERE graph_version=?", (self.graph_version,)
+        ).fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "graph_version": self.graph_version,
+                "precision": self.precision,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def route_cache_from_env(default_path="data/route_cache.sqlite"):
+    """Cria o cache a partir de ROUTE_CACHE_PATH, ROUTE_CACHE_PRECISION, ROUTE_CACHE_GRAPH_VERSION
+    e ROUTE_CACHE_MAX_AGE_DAYS. ROUTE_CACHE_ENABLED=0 desativa (devolve None).
+
+    rotas.py e a API devem apontar para o mesmo arquivo e a mesma versão do grafo.
+    """
+    if os.getenv("ROUTE_CACHE_ENABLED", "1") != "1":
+        return None
+    max_age = os.getenv("ROUTE_CACHE_MAX_AGE_DAYS")
+    return RouteCache(
+        os.getenv("ROUTE_CACHE_PATH", default_path),
+        precision=int(os.getenv("ROUTE_CACHE_PRECISION", "4")),
+        graph_version=os.getenv("ROUTE_CACHE_GRAPH_VERSION", "default"),
+        max_age_days=float(max_age) if max_age else None
+    )
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# src/python/route_results.py
+"""
+Resultados do rotas.py (distância/tempo por corrida) em SQLite, no lugar do CSV em append:
+- Chave primária em ride_id: gravar de novo a mesma corrida substitui a linha (sem duplicatas)
+- Cada batch é gravado numa transação (modo WAL): uma queda no meio não deixa linha parcial
+- Resume por consulta indexada (faixa de ride_id do bloco lido), sem reler o arquivo inteiro
+- Leitura tipada para o treino (save_model.py), sem parsing de CSV
+- Importação do CSV antigo (ors_local_coords_only_results.csv) e exportação para CSV: no
+  mesmo formato (--export-csv) ou no do distancia_tempo_corridas.csv que o save_model.py e o
+  train_models.py leem quando não há o SQLite (--export-training-csv)
+
+Uso: python route_results.py --import-csv data/ors_local_coords_only_results.csv
+     python route_results.py --export-training-csv data/distancia_tempo_corridas.csv
+"""
+
+import os
+import sqlite3
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    ride_id    INTEGER PRIMARY KEY,
+    distance_m REAL,
+    duration_s REAL,
+    error      TEXT,
+    created_at REAL NOT NULL
+)
+"""
+
+DEFAULT_PATH = os.path.join("data", "route_results.sqlite")
+RESULT_COLUMNS = ["ride_id", "distance_m", "duration_s", "error"]
+# Colunas do distancia_tempo_corridas.csv (DIST_CSV do save_model.py/train_models.py, separador ',')
+TRAINING_CSV_COLUMNS = {"ride_id": "RideID", "distance_m": "distancia_m", "duration_s": "tempo_estim_segundos"}
+
+
+class RouteResultsStore:
+    """Armazena (ride_id, distance_m, duration_s, error) com chave primária em ride_id."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # rotas.py grava no event loop e consulta na thread de leitura do CSV: uma conexão + lock
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def put_many(self, results):
+        """Grava [(ride_id, distance_m, duration_s, error)] numa única transação."""
+        now = time.time()
+        rows = [(int(ride_id), _real(distance_m), _real(duration_s), error, now)
+                for ride_id, distance_m, duration_s, error in results]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (ride_id, distance_m, duration_s, error, created_at) "
+                "VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def processed_mask(self, ride_ids):
+        """Máscara booleana de quais ride_ids já estão gravados.
+
+        Consulta só a faixa [min, max] dos ids pedidos pela chave primária; como o dump vem
+        ordenado por RideID, cada bloco lido cobre uma faixa curta.
+        """
+        ride_ids = np.asarray(ride_ids, dtype=np.int64)
+        if len(ride_ids) == 0:
+            return np.zeros(0, dtype=bool)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ride_id FROM results WHERE ride_id BETWEEN ? AND ?",
+                (int(ride_ids.min()), int(ride_ids.max()))
+            ).fetchall()
+        stored = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        return np.isin(ride_ids, stored)
+
+    def __contains__(self, ride_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM results WHERE ride_id=?", (int(ride_id),)).fetchone() is not None
+
+    def count(self, errors=None):
+        """Total de corridas gravadas (errors=True/False filtra as com/sem erro)."""
+        condition = {None: "", True: " WHERE error IS NOT NULL", False: " WHERE error IS NULL"}[errors]
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM results{condition}").fetchone()[0]
+
+    def read_frame(self, ok_only=True, ride_ids=None):
+        """DataFrame tipado (ride_id int64, distance_m/duration_s float64[, error]).
+
+        ride_ids: se informado, só essas corridas (junção com uma tabela temporária).
+        """
+        query = "SELECT ride_id, distance_m, duration_s, error FROM results"
+        conditions = ["error IS NULL"] if ok_only else []
+        if ride_ids is not None:
+            conditions.append("ride_id IN (SELECT ride_id FROM temp.wanted)")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            if ride_ids is not None:
+                self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (ride_id INTEGER PRIMARY KEY)")
+                self._conn.execute("DELETE FROM temp.wanted")
+                self._conn.executemany("INSERT OR IGNORE INTO temp.wanted VALUES (?)",
+                                       ((int(ride_id),) for ride_id in ride_ids))
+            frame = pd.read_sql_query(query, self._conn, dtype={"ride_id": "int64", "distance_m": "float64",
+                                                                "duration_s": "float64"})
+        return frame.drop(columns="error") if ok_only else frame
+
+    def import_csv(self, csv_path, chunk_rows=200_000):
+        """Carrega um CSV de resultados antigo (ride_id;distance_m;duration_s;error)."""
+        total = 0
+        for chunk in pd.read_csv(csv_path, sep=";", chunksize=chunk_rows):
+            chunk = chunk.reindex(columns=RESULT_COLUMNS)
+            chunk["error"] = chunk["error"].where(chunk["error"].notna(), None)
+            total += self.put_many(chunk.itertuples(index=False, name=None))
+        return total
+
+    def export_csv(self, csv_path, ok_only=False):
+        """Exporta no formato de import_csv (ride_id;distance_m;duration_s;error)."""
+        self.read_frame(ok_only=ok_only).to_csv(csv_path, sep=";", index=False, encoding="utf-8")
+
+    def export_training_csv(self, csv_path):
+        """Exporta as corridas sem erro como distancia_tempo_corridas.csv (RideID,distancia_m,tempo_estim_segundos)."""
+        frame = self.read_frame(ok_only=True).rename(columns=TRAINING_CSV_COLUMNS)
+        frame.to_csv(csv_path, sep=",", index=False, encoding="utf-8")
+
+
+def _real(value):
+    # None/NaN viram NULL no SQLite
+    if value is None:
+        return None
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resultados de rotas em SQLite (rotas.py → save_model.py)")
+    parser.add_argument("--db", default=os.getenv("ROUTE_RESULTS_PATH", DEFAULT_PATH))
+    parser.add_argument("--import-csv", help="importa um CSV de resultados do rotas.py antigo")
+    parser.add_argument("--export-csv", help="exporta todos os resultados para CSV (;), no formato de --import-csv")
+    parser.add_argument("--export-training-csv",
+                        help="exporta as corridas sem erro no formato do distancia_tempo_corridas.csv (,)")
+    args = parser.parse_args()
+    with RouteResultsStore(args.db) as store:
+        if args.import_csv:
+            print(f"{store.import_csv(args.import_csv):,} linhas importadas de {args.import_csv}")
+        if args.export_csv:
+            store.export_csv(args.export_csv)
+            print(f"Exportado para {args.export_csv}")
+        if args.export_training_csv:
+            store.export_training_csv(args.export_training_csv)
+            print(f"Exportado para {args.export_training_csv}")
+        print(f"{store.count():,} corridas ({store.count(errors=True):,} com erro) em {args.db}")
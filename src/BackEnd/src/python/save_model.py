@@ -1,14 +1,18 @@
 # -*- coding: utf-8 -*-
 # src/python/save_model.py
 
+import os
 import pandas as pd
 import numpy as np
 import xgboost as xgb
 import pickle
-import holidays # Necessário para a feature de feriado
-from sklearn.model_selection import train_test_split
+from compiled_trees import export_artifact # Exportacao das arvores para o formato compacto da API
+from route_results import RouteResultsStore # Distancia/tempo do rotas.py (SQLite, colunas tipadas)
+from feature_store import FeatureStore, read_csv_rows, refresh # Features incrementais (so corridas novas)
+from hyperparam_search import search, load_search_space, format_report # Busca de hiperparametros (TUNE_TRIALS)
+from out_of_core import OutOfCoreTrainer, scan # Treino em blocos do feature store (OUT_OF_CORE)
+from ride_stream import is_holdout # Teste fixo por hash do RideID (o mesmo do train_models.py e do check_metrics.py)
 from sklearn.metrics import mean_squared_error
-from datetime import datetime # Necessário para a função fix_date_str
 
 # --- 0) CONFIGURACAO MANUAL ---
 MERGE_KEY     = "RideID"
@@ -16,196 +20,247 @@ PRICE_COL     = "Price"                # Coluna de preço do estimative_v3.csv
 DISTANCE_COL  = "distancia_m"          # Coluna de distância do distancia_tempo_corridas.csv
 DURATION_COL  = "tempo_estim_segundos" # Coluna de tempo do distancia_tempo_corridas.csv
 DATETIME_COL  = "Create"               # <<< CORRIGIDO: Coluna de data/hora do ride_v2.csv
+ROUTE_RESULTS = "./data/route_results.sqlite" # Saida do rotas.py; se nao existir, usa o CSV antigo
+RIDES_CSV     = "./data/ride_v2.csv"
+ESTIM_CSV     = "./data/rideestimative_v3.csv"
+DIST_CSV      = "./data/distancia_tempo_corridas.csv"
+FEATURE_STORE = "./data/feature_store.sqlite"  # Features ja calculadas; so corridas novas sao processadas
+REBUILD_FEATURES = os.getenv("REBUILD_FEATURES", "0") == "1" # 1 = recalcula o feature store do zero
+# Tipos das colunas lidas dos CSVs: convertidas uma vez para o cache colunar (raw_cache.py, em ./data/raw_cache)
+COLUMN_TYPES  = {MERGE_KEY: "id", DATETIME_COL: "datetime", PRICE_COL: "float", DISTANCE_COL: "float", DURATION_COL: "float"}
+# Busca de hiperparametros (hyperparam_search.py): 0 = parametros fixos abaixo
+TUNE_TRIALS   = int(os.getenv("TUNE_TRIALS", "0"))         # nº de combinacoes avaliadas
+TUNE_FOLDS    = int(os.getenv("TUNE_FOLDS", "5"))          # k da validacao cruzada
+TUNE_WORKERS  = int(os.getenv("TUNE_WORKERS", "0"))        # 0 = um processo por core
+TUNE_SPACE    = os.getenv("TUNE_SPACE")                    # JSON {parametro: [valores]}; vazio = espaco padrao
+TUNE_TARGET_RMSE = float(os.getenv("TUNE_TARGET_RMSE")) if os.getenv("TUNE_TARGET_RMSE") else None # erro aceito; escolhe o modelo mais rapido abaixo dele
+# Out-of-core (out_of_core.py): merges em lotes por RideID e treino em blocos, sem a tabela inteira na memoria
+OUT_OF_CORE   = os.getenv("OUT_OF_CORE", "0") == "1"
+REFRESH_BATCH_RIDES = int(os.getenv("REFRESH_BATCH_RIDES", "100000")) # corridas por lote de merge no modo out-of-core (define o pico de memoria)
 # ──────────────────────────────────────────────────────────────────────
 
-# --- Função para corrigir formato da string de data/hora ---
-def fix_date_str(date_str):
-    if pd.isna(date_str): return None
-    date_str = str(date_str).strip()
-    if '.' in date_str:
-        parts = date_str.split('.')
-        # Garante que a parte da fração de segundo tenha no máximo 6 dígitos
-        if len(parts) > 1 and len(parts[1]) > 6:
-             base_time = parts[0]
-             fraction = parts[1][:6]
-             time_parts = base_time.split(':')
-             if len(time_parts) >= 2: # Precisa ter pelo menos HH:MM
-                 return base_time + '.' + fraction
-    return date_str
-
-print("1) Carregando CSVs brutos...")
-try:
-    # Usar separador explícito é mais robusto
-    rides    = pd.read_csv("./data/ride_v2.csv", sep=';', low_memory=False, on_bad_lines="warn")
-    estim    = pd.read_csv("./data/rideestimative_v3.csv", sep=';', low_memory=False, on_bad_lines="warn")
-    dist_ors = pd.read_csv("./data/distancia_tempo_corridas.csv", sep=',', low_memory=False, on_bad_lines="warn") # Assumindo CSV separado por vírgula
-except Exception as e:
-     print(f"Erro ao carregar CSVs: {e}")
-     print("Verifique os caminhos e separadores (sep=';' ou sep=',')")
-     exit()
-
-# --- 1.1) Exibe colunas para conferência ---
-print("\n→ Colunas em rides:")
-print(rides.columns.tolist())
-print("\n→ Colunas em estim:")
-print(estim.columns.tolist())
-print("\n→ Colunas em dist_ors:")
-print(dist_ors.columns.tolist())
-
-# --- 1.2) Valida presença das colunas configuradas ---
-missing_rides = [c for c in [MERGE_KEY, DATETIME_COL] if c not in rides.columns]
-if missing_rides:
-    raise RuntimeError(f"Nao achei as colunas {missing_rides} no CSV de corridas (ride_v2.csv). Ajuste MERGE_KEY ou DATETIME_COL.")
-
-missing_estim = [c for c in [MERGE_KEY, PRICE_COL] if c not in estim.columns]
-if missing_estim:
-    raise RuntimeError(f"Nao achei as colunas {missing_estim} no CSV de estimativa. Ajuste PRICE_COL ou MERGE_KEY.")
-
-missing_dist = [c for c in [MERGE_KEY, DISTANCE_COL, DURATION_COL] if c not in dist_ors.columns]
-if missing_dist:
-    raise RuntimeError(f"Nao achei as colunas {missing_dist} no CSV de distancia/tempo. Ajuste DISTANCE_COL, DURATION_COL ou MERGE_KEY.")
-
-print(f"\n2) Colunas confirmadas: merge='{MERGE_KEY}', price='{PRICE_COL}', datetime='{DATETIME_COL}', dist='{DISTANCE_COL}', dur='{DURATION_COL}'")
-
-# --- 2) Fazendo merges ---
-# Seleciona apenas as colunas necessárias ANTES do merge para eficiência
-rides_subset = rides[[MERGE_KEY, DATETIME_COL]].copy()
-estim_subset = estim[[MERGE_KEY, PRICE_COL]].copy()
-dist_ors_subset = dist_ors[[MERGE_KEY, DISTANCE_COL, DURATION_COL]].copy()
-
-print("Realizando merges...")
-try:
-    df = (
-        rides_subset
-        .merge(estim_subset, on=MERGE_KEY, how="inner")
-        .merge(dist_ors_subset, on=MERGE_KEY, how="inner")
-    )
-except Exception as e:
-     print(f"Erro durante o merge: {e}")
-     print("Verifique se a coluna '{MERGE_KEY}' tem tipos de dados compativeis entre os DataFrames.")
-     exit()
-
-print(f"   → {len(df)} corridas após merge.")
-
-# --- 3) Extraindo datetime e criando features básicas ---
-print(f"Processando coluna de data/hora: '{DATETIME_COL}'...")
-# Aplica correção de formato primeiro
-df['fixed_datetime_str'] = df[DATETIME_COL].apply(fix_date_str)
-df["datetime"] = pd.to_datetime(df['fixed_datetime_str'], errors="coerce", infer_datetime_format=True, cache=True)
-
-# Remove linhas onde a data/hora não pôde ser convertida
-initial_len = len(df)
-df = df.dropna(subset=["datetime"])
-removed_count = initial_len - len(df)
-if removed_count > 0:
-    print(f"   → Removidas {removed_count} linhas com data/hora invalida.")
-
-print("Extraindo features de data/hora...")
-df["hour_val"]    = df["datetime"].dt.hour + df["datetime"].dt.minute / 60.0 # Usa float para precisao
-df["weekday_val"] = df["datetime"].dt.weekday + 1  # Segunda=1…Domingo=7
-df["day"]         = df["datetime"].dt.day
-df["month"]       = df["datetime"].dt.month
-df["year"]        = df["datetime"].dt.year
-
-# --- 4) Features cíclicas e feriado ---
-print("Criando features ciclicas e de feriado...")
-df["hour_min"]    = df["hour_val"] # Mantem para compatibilidade com features list
-df["hour_sin"]    = np.sin(2 * np.pi * df["hour_min"] / 24)
-df["hour_cos"]    = np.cos(2 * np.pi * df["hour_min"] / 24)
-df["weekday_sin"] = np.sin(2 * np.pi * df["weekday_val"] / 7)
-df["weekday_cos"] = np.cos(2 * np.pi * df["weekday_val"] / 7)
-
-try:
-    br_hols = holidays.Brazil(years=df["year"].unique().tolist())
-    # Usa dt.date para comparar apenas a data, nao a hora
-    df["is_holiday"]  = df["datetime"].dt.date.apply(lambda date: 1 if date in br_hols else 0)
-except Exception as e:
-     print(f"Erro ao processar feriados: {e}. Criando coluna 'is_holiday' com zeros.")
-     df["is_holiday"] = 0 # Fallback: assume que nao e feriado
-
-# --- 4.1) Tratamento de Valores Ausentes em Distância/Duração ---
-print("Verificando NaNs em distancia/duracao...")
-dist_nan_count = df[DISTANCE_COL].isna().sum()
-dur_nan_count = df[DURATION_COL].isna().sum()
-print(f"   → Linhas com distancia NaN: {dist_nan_count}")
-print(f"   → Linhas com duracao NaN: {dur_nan_count}")
-
-# Estrategia: Remover linhas com distancia NaN. Imputar duracao com a media.
-initial_len = len(df)
-df = df.dropna(subset=[DISTANCE_COL])
-removed_dist_nan = initial_len - len(df)
-if removed_dist_nan > 0:
-    print(f"   → Removidas {removed_dist_nan} linhas com distancia NaN.")
-
-if dur_nan_count > 0:
-    mean_duration = df[DURATION_COL].mean()
-    df[DURATION_COL].fillna(mean_duration, inplace=True)
-    print(f"   → NaNs em duracao imputados com a media: {mean_duration:.2f}")
-
-# --- 5) Definição de features / target ────────────────────────────────
-features = [
-    "hour_min",    # Original hora.minuto
-    "hour_sin",    # Componente seno da hora
-    "hour_cos",    # Componente cosseno da hora
-    "weekday_val", # Original dia da semana (1-7)
-    "weekday_sin", # Componente seno do dia da semana
-    "weekday_cos", # Componente cosseno do dia da semana
-    "is_holiday",  # Flag de feriado (0 ou 1)
-    DISTANCE_COL,  # Distancia (ex: 'distancia_m')
-    DURATION_COL,  # Duracao (ex: 'tempo_estim_segundos')
-    "day",         # Dia do mes
-    "month",       # Mes
-    "year"         # Ano
-]
-target = PRICE_COL
-
-# Verifica se todas as features existem no DataFrame final
-missing_features = [f for f in features if f not in df.columns]
-if missing_features:
-     raise RuntimeError(f"Erro interno: Features {missing_features} nao encontradas no DataFrame final.")
-
-print(f"\n5) Features selecionadas para o modelo: {features}")
-print(f"   Target: {target}")
-
-# --- 6) Split treino/teste e treinamento do XGBoost ───────────────────
-X = df[features]
-y = df[target]
-
-# Verifica se ainda ha dados apos a limpeza
-if len(X) == 0:
-    raise RuntimeError("Nao ha dados restantes apos limpeza e merges para treinar o modelo.")
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
-print(f"\n6) Split treino/teste → {len(X_train)}/{len(X_test)} exemplos")
-
-print("Treinando modelo XGBoost...")
-model = xgb.XGBRegressor(
-    objective="reg:squarederror", n_estimators=100, learning_rate=0.1,
-    max_depth=5, subsample=0.8, colsample_bytree=0.8,
-    random_state=42, n_jobs=-1, # Usar todos os cores disponiveis
-    enable_categorical=False # Definir explicitamente (geralmente nao necessario se nao houver categoricas)
-)
-model.fit(X_train, y_train)
-print("   → Treinamento concluido.")
-
-# --- 7) Avaliação ────────────────────────────────────────────────────
-print("\n7) Avaliando o modelo no conjunto de teste...")
-predictions = model.predict(X_test)
-rmse = np.sqrt(mean_squared_error(y_test, predictions))
-# Calcular R² (Score)
-r2_score = model.score(X_test, y_test)
-
-print(f"   → RMSE no teste: {rmse:.4f}")
-print(f"   → R² Score no teste: {r2_score:.4f}")
-
-# --- 8) Serialização ─────────────────────────────────────────────────
-output_model_file = "model.pkl"
-print(f"\n8) Salvando modelo e lista de features em '{output_model_file}'...")
-try:
-    with open(output_model_file, "wb") as f:
-        pickle.dump({"model": model, "features": features}, f)
-    print(f"✅ '{output_model_file}' gerado com sucesso!")
-except Exception as e:
-    print(f"Erro ao salvar o arquivo pickle: {e}")
\ No newline at end of file
+
+def read_distances(ride_ids):
+    # Distancia/tempo so das corridas pedidas: do store do rotas.py ou do CSV antigo
+    if os.path.exists(ROUTE_RESULTS):
+        with RouteResultsStore(ROUTE_RESULTS) as results:
+            return results.read_frame(ok_only=True, ride_ids=ride_ids).rename(columns={
+                "ride_id": MERGE_KEY, "distance_m": DISTANCE_COL, "duration_s": DURATION_COL})
+    return read_csv_rows(DIST_CSV, [MERGE_KEY, DISTANCE_COL, DURATION_COL], MERGE_KEY,
+                         keep=lambda ids: ids.isin(ride_ids), sep=',', column_types=COLUMN_TYPES)
+
+
+def main():
+    print("1) Lendo cabecalhos dos CSVs brutos...")
+    try:
+        # Usar separador explícito é mais robusto; so o cabecalho aqui, as linhas novas sao lidas no passo 2
+        rides_columns = pd.read_csv(RIDES_CSV, sep=';', nrows=0).columns.tolist()
+        estim_columns = pd.read_csv(ESTIM_CSV, sep=';', nrows=0).columns.tolist()
+        if os.path.exists(ROUTE_RESULTS):
+            # Leitura tipada direto do store (so corridas sem erro), sem parsing de CSV
+            dist_columns = [MERGE_KEY, DISTANCE_COL, DURATION_COL]
+        else:
+            dist_columns = pd.read_csv(DIST_CSV, sep=',', nrows=0).columns.tolist() # Assumindo CSV separado por vírgula
+    except Exception as e:
+         print(f"Erro ao carregar CSVs: {e}")
+         print("Verifique os caminhos e separadores (sep=';' ou sep=',')")
+         exit()
+
+    # --- 1.1) Exibe colunas para conferência ---
+    print("\n→ Colunas em rides:")
+    print(rides_columns)
+    print("\n→ Colunas em estim:")
+    print(estim_columns)
+    print("\n→ Colunas em dist_ors:")
+    print(dist_columns)
+
+    # --- 1.2) Valida presença das colunas configuradas ---
+    missing_rides = [c for c in [MERGE_KEY, DATETIME_COL] if c not in rides_columns]
+    if missing_rides:
+        raise RuntimeError(f"Nao achei as colunas {missing_rides} no CSV de corridas (ride_v2.csv). Ajuste MERGE_KEY ou DATETIME_COL.")
+
+    missing_estim = [c for c in [MERGE_KEY, PRICE_COL] if c not in estim_columns]
+    if missing_estim:
+        raise RuntimeError(f"Nao achei as colunas {missing_estim} no CSV de estimativa. Ajuste PRICE_COL ou MERGE_KEY.")
+
+    missing_dist = [c for c in [MERGE_KEY, DISTANCE_COL, DURATION_COL] if c not in dist_columns]
+    if missing_dist:
+        raise RuntimeError(f"Nao achei as colunas {missing_dist} no CSV de distancia/tempo. Ajuste DISTANCE_COL, DURATION_COL ou MERGE_KEY.")
+
+    print(f"\n2) Colunas confirmadas: merge='{MERGE_KEY}', price='{PRICE_COL}', datetime='{DATETIME_COL}', dist='{DISTANCE_COL}', dur='{DURATION_COL}'")
+
+    # --- 2) Feature store incremental: so corridas novas (RideID acima do high-water mark) e pendentes ---
+    store = FeatureStore(FEATURE_STORE, key=MERGE_KEY, value_columns=[PRICE_COL, DISTANCE_COL, DURATION_COL])
+    if REBUILD_FEATURES:
+        print("REBUILD_FEATURES=1: recalculando o feature store do zero.")
+
+    # --- 3) e 4) Merges, datetime, features básicas, cíclicas e feriado (so das linhas novas) ---
+    print(f"Processando corridas novas, coluna de data/hora '{DATETIME_COL}' e criando features...")
+    try:
+        refreshed = refresh(store, RIDES_CSV, DATETIME_COL, ESTIM_CSV, [PRICE_COL], read_distances,
+                            rebuild=REBUILD_FEATURES, column_types=COLUMN_TYPES,
+                            batch_rides=REFRESH_BATCH_RIDES if OUT_OF_CORE else None)
+    except Exception as e:
+         print(f"Erro ao carregar ou cruzar os CSVs: {e}")
+         print(f"Verifique os caminhos, os separadores (sep=';' ou sep=',') e os tipos da coluna '{MERGE_KEY}'.")
+         exit()
+    print(f"   → Feature store: {refreshed['stored']} linhas, high-water mark {MERGE_KEY}={refreshed['high_water_mark']}, "
+          f"{refreshed['pending_before']} corridas pendentes")
+    print(f"   → {refreshed['new_rides']} corridas novas + {refreshed['pending_before']} pendentes; "
+          f"{refreshed['merged']} linhas após merge.")
+    if refreshed['invalid_datetime'] > 0:
+        print(f"   → Removidas {refreshed['invalid_datetime']} linhas com data/hora invalida.")
+    print(f"   → {refreshed['added']} linhas adicionadas ao feature store em {refreshed['batches']} lote(s); "
+          f"{refreshed['pending']} corridas pendentes.")
+
+    if OUT_OF_CORE:
+        # A tabela nao e carregada: uma passada de contagem; o treino le o store em blocos
+        counts = scan(store, DISTANCE_COL, DURATION_COL)
+        print(f"   → {counts['rows']} corridas no feature store para o treino (out-of-core, em blocos).")
+        print("Verificando NaNs em distancia/duracao...")
+        print(f"   → Linhas com distancia NaN: {counts['distance_nan']} (removidas bloco a bloco)")
+        print(f"   → Linhas com duracao NaN: {counts['duration_nan']}")
+        if counts["duration_nan"] > 0:
+            print(f"   → NaNs em duracao imputados com a media: {counts['duration_mean']:.2f}")
+    else:
+        df = store.read_frame()
+        store.close()
+        print(f"   → {len(df)} corridas no feature store para o treino.")
+
+        # --- 4.1) Tratamento de Valores Ausentes em Distância/Duração ---
+        print("Verificando NaNs em distancia/duracao...")
+        dist_nan_count = df[DISTANCE_COL].isna().sum()
+        dur_nan_count = df[DURATION_COL].isna().sum()
+        print(f"   → Linhas com distancia NaN: {dist_nan_count}")
+        print(f"   → Linhas com duracao NaN: {dur_nan_count}")
+
+        # Estrategia: Remover linhas com distancia NaN. Imputar duracao com a media.
+        initial_len = len(df)
+        df = df.dropna(subset=[DISTANCE_COL])
+        removed_dist_nan = initial_len - len(df)
+        if removed_dist_nan > 0:
+            print(f"   → Removidas {removed_dist_nan} linhas com distancia NaN.")
+
+        if dur_nan_count > 0:
+            mean_duration = df[DURATION_COL].mean()
+            df[DURATION_COL] = df[DURATION_COL].fillna(mean_duration)
+            print(f"   → NaNs em duracao imputados com a media: {mean_duration:.2f}")
+
+    # --- 5) Definição de features / target ────────────────────────────────
+    features = [
+        "hour_min",    # Original hora.minuto
+        "hour_sin",    # Componente seno da hora
+        "hour_cos",    # Componente cosseno da hora
+        "weekday",     # Dia da semana (Segunda=0, como na API)
+        "weekday_sin", # Componente seno do dia da semana
+        "weekday_cos", # Componente cosseno do dia da semana
+        "is_holiday",  # Flag de feriado (0 ou 1)
+        DISTANCE_COL,  # Distancia (ex: 'distancia_m')
+        DURATION_COL,  # Duracao (ex: 'tempo_estim_segundos')
+        "day",         # Dia do mes
+        "month",       # Mes
+        "year"         # Ano
+    ]
+    target = PRICE_COL
+
+    # Verifica se todas as features existem no DataFrame final (no store, no modo out-of-core)
+    missing_features = [f for f in features if f not in (store.columns if OUT_OF_CORE else df.columns)]
+    if missing_features:
+         raise RuntimeError(f"Erro interno: Features {missing_features} nao encontradas no DataFrame final.")
+
+    print(f"\n5) Features selecionadas para o modelo: {features}")
+    print(f"   Target: {target}")
+
+    if OUT_OF_CORE:
+        # --- 6) e 7) Treino e avaliacao em blocos (out_of_core.py) ───────────
+        # Teste = corridas com hash do RideID no shard 0 de 5, o mesmo teste do train_models.py
+        print(f"\n6) Treino out-of-core: teste fixo por hash do {MERGE_KEY} (~20% das corridas)")
+        if TUNE_TRIALS > 0:
+            print("   → TUNE_TRIALS ignorado: a busca de hiperparametros precisa da tabela em memoria.")
+        trainer = OutOfCoreTrainer(store, features, target, DISTANCE_COL, DURATION_COL, counts["duration_mean"])
+        print("Treinando modelo XGBoost (ExtMemQuantileDMatrix, blocos do feature store)...")
+        model = trainer.train(dict(
+            objective="reg:squarederror", n_estimators=100, learning_rate=0.1,
+            max_depth=5, subsample=0.8, colsample_bytree=0.8, random_state=42
+        ))
+        print("   → Treinamento concluido.")
+
+        print("\n7) Avaliando o modelo no conjunto de teste...")
+        evaluation = trainer.evaluate(model)
+        store.close()
+        print(f"   → {evaluation['rows']} linhas de teste")
+        print(f"   → RMSE no teste: {evaluation['rmse']:.4f}")
+        print(f"   → R² Score no teste: {evaluation['r2']:.4f}")
+    else:
+        # --- 6) Split treino/teste e treinamento do XGBoost ───────────────────
+        X = df[features]
+        y = df[target]
+
+        # Verifica se ainda ha dados apos a limpeza
+        if len(X) == 0:
+            raise RuntimeError("Nao ha dados restantes apos limpeza e merges para treinar o modelo.")
+
+        # Teste = corridas com hash do RideID no shard 0 de 5, como no modo out-of-core: o
+        # check_metrics.py (--model geral=model.pkl) reavalia o modelo nessas mesmas corridas
+        test = is_holdout(df[MERGE_KEY].to_numpy())
+        X_train, X_test, y_train, y_test = X[~test], X[test], y[~test], y[test]
+        print(f"\n6) Split treino/teste (hash do {MERGE_KEY}) → {len(X_train)}/{len(X_test)} exemplos")
+
+        xgb_params = dict(n_estimators=100, learning_rate=0.1, max_depth=5, subsample=0.8, colsample_bytree=0.8)
+        if TUNE_TRIALS > 0:
+            # CV so no conjunto de treino: o teste do passo 7 continua fora da busca
+            print(f"\n6.1) Busca de hiperparametros: {TUNE_TRIALS} combinacoes, CV em {TUNE_FOLDS} folds com early stopping...")
+            try:
+                chosen, trials = search(X_train, y_train, df.loc[X_train.index, MERGE_KEY], TUNE_TRIALS, n_folds=TUNE_FOLDS,
+                                        workers=TUNE_WORKERS, space=load_search_space(TUNE_SPACE), target_rmse=TUNE_TARGET_RMSE)
+            except Exception as e:
+                print(f"Erro na busca de hiperparametros: {e}")
+                print("Tentativas ja concluidas ficam gravadas; rode de novo para retomar.")
+                exit()
+            print(format_report(trials, chosen))
+            if TUNE_TARGET_RMSE is not None and chosen["cv_rmse"] > TUNE_TARGET_RMSE:
+                print(f"   → Nenhuma combinacao atingiu RMSE {TUNE_TARGET_RMSE}; usando a de menor erro.")
+            xgb_params = {**chosen["params"], "n_estimators": chosen["rounds"]}
+            print(f"   → Escolhida: {xgb_params} (CV RMSE {chosen['cv_rmse']:.4f}, {chosen['latency_p50_us']:.1f} µs/linha)")
+
+        print("Treinando modelo XGBoost...")
+        model = xgb.XGBRegressor(
+            objective="reg:squarederror", **xgb_params,
+            random_state=42, n_jobs=-1, # Usar todos os cores disponiveis
+            enable_categorical=False # Definir explicitamente (geralmente nao necessario se nao houver categoricas)
+        )
+        model.fit(X_train, y_train)
+        print("   → Treinamento concluido.")
+
+        # --- 7) Avaliação ────────────────────────────────────────────────────
+        print("\n7) Avaliando o modelo no conjunto de teste...")
+        predictions = model.predict(X_test)
+        rmse = np.sqrt(mean_squared_error(y_test, predictions))
+        # Calcular R² (Score)
+        r2_score = model.score(X_test, y_test)
+
+        print(f"   → RMSE no teste: {rmse:.4f}")
+        print(f"   → R² Score no teste: {r2_score:.4f}")
+
+    # --- 8) Serialização ─────────────────────────────────────────────────
+    output_model_file = "model.pkl"
+    print(f"\n8) Salvando modelo e lista de features em '{output_model_file}'...")
+    try:
+        with open(output_model_file, "wb") as f:
+            pickle.dump({"model": model, "features": features}, f)
+        print(f"✅ '{output_model_file}' gerado com sucesso!")
+    except Exception as e:
+        print(f"Erro ao salvar o arquivo pickle: {e}")
+
+    # --- 9) Exportacao para o formato compilado ─────────────────────────
+    # Gera model.trees.npz (arvores em arrays) e confere que as previsoes batem com o pickle
+    print("\n9) Exportando arvores para o formato compacto da API...")
+    try:
+        compiled_file, max_diff = export_artifact(output_model_file)
+        print(f"✅ '{compiled_file}' gerado (diferenca maxima para o pickle: {max_diff:.2e}).")
+    except Exception as e:
+        print(f"Erro ao exportar o modelo compilado (a API continua usando o pickle): {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/conftest.py
+# Os módulos ficam soltos em src/python (importados pelo nome, como nos scripts); os testes
+# rodam a partir daqui com: python -m pytest -q tests
+import os
+import sys
+from unittest import mock
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from train_models import FEATURE_COLUMNS, MODEL_FILES  # noqa: E402
+
+
+def _artifact_feature_columns(model_dir=os.path.join(ROOT, "modelos_final")):
+    # feature_columns de cada .pkl de modelos_final (fora do git). Sem os artefatos, as duas
+    # ordens que eles usam: a do train_models.py e a invertida do 99Pop e do UberComfort
+    found = {filename: list(joblib.load(os.path.join(model_dir, filename))["feature_columns"])
+             for filename in MODEL_FILES.values() if os.path.exists(os.path.join(model_dir, filename))}
+    if found:
+        return found
+    reversed_order = {"99Pop.pkl", "UberComfort.pkl"}
+    return {filename: list(reversed(FEATURE_COLUMNS)) if filename in reversed_order else list(FEATURE_COLUMNS)
+            for filename in MODEL_FILES.values()}
+
+
+# Colunas de cada artefato ({arquivo: feature_columns}) e as ordens distintas entre eles
+MODEL_SCHEMAS = _artifact_feature_columns()
+MODEL_LAYOUTS = [list(columns) for columns in dict.fromkeys(tuple(cols) for cols in MODEL_SCHEMAS.values())]
+
+
+def pytest_configure(config):
+    # Avisos do FastAPI/Starlette sobre on_event e o cliente de teste: não vêm do código daqui
+    config.addinivalue_line("filterwarnings", "ignore:\\s*on_event is deprecated:DeprecationWarning")
+    config.addinivalue_line("filterwarnings", "ignore:Using `httpx` with `starlette.testclient`")
+
+
+@pytest.fixture(scope="session")
+def training_frame():
+    """Amostra sintética com as 10 features da API (train_models.FEATURE_COLUMNS) + preço."""
+    rng = np.random.default_rng(0)
+    n = 2000
+    hour = rng.uniform(0, 24, n)
+    weekday = rng.integers(0, 7, n)
+    frame = pd.DataFrame({
+        "distance_m": rng.uniform(500, 40_000, n),
+        "duration_s": rng.uniform(60, 4_000, n),
+        "year": rng.integers(2021, 2025, n),
+        "month": rng.integers(1, 13, n),
+        "is_holiday": (rng.random(n) < 0.05).astype(int),
+        "hour_sin": np.sin(2 * np.pi * hour / 24),
+        "hour_cos": np.cos(2 * np.pi * hour / 24),
+        "weekday_sin": np.sin(2 * np.pi * weekday / 7),
+        "weekday_cos": np.cos(2 * np.pi * weekday / 7),
+        # Mesma regra do featurizer.py: 5h–8h e 16h–19h
+        "is_peak_hour": (((hour >= 5) & (hour < 9)) | ((hour >= 16) & (hour < 20))).astype(int),
+    })
+    price = 5 + frame["distance_m"] / 1000 * 1.8 + frame["duration_s"] / 60 * 0.3 + 4 * frame["hour_sin"]
+    return frame, price + rng.normal(0, 1.0, n)
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory, training_frame):
+    """main.py importado com artefatos sintéticos (colunas de MODEL_SCHEMAS) num diretório temporário.
+
+    Os tokens são lidos na importação: os testes trocam main.ADMIN_TOKEN etc. com monkeypatch.
+    """
+    folder = tmp_path_factory.mktemp("api")
+    X, y = training_frame
+    for i, (filename, columns) in enumerate(MODEL_SCHEMAS.items()):
+        pipeline = Pipeline([("scaler", StandardScaler()),
+                             ("model", DecisionTreeRegressor(max_depth=8, random_state=0))])
+        pipeline.fit(X[columns], y * (1 + i / 10))
+        joblib.dump({"pipeline": pipeline, "feature_columns": columns}, folder / filename)
+    env = {"MODEL_DIR": str(folder), "MODEL_LOAD_MODE": "eager", "MODEL_WATCH_INTERVAL": "0",
+           "ROUTE_CACHE_PATH": str(folder / "route_cache.sqlite"), "ADMIN_TOKEN": "",
+           "ROUTE_CACHE_WRITE_TOKEN": "", "PREDICTION_CACHE_SHARED_BACKEND": ""}
+    with mock.patch.dict(os.environ, env):
+        import main
+        main.open_route_cache()   # aberto aqui, com ROUTE_CACHE_PATH ainda apontando para a pasta temporária
+    assert main.model_registry.ready
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(api):
+    # Uma subida/parada do app na sessão: o shutdown encerra o pool de predição do main.py
+    from fastapi.testclient import TestClient
+    with TestClient(api.app) as test_client:
+        yield test_client
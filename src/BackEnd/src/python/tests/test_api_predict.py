@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_api_predict.py
+# /predict e /predict/batch pelo TestClient, com o calendário fixo (sem virada de minuto entre as chamadas).
+import datetime
+
+import numpy as np
+import pytest
+
+from calendar_features import CalendarFeatureProvider
+
+NOW = datetime.datetime(2024, 3, 15, 7, 45, 30)
+
+
+@pytest.fixture
+def fixed_calendar(api, monkeypatch):
+    monkeypatch.setattr(api, "calendar_provider", CalendarFeatureProvider(api._holiday_lookup_api, clock=lambda: NOW))
+    # Sem cache de preços: cada /predict passa pelos modelos
+    monkeypatch.setattr(api, "PREDICTION_CACHE_ENABLED", False)
+
+
+def _trips(n, seed=3):
+    rng = np.random.default_rng(seed)
+    return [{"distancia_m": float(d), "tempo_estim_segundos": float(t)}
+            for d, t in zip(rng.uniform(500, 40_000, n), rng.uniform(60, 4_000, n))]
+
+
+def test_empty_batch_is_rejected(client, fixed_calendar):
+    response = client.post("/predict/batch", json={"trips": []})
+    assert response.status_code == 400
+
+
+def test_batch_above_max_size_is_rejected(client, api, fixed_calendar, monkeypatch):
+    monkeypatch.setattr(api, "MAX_BATCH_SIZE", 5)
+    assert client.post("/predict/batch", json={"trips": _trips(6)}).status_code == 413
+    assert client.post("/predict/batch", json={"trips": _trips(5)}).status_code == 200
+
+
+def test_batch_matches_single_predictions(client, api, fixed_calendar):
+    trips = _trips(25)
+    batch = client.post("/predict/batch", json={"trips": trips})
+    assert batch.status_code == 200
+    singles = [client.post("/predict", json=trip) for trip in trips]
+    assert all(response.status_code == 200 for response in singles)
+    assert batch.json()["predictions"] == [response.json() for response in singles]
+    assert all(len(prices) == len(api.MODEL_FILES) for prices in batch.json()["predictions"])
+    assert batch.headers["X-Model-Versions"] == singles[0].headers["X-Model-Versions"]
+
+
+def test_concurrent_and_sequential_modes_return_the_same_prices(client, api, fixed_calendar, monkeypatch):
+    trips = _trips(10, seed=4)
+    results = {}
+    for mode in ("sequential", "concurrent"):
+        monkeypatch.setattr(api, "PREDICT_EXECUTION_MODE", mode)
+        singles = [client.post("/predict", json=trip).json() for trip in trips]
+        batch = client.post("/predict/batch", json={"trips": trips}).json()["predictions"]
+        # Também pela função usada fora dos endpoints (_run_models síncrono)
+        direct = api.predict_prices_batch([t["distancia_m"] for t in trips], [t["tempo_estim_segundos"] for t in trips])
+        results[mode] = (singles, batch, direct)
+    assert results["concurrent"] == results["sequential"]
+    # A ordem das chaves também segue MODEL_FILES nos dois modos
+    assert [list(prices) for prices in results["concurrent"][0]] == [list(prices) for prices in results["sequential"][0]]
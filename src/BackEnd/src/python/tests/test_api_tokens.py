@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_api_tokens.py
+# Gravação no cache de rotas e rotas /admin: fechadas quando o token não está configurado.
+import pytest
+
+ROUTE = {"origin_lng": -46.63, "origin_lat": -23.55, "dest_lng": -46.70, "dest_lat": -23.60,
+         "distance_m": 9000.0, "duration_s": 1200.0}
+
+
+@pytest.fixture
+def tokens(api, monkeypatch):
+    def configure(write=None, admin=None):
+        monkeypatch.setattr(api, "ROUTE_CACHE_WRITE_TOKEN", write)
+        monkeypatch.setattr(api, "ADMIN_TOKEN", admin)
+    return configure
+
+
+def test_route_cache_write_is_disabled_without_tokens(client, tokens):
+    tokens()
+    route = {**ROUTE, "dest_lat": -23.65}
+    assert client.put("/routes/cache", json=route).status_code == 403
+    assert client.put("/routes/cache", json=route, headers={"X-Internal-Token": "qualquer"}).status_code == 403
+    params = {k: route[k] for k in ("origin_lng", "origin_lat", "dest_lng", "dest_lat")}
+    assert client.get("/routes/cache", params=params).status_code == 404
+
+
+def test_route_cache_write_requires_a_configured_token(client, tokens):
+    tokens(write="interno", admin="admin")
+    assert client.put("/routes/cache", json=ROUTE).status_code == 401
+    assert client.put("/routes/cache", json=ROUTE, headers={"X-Internal-Token": "errado"}).status_code == 401
+    assert client.put("/routes/cache", json=ROUTE, headers={"X-Internal-Token": "interno"}).status_code == 204
+    assert client.put("/routes/cache", json=ROUTE, headers={"X-Admin-Token": "admin"}).status_code == 204
+    params = {k: ROUTE[k] for k in ("origin_lng", "origin_lat", "dest_lng", "dest_lat")}
+    assert client.get("/routes/cache", params=params).json()["distance_m"] == 9000.0
+
+
+@pytest.mark.parametrize("method, path", [("get", "/admin/models"), ("post", "/admin/models/uberX/reload"),
+                                          ("post", "/admin/models/uberX/rollback"),
+                                          ("post", "/admin/routes/cache/purge")])
+def test_admin_routes_are_disabled_without_admin_token(client, tokens, method, path):
+    tokens(write="interno")
+    assert getattr(client, method)(path).status_code == 403
+    assert getattr(client, method)(path, headers={"X-Admin-Token": "qualquer"}).status_code == 403
+    tokens(admin="admin")
+    assert getattr(client, method)(path, headers={"X-Admin-Token": "errado"}).status_code == 401
+
+
+def test_admin_routes_accept_the_admin_token(client, tokens):
+    tokens(admin="admin")
+    headers = {"X-Admin-Token": "admin"}
+    assert client.get("/admin/models", headers=headers).json()["ready"]
+    assert client.post("/admin/models/nenhum/reload", headers=headers).status_code == 404
+    assert "deleted" in client.post("/admin/routes/cache/purge", headers=headers).json()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_calendar_features.py
+# CalendarFeatureProvider com relógio injetado: reuso do balde, expiração no limite e virada do dia.
+import datetime
+
+import pytest
+
+from calendar_features import CalendarFeatureProvider, compute_calendar_features
+
+HOLIDAYS = {datetime.date(2024, 12, 25)}
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class CountingLookup:
+    def __init__(self):
+        self.holidays = set(HOLIDAYS)
+        self.calls = []
+
+    def __call__(self, date):
+        self.calls.append(date)
+        return int(date in self.holidays)
+
+
+def test_features_are_reused_within_the_bucket():
+    clock = FakeClock(datetime.datetime(2024, 3, 15, 7, 45, 10))
+    lookup = CountingLookup()
+    provider = CalendarFeatureProvider(lookup, clock=clock, bucket_seconds=60)
+    first = provider.get()
+    assert provider.bucket_key() == datetime.datetime(2024, 3, 15, 7, 45)
+    assert provider.expires_at == datetime.datetime(2024, 3, 15, 7, 46)
+
+    clock.now = datetime.datetime(2024, 3, 15, 7, 45, 59, 999999)
+    assert provider.get() is first
+    assert dict(first) == compute_calendar_features(datetime.datetime(2024, 3, 15, 7, 45), lookup)
+    assert lookup.calls == [datetime.date(2024, 3, 15)] * 2   # provider + a conta de referência acima
+
+
+def test_bucket_expires_exactly_at_its_end():
+    clock = FakeClock(datetime.datetime(2024, 3, 15, 8, 59, 30))
+    provider = CalendarFeatureProvider(CountingLookup(), clock=clock, bucket_seconds=60)
+    before = provider.get()
+    assert before["is_peak_hour"] == 1
+
+    clock.now = datetime.datetime(2024, 3, 15, 9, 0)
+    after = provider.get()
+    assert after is not before
+    assert provider.bucket_key() == datetime.datetime(2024, 3, 15, 9, 0)
+    assert after["is_peak_hour"] == 0
+    assert after["hour_sin"] != before["hour_sin"]
+
+
+def test_holiday_follows_the_day_rollover():
+    clock = FakeClock(datetime.datetime(2024, 12, 24, 23, 58))
+    lookup = CountingLookup()
+    provider = CalendarFeatureProvider(lookup, clock=clock, bucket_seconds=600)
+    assert provider.get()["is_holiday"] == 0
+    # Balde de 10 min começando às 23:50 termina à meia-noite, não às 00:00 + 10 min do dia seguinte
+    assert provider.expires_at == datetime.datetime(2024, 12, 25)
+
+    clock.now = datetime.datetime(2024, 12, 25, 0, 0, 1)
+    assert provider.get()["is_holiday"] == 1
+    clock.now = datetime.datetime(2024, 12, 25, 0, 30)
+    assert provider.get()["is_holiday"] == 1
+    # Feriado consultado uma vez por dia, não por balde
+    assert lookup.calls == [datetime.date(2024, 12, 24), datetime.date(2024, 12, 25)]
+
+    clock.now = datetime.datetime(2024, 12, 26, 0, 0)
+    assert provider.get()["is_holiday"] == 0
+
+
+def test_invalidate_recomputes_the_holiday():
+    clock = FakeClock(datetime.datetime(2024, 12, 25, 12, 0))
+    lookup = CountingLookup()
+    provider = CalendarFeatureProvider(lookup, clock=clock)
+    assert provider.get()["is_holiday"] == 1
+    lookup.holidays.clear()
+    assert provider.get()["is_holiday"] == 1
+    provider.invalidate()
+    assert provider.get()["is_holiday"] == 0
+
+
+def test_rejects_non_positive_bucket():
+    with pytest.raises(ValueError):
+        CalendarFeatureProvider(CountingLookup(), bucket_seconds=0)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_check_metrics.py
+from check_metrics import compare
+
+METRICS = {"rmse": 2.0, "linha_p50_us": 40.0, "lote_por_linha_us": 1.0}
+
+
+def _compare(models, candidate_keys):
+    return compare({"modelos": models}, {name: name for name in ("uberX", "99Pop")}, candidate_keys,
+                   max_rmse_increase=0.02, max_latency_increase=0.25)
+
+
+def test_missing_or_unevaluated_candidate_fails():
+    models = {"uberX": dict(METRICS), "99Pop": dict(METRICS),
+              "99Pop (novo)": {"arquivo": "novo/99Pop.pkl", "erro": "nenhuma linha de teste"}}
+    rows, failed = _compare(models, {"99Pop": "99Pop (novo)"})
+    assert failed == ["uberX: sem artefato candidato",
+                      "99Pop: candidato sem avaliação (nenhuma linha de teste)"]
+    assert [row["modelo"] for row in rows] == ["uberX", "99Pop"]
+
+
+def test_regression_above_tolerance_fails():
+    models = {"uberX": dict(METRICS), "99Pop": dict(METRICS),
+              "uberX (novo)": {**METRICS, "rmse": 2.1}, "99Pop (novo)": {**METRICS, "linha_p50_us": 60.0}}
+    rows, failed = _compare(models, {"uberX": "uberX (novo)", "99Pop": "99Pop (novo)"})
+    assert len(failed) == 2 and failed[0].startswith("uberX: rmse") and failed[1].startswith("99Pop: linha_p50_us")
+    assert rows[0]["rmse_var"] > 0.02
+
+
+def test_candidates_within_tolerance_pass():
+    models = {"uberX": dict(METRICS), "99Pop": dict(METRICS),
+              "uberX (novo)": {**METRICS, "rmse": 2.01}, "99Pop (novo)": dict(METRICS)}
+    assert _compare(models, {"uberX": "uberX (novo)", "99Pop": "99Pop (novo)"})[1] == []
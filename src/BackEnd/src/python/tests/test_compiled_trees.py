@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_compiled_trees.py
+# CompiledTreeModel (árvores em arrays, usado pela API) contra o predict() do .pkl.
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+from compiled_trees import (COMPILED_ATOL, COMPILED_RTOL, compile_model, compiled_path_for, export_artifact,
+                            is_current, load_compiled, sample_inputs)
+from conftest import MODEL_SCHEMAS
+
+xgb = pytest.importorskip("xgboost")
+
+# Colunas na ordem do UberX.pkl de modelos_final
+MODEL_FEATURES = MODEL_SCHEMAS["UberX.pkl"]
+
+ESTIMATORS = {
+    "xgboost": lambda: xgb.XGBRegressor(n_estimators=40, max_depth=5, learning_rate=0.2, random_state=0),
+    "random_forest": lambda: RandomForestRegressor(n_estimators=15, max_depth=7, random_state=0),
+    "decision_tree": lambda: DecisionTreeRegressor(max_depth=9, random_state=0),
+}
+
+
+def _pipeline(training_frame, kind):
+    X, y = training_frame
+    return Pipeline([("scaler", StandardScaler()), ("model", ESTIMATORS[kind]())]).fit(X[MODEL_FEATURES], y)
+
+
+@pytest.mark.parametrize("kind", sorted(ESTIMATORS))
+def test_compiled_matches_pipeline(training_frame, kind):
+    pipeline = _pipeline(training_frame, kind)
+    compiled = compile_model(pipeline, MODEL_FEATURES)
+    X = training_frame[0][MODEL_FEATURES]
+    np.testing.assert_allclose(compiled.predict(X), pipeline.predict(X), rtol=COMPILED_RTOL, atol=COMPILED_ATOL)
+    # Entradas nos dois lados de cada limiar (e NaN no XGBoost, que segue default_left)
+    probe = sample_inputs(compiled, include_missing=kind == "xgboost")
+    frame = X.iloc[:0].reindex(range(len(probe)))
+    frame[:] = probe
+    np.testing.assert_allclose(compiled.predict(probe), pipeline.predict(frame), rtol=COMPILED_RTOL, atol=COMPILED_ATOL)
+
+
+def test_export_round_trip(tmp_path, training_frame):
+    pipeline = _pipeline(training_frame, "xgboost")
+    pkl_path = str(tmp_path / "UberX.pkl")
+    joblib.dump({"pipeline": pipeline, "feature_columns": MODEL_FEATURES}, pkl_path)
+    output_path, max_diff = export_artifact(pkl_path)
+    assert output_path == compiled_path_for(pkl_path)
+    assert max_diff <= COMPILED_ATOL
+
+    data = load_compiled(output_path, source_path=pkl_path)
+    assert data["feature_columns"] == MODEL_FEATURES
+    X = training_frame[0][MODEL_FEATURES]
+    np.testing.assert_allclose(data["pipeline"].predict(X), pipeline.predict(X), rtol=COMPILED_RTOL, atol=COMPILED_ATOL)
+
+
+def test_compiled_artifact_of_replaced_pkl_is_rejected(tmp_path, training_frame):
+    pkl_path = str(tmp_path / "UberX.pkl")
+    joblib.dump({"pipeline": _pipeline(training_frame, "decision_tree"), "feature_columns": MODEL_FEATURES}, pkl_path)
+    compiled_path, _ = export_artifact(pkl_path)
+    assert is_current(compiled_path, pkl_path)
+
+    joblib.dump({"pipeline": _pipeline(training_frame, "random_forest"), "feature_columns": MODEL_FEATURES}, pkl_path)
+    assert not is_current(compiled_path, pkl_path)
+    with pytest.raises(ValueError, match="outra versão"):
+        load_compiled(compiled_path, source_path=pkl_path)
+    # Sem source_path (ou sem o .pkl ao lado) o .npz continua carregável sozinho
+    assert load_compiled(compiled_path)["feature_columns"] == MODEL_FEATURES
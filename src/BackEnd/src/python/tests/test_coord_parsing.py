@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_coord_parsing.py
+# clean_coords (vetorizado) contra a limpeza valor a valor do rotas.py original.
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from coord_parsing import clean_coords, synthetic_raw_coords
+
+
+def baseline_clean_coord(x):
+    # Cópia literal do rotas.py antes da vetorização
+    if pd.isna(x): return np.nan
+    s = str(x).replace(',', '.')
+    m = re.search(r'[-+]?\d*\.\d+|\d+', s)
+    return float(m.group()) if m else np.nan
+
+
+def _assert_same(raw):
+    expected = raw.map(baseline_clean_coord).to_numpy(dtype=np.float64)
+    actual = clean_coords(raw)
+    assert actual.index.equals(raw.index)
+    np.testing.assert_array_equal(actual.to_numpy(), expected)
+
+
+def test_synthetic_dump(tmp_path):
+    # Passa pelo read_csv como no rotas.py: a coluna chega como object (texto) misturado
+    path = tmp_path / "coords.csv"
+    synthetic_raw_coords(50_000, seed=3).to_frame().to_csv(path, sep=";", index=False)
+    raw = pd.read_csv(path, sep=";", low_memory=False)["raw_lat"]
+    _assert_same(raw)
+
+
+@pytest.mark.parametrize("values", [
+    ["-23,5505", "-46.6333", " -23.5 ", "lat:-23,5", "(12.5)", "12°", "--7.25", "1,,", "+.5", "12.",
+     "-7", "7", "", "abc", "1e-5", "−23.5", "23.5\n1", "1234567890123456.5", "0.00000000000000000001", None, np.nan],
+    # Textos longos: o parser do pd.to_numeric erra o último dígito, float(texto) não
+    ["-23.550519999999999", "-46,633308999999997", "-23.527377473811313280", "0.17482471812196109794968"],
+    # Iguais como objetos, diferentes como texto
+    [-23, -23.0, "-23", True, 1, 1.0, "-23.0"],
+    [-23.5505, 1e-5, 1e17, -0.0, np.inf, np.nan, 42.0],
+    [-23, 0, 46],
+    [True, False, "1.5"],
+])
+def test_edge_cases(values):
+    _assert_same(pd.Series(values, index=np.arange(len(values)) * 10))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_datetime_parsing.py
+# parse_datetimes (layout fixo em NumPy) contra o caminho valor a valor (fix_date_str + to_datetime).
+import numpy as np
+import pandas as pd
+
+from datetime_parsing import parse_datetimes, parse_datetimes_rowwise, synthetic_raw_datetimes
+
+
+def _assert_same(raw, chunk_rows=500_000):
+    expected = parse_datetimes_rowwise(raw)
+    actual = parse_datetimes(raw, chunk_rows=chunk_rows)
+    assert actual.dtype == "datetime64[ns]"
+    np.testing.assert_array_equal(actual.to_numpy().view(np.int64), expected.view(np.int64))
+
+
+def test_synthetic_dump():
+    # Frações de 0 a 9 dígitos, 'T', datas inválidas, fusos e NaN, em blocos pequenos
+    _assert_same(synthetic_raw_datetimes(30_000, seed=5), chunk_rows=4_096)
+
+
+def test_offsets_are_dropped_keeping_the_wall_clock_time():
+    # Um valor fora do layout rápido + um com fuso no mesmo bloco: to_datetime(format='ISO8601')
+    # levantava "Mixed timezones detected". A hora do relógio (local, como na API) é mantida
+    raw = pd.Series(["2023-1-01 10:00:00", "2023-01-01 10:00:00-03:00", "2023-01-01T10:00:00Z",
+                     "2023-01-01 10:00:00.1234567+0100", "2023-01-01 10:00:00 UTC", "2023-01-01", None])
+    _assert_same(raw)
+    expected = [pd.Timestamp("2023-01-01 10:00:00")] * 3 + [pd.Timestamp("2023-01-01 10:00:00.123456"),
+                                                            pd.Timestamp("2023-01-01 10:00:00"),
+                                                            pd.Timestamp("2023-01-01"), pd.NaT]
+    assert parse_datetimes(raw).tolist() == expected
+
+
+def test_fraction_truncated_and_invalid_dates():
+    raw = pd.Series(["2024-02-29 23:59:59.9999999", "2023-02-29 10:00:00", "2023-01-01 24:00:00",
+                     "2023-01-01T08:30:00.5", "abc", ""])
+    _assert_same(raw)
+    assert parse_datetimes(raw)[0] == pd.Timestamp("2024-02-29 23:59:59.999999")
+    assert parse_datetimes(raw)[1:3].isna().all()
+
+
+def test_datetime_column_passes_through():
+    stamps = pd.Series(pd.to_datetime(["2023-01-01 10:00:00", None]), index=[7, 9], name="Create")
+    result = parse_datetimes(stamps)
+    assert result.index.tolist() == [7, 9] and result.name == "Create"
+    assert result[7] == pd.Timestamp("2023-01-01 10:00:00") and pd.isna(result[9])
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_feature_layout.py
+# Caminho rápido (FeatureLayout, sem pandas) contra o predict() com DataFrame, nas ordens de colunas dos .pkl.
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from conftest import MODEL_LAYOUTS, MODEL_SCHEMAS
+from feature_layout import FeatureLayout
+
+# Features geradas pela API (main.NUMERIC_REQUEST_FEATURES)
+REQUEST_FEATURES = ["distance_m", "duration_s", "year", "month", "is_holiday",
+                    "hour_sin", "hour_cos", "weekday_sin", "weekday_cos", "is_peak_hour"]
+
+
+@pytest.fixture(scope="module", params=MODEL_LAYOUTS, ids=lambda columns: f"{columns[0]}-first")
+def fitted(request, training_frame):
+    # (colunas do artefato, pipeline treinado nelas)
+    X, y = training_frame
+    model = Pipeline([("scaler", StandardScaler()),
+                      ("model", RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0))])
+    return request.param, model.fit(X[request.param], y)
+
+
+def _request_features(n_rows, seed=1):
+    rng = np.random.default_rng(seed)
+    hour = rng.uniform(0, 24, n_rows)
+    weekday = rng.integers(0, 7, n_rows)
+    return {
+        "distance_m": rng.uniform(500, 40_000, n_rows), "duration_s": rng.uniform(60, 4_000, n_rows),
+        "year": rng.integers(2021, 2025, n_rows).astype(float), "month": rng.integers(1, 13, n_rows).astype(float),
+        "is_holiday": (rng.random(n_rows) < 0.1).astype(float),
+        "hour_sin": np.sin(2 * np.pi * hour / 24), "hour_cos": np.cos(2 * np.pi * hour / 24),
+        "weekday_sin": np.sin(2 * np.pi * weekday / 7), "weekday_cos": np.cos(2 * np.pi * weekday / 7),
+        "is_peak_hour": (((hour >= 5) & (hour < 9)) | ((hour >= 16) & (hour < 20))).astype(float),
+    }
+
+
+def _dataframe_predict(pipeline, columns, features, n_rows):
+    # Mesmo DataFrame de main.prepare_batch_input_for_fastapi_model
+    frame = pd.DataFrame({col: features.get(col, np.nan) for col in columns},
+                         index=pd.RangeIndex(n_rows), columns=columns)
+    return np.asarray(pipeline.predict(frame), dtype=float)
+
+
+def test_artifacts_use_the_api_features():
+    # Todos os .pkl esperam exatamente as features geradas pela API, em uma de duas ordens
+    assert all(sorted(columns) == sorted(REQUEST_FEATURES) for columns in MODEL_SCHEMAS.values())
+    assert MODEL_SCHEMAS["99Pop.pkl"] == list(reversed(MODEL_SCHEMAS["UberX.pkl"]))
+    assert MODEL_SCHEMAS["UberComfort.pkl"] == MODEL_SCHEMAS["99Pop.pkl"]
+
+
+def test_verify_parity_enables_fast_path(fitted):
+    columns, pipeline = fitted
+    layout = FeatureLayout(columns, REQUEST_FEATURES)
+    assert layout.missing_columns == []
+    assert layout.verify_parity(pipeline, _request_features(16), 16)
+    assert layout.fast_path_ok
+
+
+def test_fill_row_matches_dataframe(fitted):
+    columns, pipeline = fitted
+    layout = FeatureLayout(columns, REQUEST_FEATURES)
+    features = _request_features(50)
+    expected = _dataframe_predict(pipeline, columns, features, 50)
+    for i in range(50):
+        row = {col: values[i] for col, values in features.items()}
+        assert float(layout.predict_one(pipeline, row)[0]) == pytest.approx(expected[i], rel=1e-9, abs=1e-9)
+
+
+def test_build_matrix_matches_dataframe_with_scalars(fitted):
+    # Lote do /predict/batch: distância/duração por viagem, calendário escalar para todas
+    columns, pipeline = fitted
+    layout = FeatureLayout(columns, REQUEST_FEATURES)
+    features = _request_features(200)
+    features.update({col: float(features[col][0]) for col in ("year", "month", "is_holiday", "hour_sin",
+                                                              "hour_cos", "weekday_sin", "weekday_cos")})
+    np.testing.assert_allclose(layout.predict_many(pipeline, features, 200),
+                               _dataframe_predict(pipeline, columns, features, 200), rtol=1e-9, atol=1e-9)
+
+
+def test_columns_not_generated_stay_nan():
+    layout = FeatureLayout(["distance_m", "hour_min", "duration_s"], REQUEST_FEATURES)
+    assert layout.missing_columns == ["hour_min"]
+    np.testing.assert_array_equal(layout.fill_row({"distance_m": 5000.0, "duration_s": 600.0}),
+                                  [[5000.0, np.nan, 600.0]])
+
+
+@pytest.mark.skipif(len(MODEL_LAYOUTS) < 2, reason="os artefatos usam uma única ordem de colunas")
+def test_verify_parity_rejects_the_other_artifact_order(training_frame):
+    # Pipeline treinado na ordem do UberX com o layout do 99Pop: o caminho rápido não pode ser ativado
+    X, y = training_frame
+    columns = MODEL_SCHEMAS["UberX.pkl"]
+    pipeline = Pipeline([("scaler", StandardScaler()),
+                         ("model", RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0))])
+    pipeline.fit(X[columns], y)
+    layout = FeatureLayout(MODEL_SCHEMAS["99Pop.pkl"], REQUEST_FEATURES)
+    assert not layout.verify_parity(pipeline, _request_features(16), 16)
+    assert not layout.fast_path_ok
+
+
+def test_feature_names_warning_is_silenced_only_inside_predict(fitted):
+    columns, pipeline = fitted
+    layout = FeatureLayout(columns, REQUEST_FEATURES)
+    row = {col: values[0] for col, values in _request_features(1).items()}
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        layout.predict_one(pipeline, row)
+        layout.predict_many(pipeline, _request_features(4), 4)
+        assert caught == []
+        pipeline.predict(layout.fill_row(row))
+    assert any("valid feature names" in str(warning.message) for warning in caught)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_feature_store.py
+# refresh() incremental (high-water mark + pendentes, em lotes ou não) contra uma reconstrução do zero.
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_store
+from feature_store import FeatureStore, refresh
+
+KEY = "RideID"
+COLUMN_TYPES = {KEY: "id", "Create": "datetime", "Price": "float"}
+
+
+def _write_csvs(folder, first_id, last_id, mode="w"):
+    # Corridas em ordem de RideID; ~1/10 sem estimativa e duas estimativas por corrida nas demais
+    rng = np.random.default_rng(first_id)
+    ids = np.arange(first_id, last_id + 1)
+    stamps = np.datetime64("2023-12-20") + rng.integers(0, 30 * 86400, len(ids)).astype("timedelta64[s]")
+    created = pd.Series(stamps).dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+    rides = pd.DataFrame({KEY: ids, "Create": created})
+    priced = np.repeat(ids[ids % 10 != 3], 2)
+    estimates = pd.DataFrame({KEY: priced, "Price": rng.uniform(5, 90, len(priced)).round(2)})
+    for name, frame in (("ride_v2.csv", rides), ("rideestimative_v3.csv", estimates)):
+        frame.to_csv(folder / name, sep=";", index=False, mode=mode, header=mode == "w")
+
+
+def _distances(available):
+    # Como o RouteResultsStore: só as corridas que o rotas.py já calculou
+    def read_distances(ride_ids):
+        ids = np.intersect1d(np.asarray(ride_ids, dtype=np.int64), available)
+        return pd.DataFrame({KEY: ids, "distancia_m": ids * 10.0, "tempo_estim_segundos": ids * 1.5})
+    return read_distances
+
+
+def _refresh(folder, store, available, **options):
+    return refresh(store, folder / "ride_v2.csv", "Create", folder / "rideestimative_v3.csv", ["Price"],
+                   _distances(available), **options)
+
+
+def _table(store):
+    frame = store.read_frame().drop(columns="datetime")
+    return frame.sort_values([KEY, "Price"]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("options", [{}, {"column_types": COLUMN_TYPES},
+                                     {"column_types": COLUMN_TYPES, "batch_rides": 64}],
+                         ids=["csv", "cache", "lotes"])
+def test_incremental_refresh_equals_full_rebuild(tmp_path, monkeypatch, options):
+    monkeypatch.chdir(tmp_path)   # cache colunar em ./data/raw_cache
+    all_ids = np.arange(1, 601)
+    _write_csvs(tmp_path, 1, 300)
+    with FeatureStore(str(tmp_path / "incremental.sqlite"), key=KEY, value_columns=["Price", "distancia_m",
+                                                                                  "tempo_estim_segundos"]) as store:
+        # 1ª execução: parte das rotas ainda não calculada → pendentes
+        first = _refresh(tmp_path, store, all_ids[all_ids % 7 != 0], **options)
+        assert first["pending"] > 0 and store.high_water_mark() == 300
+        # 2ª execução: corridas novas no fim dos CSVs e as rotas que faltavam
+        _write_csvs(tmp_path, 301, 600, mode="a")
+        second = _refresh(tmp_path, store, all_ids, **options)
+        assert second["pending_before"] == first["pending"]
+        incremental = _table(store)
+        assert store.high_water_mark() == 600
+
+    with FeatureStore(str(tmp_path / "full.sqlite"), key=KEY, value_columns=["Price", "distancia_m",
+                                                                           "tempo_estim_segundos"]) as store:
+        _refresh(tmp_path, store, all_ids, rebuild=True, **options)
+        full = _table(store)
+    pd.testing.assert_frame_equal(incremental, full)
+    # Corridas sem estimativa seguem pendentes nos dois casos; as demais entraram
+    assert set(full[KEY]) == set(all_ids[all_ids % 10 != 3])
+    assert full["is_holiday"].max() == 1   # 25/12 e 01/01 no período
+
+
+def test_holiday_calendar_failure_aborts_without_writing(tmp_path, monkeypatch):
+    _write_csvs(tmp_path, 1, 100)
+
+    def broken(**kwargs):
+        raise OSError("calendário indisponível")
+
+    with FeatureStore(str(tmp_path / "store.sqlite"), key=KEY, value_columns=["Price", "distancia_m",
+                                                                            "tempo_estim_segundos"]) as store:
+        monkeypatch.setattr(feature_store, "calendar_from_env", broken)
+        with pytest.raises(OSError, match="calendário indisponível"):
+            _refresh(tmp_path, store, np.arange(1, 101))
+        assert store.count() == 0 and store.high_water_mark() is None
+        monkeypatch.undo()
+        _refresh(tmp_path, store, np.arange(1, 101))
+        assert store.high_water_mark() == 100 and _table(store)["is_holiday"].max() == 1
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_featurizer.py
+# time_features (aritmética inteira) contra as contas do save_model.py original e contra a forma escalar da API.
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from featurizer import TIME_FEATURES, _scalar_reference, time_features, time_features_row
+
+
+def _stamps(n_rows, seed=0):
+    # 1900–2200 com segundos e frações: anos bissextos, viradas de século e datas antes de 1970
+    rng = np.random.default_rng(seed)
+    offsets = rng.integers(-70 * 365 * 86400, 230 * 365 * 86400, n_rows) * 1_000_000_000
+    return (offsets + rng.integers(0, 1_000_000_000, n_rows)).view("datetime64[ns]")
+
+
+def _baseline_save_model(stamps):
+    # Cópia das contas do save_model.py original (weekday_val com Segunda=1…Domingo=7)
+    df = pd.DataFrame({"datetime": stamps})
+    df["hour_val"] = df["datetime"].dt.hour + df["datetime"].dt.minute / 60.0
+    df["weekday_val"] = df["datetime"].dt.weekday + 1
+    df["day"] = df["datetime"].dt.day
+    df["month"] = df["datetime"].dt.month
+    df["year"] = df["datetime"].dt.year
+    df["hour_min"] = df["hour_val"]
+    df["hour_sin"] = np.sin(2 * np.pi * df["hour_min"] / 24)
+    df["hour_cos"] = np.cos(2 * np.pi * df["hour_min"] / 24)
+    df["weekday_sin"] = np.sin(2 * np.pi * df["weekday_val"] / 7)
+    df["weekday_cos"] = np.cos(2 * np.pi * df["weekday_val"] / 7)
+    return df
+
+
+def test_columnar_matches_original_save_model_math():
+    stamps = _stamps(50_000)
+    baseline = _baseline_save_model(stamps)
+    features = time_features(stamps, chunk_rows=4_096)
+    for name in ("year", "month", "day"):
+        np.testing.assert_array_equal(features[name], baseline[name].to_numpy())
+    np.testing.assert_allclose(features["hour_min"], baseline["hour_min"].to_numpy(), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(features["hour_sin"], baseline["hour_sin"].to_numpy(), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(features["hour_cos"], baseline["hour_cos"].to_numpy(), rtol=0, atol=1e-12)
+    # Convenção única Segunda=0: o weekday_val antigo é weekday + 1, e o seno/cosseno antigos
+    # são os de weekday + 1 (deslocados um dia)
+    np.testing.assert_array_equal(features["weekday"] + 1, baseline["weekday_val"].to_numpy())
+    shifted = 2 * np.pi * (features["weekday"] + 1) / 7
+    np.testing.assert_allclose(np.sin(shifted), baseline["weekday_sin"].to_numpy(), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(np.cos(shifted), baseline["weekday_cos"].to_numpy(), rtol=0, atol=1e-12)
+
+
+def test_row_matches_scalar_api_and_columnar():
+    rng = np.random.default_rng(1)
+    samples = [datetime.datetime(1999, 12, 31) + datetime.timedelta(minutes=int(m))
+               for m in rng.integers(0, 30 * 365 * 1440, 2_000)]
+    columnar = time_features(np.array(samples, dtype="datetime64[ns]"))
+    for i, now in enumerate(samples):
+        row = time_features_row(now)
+        scalar = _scalar_reference(now)
+        assert all(row[name] == scalar[name] == columnar[name][i] for name in TIME_FEATURES), now
+
+
+def test_single_instant_returns_one_position():
+    now = datetime.datetime(2024, 2, 29, 17, 45)
+    features = time_features(np.datetime64(now))
+    assert all(len(features[name]) == 1 for name in TIME_FEATURES)
+    assert features["weekday"][0] == 3 and features["is_peak_hour"][0] == 1
+    assert features["hour_min"][0] == 17.75
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_holiday_calendar.py
+# HolidayCalendar (conjunto de datas e bitmap por dia) contra o pacote holidays, que ele pré-calcula.
+import datetime
+
+import holidays
+import numpy as np
+import pandas as pd
+import pytest
+
+from holiday_calendar import CITY_HOLIDAYS, HolidayCalendar, calendar_from_env
+
+FIRST_YEAR, LAST_YEAR = 2019, 2026
+
+
+@pytest.mark.parametrize("state", [None, "SP", "RJ"])
+def test_bitmap_matches_holidays_package_over_the_range(state):
+    calendar = HolidayCalendar(FIRST_YEAR, LAST_YEAR, state=state)
+    expected_dates = holidays.Brazil(years=range(FIRST_YEAR, LAST_YEAR + 1), subdiv=state)
+    # Todos os dias do intervalo, mais um dia antes e um depois (bordas do bitmap)
+    days = pd.date_range(f"{FIRST_YEAR - 1}-12-31", f"{LAST_YEAR + 1}-01-01", freq="D")
+    # Meio-dia: o bitmap olha só a data, não a hora
+    flags = calendar.is_holiday_array(days + pd.Timedelta(hours=12))
+    expected = np.array([FIRST_YEAR <= day.year <= LAST_YEAR and day.date() in expected_dates for day in days],
+                        dtype=np.int8)
+    np.testing.assert_array_equal(flags, expected)
+    assert [calendar.is_holiday(day.date()) for day in days] == expected.tolist()
+    assert calendar.dates == frozenset(expected_dates)
+
+
+def test_range_edges_and_missing_values():
+    calendar = HolidayCalendar(FIRST_YEAR, LAST_YEAR)
+    values = pd.Series(pd.to_datetime(["2019-01-01 00:00", "2026-12-25 23:59", "2018-12-25 00:00",
+                                       "2027-01-01 00:00", None]))
+    np.testing.assert_array_equal(calendar.is_holiday_array(values), [1, 1, 0, 0, 0])
+    assert calendar.is_holiday(datetime.datetime(2026, 12, 25, 23, 59)) == 1
+    assert calendar.is_holiday(datetime.date(2027, 1, 1)) == 0
+    assert calendar.is_holiday_array(pd.Series([], dtype="datetime64[ns]")).tolist() == []
+
+
+@pytest.mark.parametrize("city, key", [("São Paulo", "SAO_PAULO"), ("rio de janeiro", "RIO_DE_JANEIRO")])
+def test_city_holidays_are_added_every_year(city, key):
+    calendar = HolidayCalendar(FIRST_YEAR, LAST_YEAR, state="SP", city=city)
+    assert calendar.city == key
+    national = HolidayCalendar(FIRST_YEAR, LAST_YEAR, state="SP")
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        for month, day in CITY_HOLIDAYS[key]:
+            assert calendar.is_holiday(datetime.date(year, month, day)) == 1
+            assert national.is_holiday(datetime.date(year, month, day)) == 0
+    days = pd.date_range(f"{FIRST_YEAR}-01-01", f"{LAST_YEAR}-12-31", freq="D")
+    assert calendar.is_holiday_array(days).sum() == len(calendar.dates)
+
+
+def test_unknown_city_and_inverted_range_are_rejected():
+    with pytest.raises(ValueError, match="sem feriados cadastrados"):
+        HolidayCalendar(FIRST_YEAR, LAST_YEAR, city="Curitiba")
+    with pytest.raises(ValueError):
+        HolidayCalendar(LAST_YEAR, FIRST_YEAR)
+
+
+def test_extra_dates_outside_the_range_are_ignored():
+    calendar = HolidayCalendar(2024, 2024, extra_dates=["2024-03-15", datetime.date(2025, 3, 15)])
+    assert calendar.is_holiday(datetime.date(2024, 3, 15)) == 1
+    np.testing.assert_array_equal(calendar.is_holiday_array(pd.to_datetime(["2024-03-15", "2025-03-15"])), [1, 0])
+
+
+def test_calendar_from_env_years_outside_the_range_are_not_holidays(monkeypatch):
+    monkeypatch.setenv("HOLIDAY_FIRST_YEAR", "2022")
+    monkeypatch.setenv("HOLIDAY_LAST_YEAR", "2023")
+    monkeypatch.setenv("HOLIDAY_STATE", "SP")
+    monkeypatch.setenv("HOLIDAY_CITY", "sao paulo")
+    calendar = calendar_from_env()
+    assert (calendar.first_year, calendar.last_year, calendar.state, calendar.city) == (2022, 2023, "SP", "SAO_PAULO")
+    # Natal e aniversário de SP: feriado dentro do intervalo, 0 (sem erro) fora dele
+    for date in (datetime.date(2022, 12, 25), datetime.date(2023, 1, 25)):
+        assert calendar.is_holiday(date) == 1
+    for date in (datetime.date(2021, 12, 25), datetime.date(2024, 1, 25)):
+        assert calendar.is_holiday(date) == 0
+    np.testing.assert_array_equal(
+        calendar.is_holiday_array(pd.to_datetime(["2021-12-25", "2022-12-25", "2023-01-25", "2024-01-25"])),
+        [0, 1, 1, 0])
+    # Argumentos têm prioridade sobre o ambiente
+    assert calendar_from_env(first_year=2024, last_year=2024).is_holiday(datetime.date(2024, 1, 25)) == 1
+
+
+def test_calendar_from_env_default_range(monkeypatch):
+    for name in ("HOLIDAY_FIRST_YEAR", "HOLIDAY_LAST_YEAR", "HOLIDAY_STATE", "HOLIDAY_CITY"):
+        monkeypatch.delenv(name, raising=False)
+    calendar = calendar_from_env()
+    current_year = datetime.date.today().year
+    assert (calendar.first_year, calendar.last_year) == (current_year - 10, current_year + 2)
+    assert calendar.state is None and calendar.city is None
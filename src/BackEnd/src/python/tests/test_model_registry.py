@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_model_registry.py
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.tree import DecisionTreeRegressor
+
+from compiled_trees import compiled_path_for, export_artifact
+from model_registry import ModelRegistry
+
+MODEL_FILES = {"uberX": "UberX.pkl", "uberComfort": "UberComfort.pkl", "99Pop": "99Pop.pkl"}
+
+
+def _write_model(path, slope):
+    X = pd.DataFrame({"distance_m": np.arange(10, dtype=float)})
+    model = DecisionTreeRegressor(random_state=0).fit(X, slope * X["distance_m"])
+    joblib.dump({"pipeline": model, "feature_columns": ["distance_m"]}, path)
+    # mtime explícito: duas gravações no mesmo instante teriam a mesma assinatura
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def _prepare(model_name, data):
+    return {"pipeline": data["pipeline"], "features": data["feature_columns"]}
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    for slope, filename in enumerate(MODEL_FILES.values(), start=1):
+        _write_model(tmp_path / filename, slope)
+    return tmp_path
+
+
+def test_failed_model_swapped_in_keeps_model_files_order(model_dir):
+    os.remove(model_dir / "UberComfort.pkl")
+    registry = ModelRegistry(str(model_dir), MODEL_FILES, _prepare)
+    registry.load_all()
+    assert list(registry.models) == ["uberX", "99Pop"]
+    assert "uberComfort" in registry.failed
+
+    _write_model(model_dir / "UberComfort.pkl", 5)
+    assert list(registry.check_for_changes()) == ["uberComfort"]
+    assert list(registry.models) == ["uberX", "uberComfort", "99Pop"]
+    assert "uberComfort" not in registry.failed
+
+
+def test_swap_replaces_dict_and_keeps_old_snapshot(model_dir):
+    registry = ModelRegistry(str(model_dir), MODEL_FILES, _prepare)
+    registry.load_all()
+    snapshot = registry.models
+    old_version = snapshot["uberX"]["version"]
+
+    _write_model(model_dir / "UberX.pkl", 7)
+    new_version = registry.reload_model("uberX")
+    assert new_version != old_version
+    assert snapshot["uberX"]["version"] == old_version
+    assert list(registry.models) == list(MODEL_FILES)
+    assert registry.rollback("uberX") == old_version
+    assert list(registry.models) == list(MODEL_FILES)
+
+
+def test_new_pkl_is_not_hidden_by_stale_compiled_artifact(model_dir):
+    # MODEL_FORMAT=auto: o .npz exportado do .pkl atual é preferido; um .pkl novo sem export o invalida
+    pkl_path = str(model_dir / "UberX.pkl")
+    export_artifact(pkl_path)
+    registry = ModelRegistry(str(model_dir), MODEL_FILES, _prepare, prefer_compiled=True)
+    registry.load_all()
+    assert registry.models["uberX"]["artifact"] == "UberX.trees.npz"
+    assert registry.models["uberX"]["pipeline"].predict(np.array([[9.0]]))[0] == 9.0
+
+    _write_model(pkl_path, 10)
+    assert registry.artifact_path("uberX") == pkl_path
+    assert list(registry.check_for_changes()) == ["uberX"]
+    assert registry.models["uberX"]["artifact"] == "UberX.pkl"
+    assert registry.models["uberX"]["pipeline"].predict(pd.DataFrame({"distance_m": [9.0]}))[0] == 90.0
+
+    # Exportado de novo: o watcher também vê o .npz e volta para o formato compilado
+    export_artifact(pkl_path)
+    assert list(registry.check_for_changes()) == ["uberX"]
+    assert registry.models["uberX"]["artifact"] == "UberX.trees.npz"
+    assert os.path.exists(compiled_path_for(pkl_path))
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_prediction_cache.py
+import datetime
+
+from prediction_cache import LocalSharedBackend, PredictionCache
+
+BUCKET = datetime.datetime(2024, 3, 15, 7, 45)
+
+
+def test_late_write_from_old_version_is_not_served_after_swap():
+    # Requisição começa com a versão v1, a troca limpa o cache, e só então o resultado é gravado
+    cache = PredictionCache(backend=LocalSharedBackend())
+    old_key = cache.make_key(5000, 600, BUCKET, "uberX=v1,99Pop=v1")
+    cache.clear()
+    cache.set(old_key, {"uberX": 10.0, "99Pop": 11.0})
+
+    new_key = cache.make_key(5000, 600, BUCKET, "uberX=v2,99Pop=v1")
+    assert new_key != old_key
+    assert cache.get(new_key) is None
+    assert cache.get(old_key) == {"uberX": 10.0, "99Pop": 11.0}
+
+
+def test_key_quantizes_distance_and_duration():
+    cache = PredictionCache(distance_step_m=50, duration_step_s=15)
+    assert cache.make_key(5010, 601, BUCKET, "uberX=v1") == cache.make_key(4990, 598, BUCKET, "uberX=v1")
+    assert cache.make_key(5010, 601, BUCKET) != cache.make_key(5010, 601, BUCKET, "uberX=v1")
+
+
+def test_expired_entries_are_counted_apart_from_evictions():
+    now = [0.0]
+    cache = PredictionCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    for i in range(3):
+        cache.set(cache.make_key(1000 * (i + 1), 60, BUCKET), {"uberX": float(i)})
+    # Limite do LRU: a primeira entrada sai por evicção
+    assert (cache.evictions, cache.expirations) == (1, 0)
+
+    now[0] = 10.0
+    assert cache.get(cache.make_key(3000, 60, BUCKET)) is None
+    stats = cache.stats()
+    assert (stats["evictions"], stats["expirations"], stats["misses"], stats["entries"]) == (1, 1, 1, 1)
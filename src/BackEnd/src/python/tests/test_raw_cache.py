@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_raw_cache.py
+# Cache colunar (raw_cache.py) contra a leitura direta do CSV (feature_store.read_csv_rows), e invalidação.
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import raw_cache
+from feature_store import read_csv_rows
+from raw_cache import CATEGORY, DATETIME, FLOAT, ID, RawCache, _same_rows, _write_synthetic, read_cached_rows
+
+TYPES = {"RideID": ID, "Create": DATETIME, "ProductID": CATEGORY, "Price": FLOAT}
+ESTIM_COLUMNS = ["RideID", "ProductID", "Price"]
+N_RIDES = 3_000
+
+
+@pytest.fixture
+def csvs(tmp_path):
+    rides_csv, estim_csv = _write_synthetic(str(tmp_path), N_RIDES)
+    return rides_csv, estim_csv, str(tmp_path / "cache")
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    # Offsets de cada leitura do CSV pelo cache: 0 = reconstrução, > 0 = só o trecho acrescentado
+    offsets = []
+    original = raw_cache._read_typed
+
+    def recording(path, sep, column_types, header, offset=0):
+        offsets.append(offset)
+        return original(path, sep, column_types, header, offset)
+
+    monkeypatch.setattr(raw_cache, "_read_typed", recording)
+    return offsets
+
+
+def _cached(csv, cache_dir, columns=ESTIM_COLUMNS, keep=lambda ids: ids.notna(), key_range=None):
+    return read_cached_rows(csv, columns, "RideID", keep, TYPES, cache_dir=cache_dir, key_range=key_range)
+
+
+def _bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_cold_and_warm_reads_match_csv(csvs, reads):
+    rides_csv, estim_csv, cache_dir = csvs
+    for csv, columns in ((rides_csv, ["RideID", "Create"]), (estim_csv, ESTIM_COLUMNS)):
+        expected = read_csv_rows(csv, columns, "RideID", lambda ids: ids.notna())
+        assert _same_rows(expected, _cached(csv, cache_dir, columns), TYPES)
+        assert _same_rows(expected, _cached(csv, cache_dir, columns), TYPES)
+    assert reads == [0, 0]   # a segunda leitura de cada CSV não toca no CSV
+
+
+def test_touch_with_same_content_only_updates_mtime(csvs, reads):
+    _, estim_csv, cache_dir = csvs
+    generation = RawCache(estim_csv, {c: TYPES[c] for c in ESTIM_COLUMNS}, cache_dir=cache_dir).meta["generation"]
+    _bump_mtime(estim_csv)
+    meta = RawCache(estim_csv, {c: TYPES[c] for c in ESTIM_COLUMNS}, cache_dir=cache_dir).meta
+    assert reads == [0]
+    assert meta["generation"] == generation
+    assert meta["source"]["mtime_ns"] == os.stat(estim_csv).st_mtime_ns
+
+
+def test_append_converts_only_the_tail(csvs, reads):
+    _, estim_csv, cache_dir = csvs
+    _cached(estim_csv, cache_dir)
+    size = os.path.getsize(estim_csv)
+    extra = pd.read_csv(estim_csv, sep=";", nrows=200)
+    extra["RideID"] = (extra["RideID"] + N_RIDES).astype(object)
+    extra.loc[0, "ProductID"] = "taxi"          # rótulo novo: código no fim da lista existente
+    extra.loc[1, "RideID"] = "abc"              # id não numérico: descartado, como no CSV
+    extra.to_csv(estim_csv, sep=";", index=False, header=False, mode="a")
+
+    keep = lambda ids: ids.notna()
+    expected = read_csv_rows(estim_csv, ESTIM_COLUMNS, "RideID", keep)
+    assert _same_rows(expected, _cached(estim_csv, cache_dir, keep=keep), TYPES)
+    assert reads == [0, size]
+    meta = RawCache(estim_csv, {c: TYPES[c] for c in ESTIM_COLUMNS}, cache_dir=cache_dir).meta
+    assert meta["categories"]["ProductID"][-1] == "taxi" and meta["dropped"] == 1
+
+
+def test_rewrite_rebuilds(csvs, reads):
+    _, estim_csv, cache_dir = csvs
+    _cached(estim_csv, cache_dir)
+    frame = pd.read_csv(estim_csv, sep=";")
+    frame["Price"] = frame["Price"] + 1
+    frame.to_csv(estim_csv, sep=";", index=False)   # reescrito: o prefixo antigo não bate mais
+    _bump_mtime(estim_csv)
+
+    expected = read_csv_rows(estim_csv, ESTIM_COLUMNS, "RideID", lambda ids: ids.notna())
+    assert _same_rows(expected, _cached(estim_csv, cache_dir), TYPES)
+    assert reads == [0, 0]
+
+
+def test_new_columns_rebuild_with_the_union(csvs, reads):
+    rides_csv, _, cache_dir = csvs
+    _cached(rides_csv, cache_dir, ["RideID"])
+    _cached(rides_csv, cache_dir, ["RideID", "Create"])
+    assert reads == [0, 0]
+    meta = RawCache(rides_csv, {"RideID": ID}, cache_dir=cache_dir).meta
+    assert set(meta["types"]) == {"RideID", "Create"}
+    assert reads == [0, 0]   # pedir um subconjunto das colunas do cache não reconstrói
+
+
+def test_key_range_on_sorted_ids(csvs):
+    _, estim_csv, cache_dir = csvs
+    cache = RawCache(estim_csv, {c: TYPES[c] for c in ESTIM_COLUMNS}, cache_dir=cache_dir)
+    assert cache.is_sorted("RideID")
+    keep = lambda ids: (ids >= 1_000) & (ids <= 1_200)
+    # Com key_range, só o trecho [1000, 1200] é percorrido: keep nunca vê ids fora dele
+    seen = []
+    rows = np.concatenate(list(cache.iter_rows("RideID", lambda ids: seen.append(ids) or keep(ids),
+                                               key_range=(1_000, 1_200), block_rows=64)))
+    assert pd.concat(seen).between(1_000, 1_200).all()
+    expected = read_csv_rows(estim_csv, ESTIM_COLUMNS, "RideID", keep)
+    assert _same_rows(expected, cache.frame(ESTIM_COLUMNS, rows, "RideID"), TYPES)
+    assert _same_rows(expected, _cached(estim_csv, cache_dir, keep=keep, key_range=(1_000, 1_200)), TYPES)
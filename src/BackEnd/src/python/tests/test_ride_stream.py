@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_ride_stream.py
+# RideStream (streaming, memória limitada) contra o pivot_table do rotas.py original.
+import numpy as np
+import pandas as pd
+
+from coord_parsing import clean_coords
+from ride_stream import RIDE_COLUMNS, RideStream, shard_of
+
+
+def _write_addresses(path, n_rides, seed=0, shuffle=False):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for ride_id in range(1, n_rides + 1):
+        # Origem/destino (às vezes repetidos), e algumas corridas sem destino
+        kinds = [1] * rng.integers(1, 3) + ([2] * rng.integers(1, 3) if rng.random() > 0.05 else [])
+        for kind in kinds:
+            lat, lng = rng.uniform(-30, -5), rng.uniform(-60, -35)
+            rows.append((f"{lat:.6f}".replace(".", ","), f"{lng:.6f}", kind, ride_id))
+    frame = pd.DataFrame(rows, columns=["Lat", "Lng", "RideAddressTypeID", "RideID"])
+    if shuffle:
+        frame = frame.sample(frac=1, random_state=seed)
+    frame.to_csv(path, sep=";", index=False)
+    return frame
+
+
+def _baseline(frame):
+    # Limpeza + validação + pivot_table(aggfunc='mean') do rotas.py antes do streaming
+    df = frame.rename(columns={"Lat": "raw_lat", "Lng": "raw_lng", "RideAddressTypeID": "address_type",
+                               "RideID": "ride_id"})
+    df = df.assign(lat=clean_coords(df.raw_lat.astype(str)), lng=clean_coords(df.raw_lng.astype(str)))
+    counts = df.groupby(["ride_id", "address_type"]).size().unstack(fill_value=0)
+    valid_ids = counts[(counts.get(1, 0) >= 1) & (counts.get(2, 0) >= 1)].index
+    pivot = df[df.ride_id.isin(valid_ids)].pivot_table(index="ride_id", columns="address_type",
+                                                       values=["lat", "lng"], aggfunc="mean")
+    pivot.columns = ["lat_o", "lat_d", "lng_o", "lng_d"]
+    return pivot.reset_index()[RIDE_COLUMNS]
+
+
+def _collect(stream):
+    rides = pd.concat(list(stream), ignore_index=True)
+    return rides.sort_values("ride_id").reset_index(drop=True)
+
+
+def test_matches_pivot_table_with_bounded_state(tmp_path):
+    path = tmp_path / "rideaddress_v1.csv"
+    frame = _write_addresses(path, 3000)
+    stream = RideStream(path, chunk_rows=500)
+    rides = _collect(stream)
+    pd.testing.assert_frame_equal(rides, _baseline(frame), check_exact=False, rtol=1e-12)
+    assert stream.stats["incomplete"] == frame.groupby("RideID").RideAddressTypeID.max().lt(2).sum()
+    # Só o bloco corrente fica pendente/lembrado, não o histórico
+    assert stream.stats["sorted"] and stream.stats["spill_partitions"] == 0
+    assert stream.stats["max_pending"] <= 500
+    assert stream.stats["max_emitted"] <= 2 * 500
+
+
+def test_shards_partition_the_rides(tmp_path):
+    path = tmp_path / "rideaddress_v1.csv"
+    _write_addresses(path, 1000)
+    whole = _collect(RideStream(path, chunk_rows=300))
+    parts = [_collect(RideStream(path, chunk_rows=300, shard=(i, 3))) for i in range(3)]
+    for i, part in enumerate(parts):
+        assert (shard_of(part.ride_id, 3) == i).all()
+    pd.testing.assert_frame_equal(pd.concat(parts).sort_values("ride_id").reset_index(drop=True), whole)
+
+
+def test_unsorted_csv_matches_pivot_table_through_spill_partitions(tmp_path):
+    # Fora de ordem as corridas só ficam completas no fim: partições em disco por hash do RideID
+    path = tmp_path / "rideaddress_v1.csv"
+    frame = _write_addresses(path, 3000, shuffle=True)
+    stream = RideStream(path, chunk_rows=500, spill_dir=tmp_path)
+    rides = _collect(stream)
+    pd.testing.assert_frame_equal(rides, _baseline(frame), check_exact=False, rtol=1e-12)
+    assert stream.stats["sorted"] is False and stream.stats["late_rows"] == 0
+    assert stream.stats["incomplete"] == frame.groupby("RideID").RideAddressTypeID.max().lt(2).sum()
+    # Uma partição por bloco de 500 linhas: o estado em memória é o de uma partição, não o arquivo
+    partitions = stream.stats["spill_partitions"]
+    assert partitions == -(-len(frame) // 500)
+    assert stream.stats["max_pending"] <= 3 * 3000 / partitions
+    assert list(tmp_path.glob("ride_stream_*")) == []
+
+
+def test_unsorted_csv_with_shards_and_resume(tmp_path):
+    path = tmp_path / "rideaddress_v1.csv"
+    _write_addresses(path, 1000, shuffle=True)
+    whole = _collect(RideStream(path, chunk_rows=300, spill_partitions=4))
+    parts = [_collect(RideStream(path, chunk_rows=300, shard=(i, 3), skip_ids=range(1, 101))) for i in range(3)]
+    pd.testing.assert_frame_equal(pd.concat(parts).sort_values("ride_id").reset_index(drop=True),
+                                  whole[whole.ride_id > 100].reset_index(drop=True))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_route_cache.py
+# RouteCache: grade de coordenadas, invalidação por graph_version e idade, contadores e uso no AsyncORSRouter.
+import asyncio
+
+import route_cache as route_cache_module
+from ors_client import AsyncORSRouter
+from route_cache import RouteCache
+
+ORIGIN = (-46.633308, -23.550520)
+DESTINATION = (-46.656571, -23.561414)
+
+
+def test_nearby_points_share_the_grid_cell(tmp_path):
+    cache = RouteCache(str(tmp_path / "routes.sqlite"), precision=4)
+    assert cache.snap(ORIGIN, DESTINATION) == (-466333, -235505, -466566, -235614)
+    cache.put(ORIGIN, DESTINATION, 3200.0, 540.0)
+
+    # ~3 m de diferença: mesma célula de 4 casas decimais
+    hit = cache.get((-46.63333, -23.55049), (-46.65658, -23.56139))
+    assert hit == {"distance_m": 3200.0, "duration_s": 540.0, "geometry": None}
+    # Outra célula e o sentido inverso são outras rotas
+    assert cache.get((-46.6335, -23.5505), DESTINATION) is None
+    assert cache.get(DESTINATION, ORIGIN) is None
+
+
+def test_other_graph_version_is_a_miss_and_purged(tmp_path):
+    path = str(tmp_path / "routes.sqlite")
+    old = RouteCache(path, graph_version="osm-2024-01")
+    old.put(ORIGIN, DESTINATION, 3200.0, 540.0)
+
+    new = RouteCache(path, graph_version="osm-2024-06")
+    assert new.get(ORIGIN, DESTINATION) is None
+    assert new.stats()["entries"] == 0
+    assert new.purge() == 1
+    assert old.get(ORIGIN, DESTINATION) is None
+
+    # Regravar com a versão nova substitui a entrada antiga
+    new.put(ORIGIN, DESTINATION, 3300.0, 560.0)
+    assert new.get(ORIGIN, DESTINATION)["distance_m"] == 3300.0
+
+
+def test_entries_older_than_max_age_are_misses(tmp_path, monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(route_cache_module.time, "time", lambda: now[0])
+    cache = RouteCache(str(tmp_path / "routes.sqlite"), max_age_days=7)
+    cache.put(ORIGIN, DESTINATION, 3200.0, 540.0)
+
+    now[0] += 7 * 86400 - 1
+    assert cache.get(ORIGIN, DESTINATION) is not None
+    now[0] += 2
+    assert cache.get(ORIGIN, DESTINATION) is None
+    # Sem limite de idade a mesma entrada continua valendo
+    assert RouteCache(cache.path).get(ORIGIN, DESTINATION) is not None
+    assert cache.purge() == 1
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = RouteCache(str(tmp_path / "routes.sqlite"))
+    cache.put_many([(ORIGIN, DESTINATION, 3200.0, 540.0), (DESTINATION, ORIGIN, 3400.0, 600.0)])
+    results = cache.get_many([(ORIGIN, DESTINATION), (ORIGIN, DESTINATION), ((0.0, 0.0), (1.0, 1.0))])
+    assert [result is not None for result in results] == [True, True, False]
+    cache.get(DESTINATION, ORIGIN)
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"], stats["entries"]) == (3, 1, 2, 2)
+    assert stats["hit_rate"] == 0.75
+
+
+def test_route_batch_serves_cached_pairs_and_stores_new_routes(tmp_path, monkeypatch):
+    cache = RouteCache(str(tmp_path / "routes.sqlite"))
+    cache.put(ORIGIN, DESTINATION, 3200.0, 540.0)
+    routed = []
+
+    async def fake_route_pairs(ride_ids, origins, destinations):
+        routed.extend(ride_ids)
+        return [(ride_id, 1000.0 * ride_id, 100.0 * ride_id, None) for ride_id in ride_ids]
+
+    with AsyncORSRouter("http://ors.invalid", route_cache=cache) as router:
+        monkeypatch.setattr(router, "_route_pairs", fake_route_pairs)
+        results = asyncio.run(router.route_batch([1, 2, 3], [ORIGIN, DESTINATION, ORIGIN],
+                                                 [DESTINATION, ORIGIN, DESTINATION], skip={3}))
+        assert router.stats["cache_hits"] == 1
+
+    assert routed == [2]
+    assert sorted(results) == [(1, 3200.0, 540.0, None), (2, 2000.0, 200.0, None)]
+    assert cache.get(DESTINATION, ORIGIN)["distance_m"] == 2000.0
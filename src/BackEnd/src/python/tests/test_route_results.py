@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# src/python/tests/test_route_results.py
+# Exportações do RouteResultsStore lidas de volta pelos caminhos que as consomem.
+import numpy as np
+import pandas as pd
+
+from feature_store import read_csv_rows
+from route_results import RouteResultsStore
+
+RESULTS = [(3, 1200.5, 180.0, None), (1, 5300.0, 640.25, None), (2, None, None, "HTTP 404"),
+           (10, 0.0, 0.0, None)]
+
+
+def test_training_csv_is_read_like_distancia_tempo_corridas(tmp_path):
+    # Mesma leitura do DIST_CSV em save_model.read_distances / train_models.read_distances
+    with RouteResultsStore(str(tmp_path / "route_results.sqlite")) as store:
+        store.put_many(RESULTS)
+        csv_path = tmp_path / "distancia_tempo_corridas.csv"
+        store.export_training_csv(csv_path)
+        expected = store.read_frame(ok_only=True)
+
+    columns = ["RideID", "distancia_m", "tempo_estim_segundos"]
+    frame = read_csv_rows(csv_path, columns, "RideID", keep=lambda ids: ids.isin([1, 2, 3, 10]), sep=",")
+    assert list(frame.columns) == columns
+    frame = frame.sort_values("RideID").reset_index(drop=True)
+    np.testing.assert_array_equal(frame["RideID"], [1, 3, 10])
+    np.testing.assert_array_equal(frame["distancia_m"], expected.sort_values("ride_id")["distance_m"])
+    np.testing.assert_array_equal(frame["tempo_estim_segundos"], expected.sort_values("ride_id")["duration_s"])
+
+
+def test_export_and_import_round_trip(tmp_path):
+    with RouteResultsStore(str(tmp_path / "a.sqlite")) as store:
+        store.put_many(RESULTS)
+        store.export_csv(tmp_path / "resultados.csv")
+        original = store.read_frame(ok_only=False)
+    with RouteResultsStore(str(tmp_path / "b.sqlite")) as copy:
+        assert copy.import_csv(tmp_path / "resultados.csv") == len(RESULTS)
+        pd.testing.assert_frame_equal(copy.read_frame(ok_only=False), original)
+        assert copy.count(errors=True) == 1
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+# src/python/train_models.py
+"""
+Treino dos cinco modelos da API (modelos_final/) numa única execução:
+- Tabela de features montada uma vez, de forma incremental (feature_store.refresh), com o
+  ProductID de cada estimativa; cada categoria é só um filtro sobre ela
+- Features exatamente as que a API gera (NUMERIC_REQUEST_FEATURES do main.py), pela mesma
+  implementação (featurizer.py)
+- Um processo por modelo (os maiores primeiro); os cores são divididos entre eles pelo
+  n_jobs do XGBoost, sem disputa de threads
+- Artefatos no formato que o main.py carrega: joblib {'pipeline', 'feature_columns'} + o
+  .trees.npz do compiled_trees.py, trocados de forma atômica (o watcher da API nunca vê um
+  arquivo pela metade nem um .trees.npz de outra versão)
+- Teste fixo por hash do RideID (ride_stream.is_holdout): o check_metrics.py reavalia os artefatos
+  exatamente nas corridas que o treino não viu, sem guardar o split
+- Modelos com semente fixa: a mesma entrada gera os mesmos artefatos
+
+Uso: python train_models.py
+     TRAIN_WORKERS=2 MODEL_DIR=modelos_novos python train_models.py
+"""
+
+import os
+import time
+import shutil
+import logging
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from compiled_trees import compiled_path_for, export_artifact
+from feature_store import FeatureStore, read_csv_rows, refresh
+from ride_stream import is_holdout
+from route_results import RouteResultsStore
+
+# — Configurações (mesmas fontes do save_model.py) —
+MERGE_KEY     = "RideID"
+PRODUCT_COL   = "ProductID"            # Categoria de cada linha do estimative_v3.csv
+PRICE_COL     = "Price"
+DISTANCE_COL  = "distancia_m"
+DURATION_COL  = "tempo_estim_segundos"
+DATETIME_COL  = "Create"
+ROUTE_RESULTS = "./data/route_results.sqlite"
+RIDES_CSV     = "./data/ride_v2.csv"
+ESTIM_CSV     = "./data/rideestimative_v3.csv"
+DIST_CSV      = "./data/distancia_tempo_corridas.csv"
+# Store próprio: as colunas (com ProductID) diferem das do save_model.py
+FEATURE_STORE = "./data/feature_store_categorias.sqlite"
+REBUILD_FEATURES = os.getenv("REBUILD_FEATURES", "0") == "1"
+MODEL_DIR     = os.getenv("MODEL_DIR", "modelos_final")
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", "0"))  # 0 = um processo por modelo, até o nº de cores
+RANDOM_STATE  = 42
+MIN_ROWS      = 50   # categorias com menos linhas não são treinadas (o artefato atual fica)
+# Tipos das colunas lidas dos CSVs (cache colunar do raw_cache.py, compartilhado com o save_model.py)
+COLUMN_TYPES  = {MERGE_KEY: "id", DATETIME_COL: "datetime", PRODUCT_COL: "category", PRICE_COL: "float",
+                 DISTANCE_COL: "float", DURATION_COL: "float"}
+
+# Mesmos nomes/arquivos do MODEL_FILES do main.py
+MODEL_FILES = {
+    "uberX": "UberX.pkl",
+    "uberComfort": "UberComfort.pkl",
+    "uberBlack": "UberBlack.pkl",
+    "99Pop": "99Pop.pkl",
+    "99Plus": "99plus.pkl",
+}
+# ProductID do estimative_v3.csv que alimenta cada modelo (ver product_id.txt)
+CATEGORY_PRODUCTS = {
+    "uberX": ["UberX"],
+    "uberComfort": ["Comfort"],
+    "uberBlack": ["Black"],
+    "99Pop": ["pop99"],
+    "99Plus": ["comfort99"],
+}
+
+# Colunas do pipeline, na ordem de NUMERIC_REQUEST_FEATURES do main.py
+FEATURE_COLUMNS = [
+    'distance_m', 'duration_s', 'year', 'month', 'is_holiday',
+    'hour_sin', 'hour_cos', 'weekday_sin', 'weekday_cos', 'is_peak_hour'
+]
+XGB_PARAMS = dict(
+    objective="reg:squarederror", n_estimators=100, learning_rate=0.1,
+    max_depth=5, subsample=0.8, colsample_bytree=0.8, random_state=RANDOM_STATE
+)
+
+
+def read_distances(ride_ids):
+    # Distancia/tempo so das corridas pedidas: do store do rotas.py ou do CSV antigo
+    if os.path.exists(ROUTE_RESULTS):
+        with RouteResultsStore(ROUTE_RESULTS) as results:
+            return results.read_frame(ok_only=True, ride_ids=ride_ids).rename(columns={
+                "ride_id": MERGE_KEY, "distance_m": DISTANCE_COL, "duration_s": DURATION_COL})
+    return read_csv_rows(DIST_CSV, [MERGE_KEY, DISTANCE_COL, DURATION_COL], MERGE_KEY,
+                         keep=lambda ids: ids.isin(ride_ids), sep=',', column_types=COLUMN_TYPES)
+
+
+def open_feature_store():
+    # Sempre com as mesmas colunas: outra lista mudaria a assinatura e reconstruiria o store
+    return FeatureStore(FEATURE_STORE, key=MERGE_KEY, value_columns=[PRODUCT_COL, PRICE_COL, DISTANCE_COL, DURATION_COL])
+
+
+def build_feature_table():
+    """Atualiza o feature store e devolve a tabela de treino (model_table) de todas as corridas."""
+    with open_feature_store() as store:
+        stats = refresh(store, RIDES_CSV, DATETIME_COL, ESTIM_CSV, [PRODUCT_COL, PRICE_COL], read_distances,
+                        rebuild=REBUILD_FEATURES, column_types=COLUMN_TYPES)
+        logging.info("Feature store: %d corridas novas, %d linhas adicionadas, %d pendentes, %d data/hora inválida",
+                     stats["new_rides"], stats["added"], stats["pending"], stats["invalid_datetime"])
+        frame = store.read_frame()
+
+    # Mesmo tratamento do save_model.py: sem distância sai, duração ausente vira a média
+    frame[PRICE_COL] = pd.to_numeric(frame[PRICE_COL], errors="coerce")
+    frame = frame.dropna(subset=[DISTANCE_COL, PRICE_COL])
+    frame[DURATION_COL] = frame[DURATION_COL].fillna(frame[DURATION_COL].mean())
+
+    return model_table(frame)
+
+
+def model_table(frame):
+    """Linhas do feature store → RideID, colunas da API (FEATURE_COLUMNS), ProductID e preço."""
+    # Features de data/hora já vêm do featurizer.py (as mesmas que a API calcula por requisição)
+    table = frame[FEATURE_COLUMNS[2:]].copy()
+    table.insert(0, MERGE_KEY, frame[MERGE_KEY].astype(np.int64))
+    table.insert(1, "distance_m", frame[DISTANCE_COL].astype(np.float64))
+    table.insert(2, "duration_s", frame[DURATION_COL].astype(np.float64))
+    table[PRODUCT_COL] = frame[PRODUCT_COL].astype(str).str.strip()
+    table[PRICE_COL] = pd.to_numeric(frame[PRICE_COL], errors="coerce").astype(np.float64)
+    return table.reset_index(drop=True)
+
+
+def split_threads(job_sizes, workers, cores):
+    """n_jobs do XGBoost por modelo: cores // workers, e a sobra vai para os maiores modelos."""
+    base, extra = divmod(max(cores, workers), workers)
+    ranked = sorted(job_sizes, key=job_sizes.get, reverse=True)
+    return {name: base + (1 if rank < extra else 0) for rank, name in enumerate(ranked)}
+
+
+def train_category(model_name, data, n_jobs, model_dir, staging_dir):
+    """Treina, avalia e grava o artefato de uma categoria (roda num processo do pool)."""
+    started = time.perf_counter()
+    test = is_holdout(data[MERGE_KEY].to_numpy())
+    X, y = data[FEATURE_COLUMNS], data[PRICE_COL]
+    X_train, X_test, y_train, y_test = X[~test], X[test], y[~test], y[test]
+    pipeline = Pipeline([
+        ("scaler", StandardScaler()),
+        ("model", xgb.XGBRegressor(**XGB_PARAMS, n_jobs=n_jobs)),
+    ])
+    pipeline.fit(X_train, y_train)
+    predictions = pipeline.predict(X_test)
+    metrics = {
+        "rows": len(X),
+        "rmse": float(np.sqrt(mean_squared_error(y_test, predictions))),
+        "mae": float(mean_absolute_error(y_test, predictions)),
+        "r2": float(r2_score(y_test, predictions)),
+    }
+
+    # Grava em staging_dir (mesmo sistema de arquivos) e troca com os.replace: .trees.npz primeiro,
+    # .pkl por último, porque é a mudança do .pkl que dispara a recarga da API
+    filename = MODEL_FILES[model_name]
+    staged_pkl = os.path.join(staging_dir, filename)
+    joblib.dump({"pipeline": pipeline, "feature_columns": list(X.columns)}, staged_pkl)
+    final_pkl = os.path.join(model_dir, filename)
+    try:
+        staged_npz, metrics["compiled_max_diff"] = export_artifact(staged_pkl)
+        os.replace(staged_npz, compiled_path_for(final_pkl))
+    except Exception as e:
+        # Sem .trees.npz novo, o antigo não pode ficar: a API o preferiria ao .pkl novo
+        metrics["compiled_error"] = f"{type(e).__name__}: {e}"
+        if os.path.exists(compiled_path_for(final_pkl)):
+            os.remove(compiled_path_for(final_pkl))
+    os.replace(staged_pkl, final_pkl)
+    metrics["seconds"] = time.perf_counter() - started
+    return model_name, metrics
+
+
+def smoke_check(model_dir, table):
+    """Recarrega cada artefato como a API (joblib) e confere previsões finitas numa amostra."""
+    sample = table[FEATURE_COLUMNS].head(100)
+    for model_name, filename in MODEL_FILES.items():
+        path = os.path.join(model_dir, filename)
+        if not os.path.exists(path):
+            logging.warning("%s: %s não existe", model_name, path)
+            continue
+        data = joblib.load(path)
+        predictions = np.asarray(data["pipeline"].predict(sample[data["feature_columns"]]), dtype=float)
+        if not np.isfinite(predictions).all():
+            raise ValueError(f"Previsões inválidas para '{model_name}' ({path})")
+
+
+def train_all(table, model_dir=MODEL_DIR, workers=TRAIN_WORKERS):
+    """Treina em paralelo todos os modelos de MODEL_FILES a partir da mesma tabela de features."""
+    jobs = {}
+    for model_name in MODEL_FILES:
+        rows = table[PRODUCT_COL].isin(CATEGORY_PRODUCTS[model_name])
+        if rows.sum() < MIN_ROWS:
+            logging.warning("%s: só %d linhas com ProductID em %s; artefato atual mantido",
+                            model_name, rows.sum(), CATEGORY_PRODUCTS[model_name])
+            continue
+        jobs[model_name] = table.loc[rows, [MERGE_KEY] + FEATURE_COLUMNS + [PRICE_COL]].reset_index(drop=True)
+    if not jobs:
+        raise RuntimeError("Nenhuma categoria com dados suficientes para treinar.")
+
+    cores = os.cpu_count() or 1
+    workers = min(workers or cores, len(jobs))
+    threads = split_threads({name: len(data) for name, data in jobs.items()}, workers, cores)
+    logging.info("Treinando %d modelos em %d processos (%d cores; n_jobs por modelo: %s)",
+                 len(jobs), workers, cores, threads)
+
+    os.makedirs(model_dir, exist_ok=True)
+    staging_dir = os.path.join(model_dir, ".staging")
+    os.makedirs(staging_dir, exist_ok=True)
+    results, failures = {}, {}
+    try:
+        # spawn: cada processo começa limpo (sem threads OpenMP herdadas do pai)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            futures = {
+                pool.submit(train_category, name, data, threads[name], model_dir, staging_dir): name
+                # os maiores primeiro: o último a terminar não é um modelo grande que começou tarde
+                for name, data in sorted(jobs.items(), key=lambda item: len(item[1]), reverse=True)
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    _, metrics = future.result()
+                except Exception as e:
+                    logging.exception("%s: treino falhou", name)
+                    failures[name] = repr(e)
+                    continue
+                results[name] = metrics
+                logging.info("%s → %s: %d linhas, RMSE %.4f, MAE %.4f, R² %.4f (%.1fs)%s", name,
+                             MODEL_FILES[name], metrics["rows"], metrics["rmse"], metrics["mae"], metrics["r2"],
+                             metrics["seconds"], f" | sem .trees.npz: {metrics['compiled_error']}"
+                             if "compiled_error" in metrics else "")
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return results, failures
+
+
+def main():
+    logging.basicConfig(format='[%(asctime)s] %(levelname)s: %(message)s', level=logging.INFO, datefmt='%H:%M:%S')
+    started = time.perf_counter()
+    table = build_feature_table()
+    logging.info("Tabela de features: %d linhas (%.1fs); por ProductID: %s", len(table),
+                 time.perf_counter() - started, table[PRODUCT_COL].value_counts().head(10).to_dict())
+    results, failures = train_all(table)
+    smoke_check(MODEL_DIR, table)
+    logging.info("%d modelos gravados em %s em %.1fs%s", len(results), MODEL_DIR, time.perf_counter() - started,
+                 f"; falharam: {sorted(failures)}" if failures else "")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -51,6 +51,53 @@ async function isHoliday(date) {
 }
 // --------------------------------------------
 
+// --- Cache de Rotas (compartilhado com o rotas.py via servico Python) ---
+// O servico de ML guarda as rotas em SQLite, com as coordenadas arredondadas para uma grade.
+// Consultamos antes de chamar o ORS e gravamos a rota obtida. Falhas no cache nunca
+// impedem a simulacao: nesse caso seguimos direto para o ORS.
+const ROUTE_CACHE_TIMEOUT_MS = 1000;
+
+async function getCachedRoute(origin, destination) {
+  const mlServiceUrl = process.env.ML_SERVICE_URL;
+  if (!mlServiceUrl) return null;
+  try {
+    const resp = await axios.get(`${mlServiceUrl}/routes/cache`, {
+      params: {
+        origin_lng: Number(origin.lon), origin_lat: Number(origin.lat),
+        dest_lng: Number(destination.lon), dest_lat: Number(destination.lat),
+        require_geometry: true // o frontend desenha a rota, entao so serve entrada com geometria
+      },
+      timeout: ROUTE_CACHE_TIMEOUT_MS
+    });
+    return resp.data;
+  } catch (error) {
+    if (error.response?.status !== 404) {
+      console.warn(`WARN: Cache de rotas indisponivel: ${error.message}`);
+    }
+    return null;
+  }
+}
+
+function storeCachedRoute(origin, destination, distance_m, duration_s, geometry) {
+  const mlServiceUrl = process.env.ML_SERVICE_URL;
+  // O servico Python so aceita a gravacao com o token interno (ROUTE_CACHE_WRITE_TOKEN);
+  // sem ele a gravacao esta desativada la, entao nem tentamos
+  const writeToken = process.env.ROUTE_CACHE_WRITE_TOKEN;
+  if (!mlServiceUrl || !writeToken) return;
+  // Nao aguardamos: gravar no cache nao deve atrasar a resposta ao usuario.
+  axios.put(`${mlServiceUrl}/routes/cache`, {
+    origin_lng: Number(origin.lon), origin_lat: Number(origin.lat),
+    dest_lng: Number(destination.lon), dest_lat: Number(destination.lat),
+    distance_m, duration_s, geometry
+  }, {
+    timeout: ROUTE_CACHE_TIMEOUT_MS,
+    headers: { 'X-Internal-Token': writeToken }
+  }).catch(error => {
+    console.warn(`WARN: Falha ao gravar rota no cache: ${error.message}`);
+  });
+}
+// --------------------------------------------
+
 // --- Endpoint de Registro ---
 router.post(
   '/register',
@@ -182,61 +229,70 @@ router.post('/simulate', async (req, res) => {
     let duration_s = null;
     let route_geometry = null; // Para armazenar as coordenadas da rota
 
-    try {
-      console.log("INFO: Chamando API ORS (com solicitação de geometria)...");
-      const orsApiKey = process.env.ORS_API_KEY;
-      if (!orsApiKey) throw new Error("Chave da API ORS não configurada.");
-
-      const orsPayload = {
-        coordinates: [[Number(origin.lon), Number(origin.lat)], [Number(destination.lon), Number(destination.lat)]],
-        // Adicionar para obter a geometria em formato GeoJSON, que é mais fácil de usar
-        // Se não funcionar, ORS retorna 'geometry' como uma string polyline codificada
-        // e precisaremos decodificá-la (geralmente no frontend).
-        // A API v2 do ORS geralmente retorna a geometria por padrão.
-        // Vamos verificar a estrutura da resposta.
-        // format: "geojson" // Descomente se precisar especificar formato de resposta global
-        // A geometria da rota geralmente está em routes[0].geometry (string polyline)
-        // ou em routes[0].feature.geometry.coordinates (se a resposta for GeoJSON)
-      };
-
-      const orsResp = await axios.post(
-        "https://api.openrouteservice.org/v2/directions/driving-car",
-        orsPayload,
-        { headers: { Authorization: orsApiKey }, timeout: 15000 }
-      );
-
-      if (orsResp.data?.routes?.[0]) {
-        const route = orsResp.data.routes[0];
-        if (route.summary) {
-          distance_m = route.summary.distance;
-          duration_s = route.summary.duration;
-        } else {
-          throw new Error("Sumário da rota não encontrado na resposta ORS.");
-        }
+    const cachedRoute = await getCachedRoute(origin, destination);
+    if (cachedRoute) {
+      distance_m = cachedRoute.distance_m;
+      duration_s = cachedRoute.duration_s;
+      route_geometry = cachedRoute.geometry;
+      console.log("INFO: Rota obtida do cache:", { distance_m, duration_s });
+    } else {
+      try {
+        console.log("INFO: Chamando API ORS (com solicitação de geometria)...");
+        const orsApiKey = process.env.ORS_API_KEY;
+        if (!orsApiKey) throw new Error("Chave da API ORS não configurada.");
+
+        const orsPayload = {
+          coordinates: [[Number(origin.lon), Number(origin.lat)], [Number(destination.lon), Number(destination.lat)]],
+          // Adicionar para obter a geometria em formato GeoJSON, que é mais fácil de usar
+          // Se não funcionar, ORS retorna 'geometry' como uma string polyline codificada
+          // e precisaremos decodificá-la (geralmente no frontend).
+          // A API v2 do ORS geralmente retorna a geometria por padrão.
+          // Vamos verificar a estrutura da resposta.
+          // format: "geojson" // Descomente se precisar especificar formato de resposta global
+          // A geometria da rota geralmente está em routes[0].geometry (string polyline)
+          // ou em routes[0].feature.geometry.coordinates (se a resposta for GeoJSON)
+        };
+
+        const orsResp = await axios.post(
+          "https://api.openrouteservice.org/v2/directions/driving-car",
+          orsPayload,
+          { headers: { Authorization: orsApiKey }, timeout: 15000 }
+        );
 
-        // A geometria da rota é uma string Polyline codificada
-        // Ex: "o~ciFz{fg@fHz@..."
-        // Precisaremos de uma biblioteca no frontend para decodificá-la para [lat, lon]
-        if (route.geometry) {
-          route_geometry = route.geometry; // Esta é a string Polyline
-          console.log("INFO: Geometria da rota (polyline) obtida da ORS.");
-        } else {
-          console.warn("AVISO: Geometria da rota não encontrada na resposta ORS.");
-        }
+        if (orsResp.data?.routes?.[0]) {
+          const route = orsResp.data.routes[0];
+          if (route.summary) {
+            distance_m = route.summary.distance;
+            duration_s = route.summary.duration;
+          } else {
+            throw new Error("Sumário da rota não encontrado na resposta ORS.");
+          }
+
+          // A geometria da rota é uma string Polyline codificada
+          // Ex: "o~ciFz{fg@fHz@..."
+          // Precisaremos de uma biblioteca no frontend para decodificá-la para [lat, lon]
+          if (route.geometry) {
+            route_geometry = route.geometry; // Esta é a string Polyline
+            console.log("INFO: Geometria da rota (polyline) obtida da ORS.");
+          } else {
+            console.warn("AVISO: Geometria da rota não encontrada na resposta ORS.");
+          }
         
-        if (typeof distance_m !== 'number' || typeof duration_s !== 'number') {
-          throw new Error("Valores inválidos (distância/duração) da API ORS.");
+          if (typeof distance_m !== 'number' || typeof duration_s !== 'number') {
+            throw new Error("Valores inválidos (distância/duração) da API ORS.");
+          }
+          console.log("INFO: Resposta ORS OK:", { distance_m, duration_s, geometry_present: !!route_geometry });
+          storeCachedRoute(origin, destination, distance_m, duration_s, route_geometry);
+        } else {
+          throw new Error("Resposta inesperada ou sem rota da API ORS.");
         }
-        console.log("INFO: Resposta ORS OK:", { distance_m, duration_s, geometry_present: !!route_geometry });
-      } else {
-        throw new Error("Resposta inesperada ou sem rota da API ORS.");
+      } catch (orsError) {
+        // ... (seu tratamento de erro ORS como antes) ...
+        console.error("!!! ERRO API ORS !!!");
+        const orsErrorMessage = orsError.response?.data?.error?.message || orsError.response?.data?.message || orsError.message;
+        console.error(" Detalhe ORS:", orsError.response ? JSON.stringify(orsError.response.data) : orsErrorMessage);
+        return res.status(500).json({ message: `Erro ao obter dados de rota (ORS): ${orsErrorMessage}` });
       }
-    } catch (orsError) {
-      // ... (seu tratamento de erro ORS como antes) ...
-      console.error("!!! ERRO API ORS !!!");
-      const orsErrorMessage = orsError.response?.data?.error?.message || orsError.response?.data?.message || orsError.message;
-      console.error(" Detalhe ORS:", orsError.response ? JSON.stringify(orsError.response.data) : orsErrorMessage);
-      return res.status(500).json({ message: `Erro ao obter dados de rota (ORS): ${orsErrorMessage}` });
     }
 
     // ... (cálculo do mlPayload e chamada ao Python como antes) ...